@@ -0,0 +1,14 @@
+"""
+Gauged
+https://github.com/chriso/gauged (MIT Licensed)
+Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
+"""
+
+from .gauged import Gauged
+from .context import Context
+from .writer import Writer
+from .sharded_writer import ShardedWriter
+from .bridge import Gauged as GaugedInternal
+from .config import Config
+from .version import __version__, __version_info__
+from .lru import LRU
@@ -0,0 +1,176 @@
+"""
+Gauged
+https://github.com/chriso/gauged (MIT Licensed)
+Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
+"""
+
+from os import fsync, makedirs
+from os.path import getsize, isdir, join
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+
+# (namespace, offset, key, position, length, flags)
+RECORD = Struct('<IIQQII')
+
+# The key of a record which removes the blocks of a namespace up to and
+# including its offset
+EXPIRED = 2 ** 64 - 1
+
+# The key of a record which removes the blocks archived before it. The
+# record's position holds a key ID or ALL_KEYS and its length is BEFORE
+# (up to and including the offset) or AFTER (the offset onwards)
+CLEARED = 2 ** 64 - 2
+ALL_KEYS = 2 ** 64 - 1
+ALL_NAMESPACES = 2 ** 32 - 1
+BEFORE, AFTER = 0, 1
+
+
+class Archive(object):
+    """Append-only files holding blocks which have been moved out of the
+    driver. Blocks are appended to a data file which is read through mmap,
+    and a fixed-size record per block is appended to an index file which
+    is held in memory as a (namespace, offset, key) => (position, length,
+    flags) dict. Only one process should append to an archive at a time,
+    but any number can read from it. Readers pick up records appended by
+    other processes when refresh() is called"""
+
+    def __init__(self, path):
+        if not isdir(path):
+            makedirs(path)
+        self.data_path = join(path, 'blocks.dat')
+        self.index_path = join(path, 'blocks.idx')
+        for filename in (self.data_path, self.index_path):
+            open(filename, 'ab').close()
+        self.index = {}
+        self.expired = {}
+        self.next_offsets = {}
+        self.index_bytes = 0
+        self.index_size = 0
+        self.data = None
+        self.load()
+
+    def load(self):
+        """Read the index records appended since the index was last
+        loaded. A partially written record is left until it's complete"""
+        with open(self.index_path, 'rb') as index:
+            index.seek(self.index_bytes)
+            records = index.read()
+        self.index_size = self.index_bytes + len(records)
+        count = len(records) // RECORD.size
+        self.index_bytes += count * RECORD.size
+        expired = False
+        next_offsets = self.next_offsets
+        for i in xrange(count):
+            namespace, offset, key, position, length, flags = \
+                RECORD.unpack_from(records, i * RECORD.size)
+            if key == CLEARED:
+                self.remove(namespace, offset, position, length == AFTER)
+                continue
+            if key == EXPIRED:
+                self.expired[namespace] = offset
+                expired = True
+            else:
+                self.index[(namespace, offset, key)] = (position, length,
+                                                        flags)
+            if offset >= next_offsets.get(namespace, 0):
+                next_offsets[namespace] = offset + 1
+        if expired:
+            limits = self.expired
+            for block in self.index.keys():
+                if block[1] <= limits.get(block[0], -1):
+                    del self.index[block]
+
+    def remove(self, namespace, offset, key, after):
+        """Remove blocks from the index which match a clear record. Offsets
+        from a cleared offset onwards may be archived again"""
+        index = self.index
+        for block in index.keys():
+            block_namespace, block_offset, block_key = block
+            if namespace != ALL_NAMESPACES and block_namespace != namespace:
+                continue
+            if key != ALL_KEYS and block_key != key:
+                continue
+            if block_offset >= offset if after else block_offset <= offset:
+                del index[block]
+        if after:
+            next_offsets = self.next_offsets
+            for block_namespace, next_offset in next_offsets.items():
+                if namespace in (ALL_NAMESPACES, block_namespace) and \
+                        next_offset > offset:
+                    next_offsets[block_namespace] = offset
+
+    def refresh(self):
+        """Load the records appended by other processes, if any"""
+        if getsize(self.index_path) != self.index_size:
+            self.load()
+
+    def get(self, namespace, offset, key):
+        """Get a (buffer, flags) tuple for the block, or None if the block
+        isn't archived. The buffer references the mapped data file rather
+        than a copy"""
+        entry = self.index.get((namespace, offset, key))
+        if entry is None:
+            return None
+        position, length, flags = entry
+        if self.data is None or len(self.data) < position + length:
+            # Buffers returned earlier keep the previous mapping alive
+            with open(self.data_path, 'rb') as data:
+                self.data = mmap(data.fileno(), 0, access=ACCESS_READ)
+        return buffer(self.data, position, length), flags
+
+    def next_offset(self, namespace):
+        """Get the offset after the last archived block of a namespace, or
+        the first offset which has been cleared since"""
+        return self.next_offsets.get(namespace, 0)
+
+    def append(self, namespace, offset, blocks):
+        """Archive a list of (key, data, flags) blocks at the namespace and
+        offset. The data is synced to disk before the index records which
+        point to it. Blocks which are already archived, e.g. by a previous
+        run that was interrupted, are skipped"""
+        self.load()
+        records = []
+        with open(self.data_path, 'ab') as data:
+            data.seek(0, 2)
+            position = data.tell()
+            for key, buf, flags in blocks:
+                if (namespace, offset, key) in self.index:
+                    continue
+                length = len(buf)
+                data.write(buf)
+                records.append(RECORD.pack(namespace, offset, key, position,
+                                           length, flags))
+                position += length
+            data.flush()
+            fsync(data.fileno())
+        self.write_index(records)
+
+    def expire(self, namespace, offset):
+        """Remove the archived blocks of a namespace up to and including
+        the offset. The data stays in the data file"""
+        self.load()
+        self.write_index([RECORD.pack(namespace, offset, EXPIRED, 0, 0, 0)])
+
+    def clear(self, namespace, offset, key=None, after=False):
+        """Remove the archived blocks of a key (or every key) in a namespace
+        (or every namespace) up to and including the offset, or from the
+        offset onwards if `after` is set. The data stays in the data file"""
+        if namespace is None:
+            namespace = ALL_NAMESPACES
+        if key is None:
+            key = ALL_KEYS
+        self.load()
+        self.write_index([RECORD.pack(namespace, offset, CLEARED, key,
+                                      AFTER if after else BEFORE, 0)])
+
+    def write_index(self, records):
+        if not records:
+            return
+        with open(self.index_path, 'r+b') as index:
+            # Drop a partial record left by an interrupted append
+            index.seek(self.index_bytes)
+            index.truncate()
+            index.write(''.join(records))
+            index.flush()
+            fsync(index.fileno())
+        self.load()
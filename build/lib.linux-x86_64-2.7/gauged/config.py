@@ -0,0 +1,125 @@
+"""
+Gauged
+https://github.com/chriso/gauged (MIT Licensed)
+Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
+"""
+
+from .writer import Writer
+from .utilities import to_bytes, Time
+
+DEFAULTS = {
+    'namespace': 0,
+    'block_size': Time.DAY,
+    'resolution': Time.SECOND,
+    'writer_name': 'default',
+    'overwrite_blocks': False,
+    'compression': None,
+    'block_summaries': False,
+    'rollups': [],
+    'segmented_blocks': False,
+    'retention': None,
+    'archive_path': None,
+    'archive_after': None,
+    'key_overflow': Writer.ERROR,
+    'key_whitelist': None,
+    'key_prefix_whitelist': None,
+    'key_prefix_blacklist': None,
+    'flush_seconds': 0,
+    'flush_async': False,
+    'max_pending_bytes': 0,
+    'max_pending_keys': 0,
+    'expected_keys': 0,
+    'append_only_violation': Writer.ERROR,
+    'reorder_window': 0,
+    'reorder_buffer_size': 64 * 1024,
+    'gauge_nan': Writer.ERROR,
+    'key_cache_size': 64 * 1024,
+    'max_interval_steps': 31 * 24,
+    'min_cache_interval': Time.HOUR,
+    'max_look_behind': Time.WEEK,
+    'defaults': {
+        'namespace': None,
+        'limit': 10,
+        'offset': None,
+        'prefix': None,
+        'start': None,
+        'end': None,
+        'interval': Time.DAY,
+        'cache': True,
+        'key': None,
+        'aggregate': None,
+        'percentile': 50
+    }
+}
+
+
+class Config(object):
+
+    def __init__(self, **kwargs):
+        self.block_arrays = None
+        self.defaults = None
+        self.key_whitelist = None
+        self.key_prefix_whitelist = None
+        self.key_prefix_blacklist = None
+        self.block_size = None
+        self.resolution = None
+        self.rollups = None
+        self.retention = None
+        self.update(**kwargs)
+
+    def update(self, **kwargs):
+        for key in kwargs.iterkeys():
+            if key not in DEFAULTS:
+                raise ValueError('Unknown configuration key: ' + key)
+        for key, default in DEFAULTS.iteritems():
+            if key == 'defaults':
+                defaults = DEFAULTS['defaults'].copy()
+                if 'defaults' in kwargs:
+                    for key, value in kwargs['defaults'].iteritems():
+                        if key not in defaults:
+                            raise ValueError('Unknown default key: ' + key)
+                        defaults[key] = value
+                self.defaults = defaults
+            else:
+                setattr(self, key, kwargs.get(key, default))
+        if self.block_size % self.resolution != 0:
+            raise ValueError('`block_size` must be a multiple of `resolution`')
+        self.block_arrays = self.block_size // self.resolution
+        if self.compression not in (None, Writer.XOR):
+            raise ValueError('Unknown compression: %r' % self.compression)
+        for tier in self.rollups or ():
+            if not self.valid_rollup(tier):
+                raise ValueError('Rollups must be a multiple of `resolution` '
+                                 'and a factor of `block_size`: %r' % tier)
+        self.rollups = sorted(set(self.rollups or ()))
+        # Block summaries are the coarsest tier of the rollups
+        self.block_summaries = bool(self.block_summaries or self.rollups)
+        if not isinstance(self.retention, dict):
+            self.retention = {None: self.retention}
+        for period in self.retention.itervalues():
+            if period is not None and period <= 0:
+                raise ValueError('Retention periods must be positive: %r'
+                                 % period)
+        if self.archive_after is not None and self.archive_after <= 0:
+            raise ValueError('`archive_after` must be positive')
+        if self.key_whitelist is not None:
+            self.key_whitelist = {to_bytes(key) for key in self.key_whitelist}
+        if self.key_prefix_whitelist is not None:
+            self.key_prefix_whitelist = [to_bytes(prefix) for prefix
+                                         in self.key_prefix_whitelist]
+        if self.key_prefix_blacklist is not None:
+            self.key_prefix_blacklist = [to_bytes(prefix) for prefix
+                                         in self.key_prefix_blacklist]
+
+    def retention_period(self, namespace):
+        """Get the retention period of a namespace, or None if its data
+        is kept forever"""
+        retention = self.retention
+        if namespace in retention:
+            return retention[namespace]
+        return retention.get(None)
+
+    def valid_rollup(self, tier):
+        """Check whether the rollup tier fits evenly into blocks"""
+        return self.resolution < tier < self.block_size and \
+            tier % self.resolution == 0 and self.block_size % tier == 0
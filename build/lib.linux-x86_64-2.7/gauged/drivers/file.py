@@ -0,0 +1,890 @@
+"""
+Gauged
+https://github.com/chriso/gauged (MIT Licensed)
+Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
+"""
+
+import marshal
+from bisect import insort
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from itertools import groupby, islice
+from operator import itemgetter
+from fcntl import flock, LOCK_EX, LOCK_NB, LOCK_SH, LOCK_UN
+from mmap import mmap, ACCESS_READ
+from os import fsync, listdir, makedirs, remove, rename, stat
+from os.path import exists, getsize, isdir, join
+from struct import Struct
+from threading import RLock
+from zlib import crc32
+from ..utilities import merge_summaries, merge_rollups
+from .interface import DriverInterface
+
+# A journal starts with the checkpoint generation it follows, and each
+# committed transaction is a (length, crc32) header and a marshalled list
+# of the driver calls it made
+GENERATION = Struct('<I')
+TRANSACTION = Struct('<II')
+
+
+class FileDriver(DriverInterface):
+    """Store gauges in a directory without a database server. Block data
+    is appended to segment files and read back through mmap. Everything
+    else, including keys, is held in memory and written to a journal on
+    commit, which is periodically replaced by a checkpoint of the whole
+    state. Metadata is kept in its own file. Only one process can open the
+    directory for writing at a time, while any number of processes can
+    open it with `readonly` set. Readers replay new transactions from the
+    journal before each read, holding a shared lock which the writer takes
+    exclusively while it commits"""
+
+    MAX_KEY = 1024
+
+    SEGMENT_SIZE = 64 * 1024 * 1024
+
+    MIN_CHECKPOINT_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, path, fsync=True, readonly=False):
+        self.path = path
+        self.fsync = fsync
+        self.readonly = readonly
+        self.lock = RLock()
+        self.lock_file = None
+        self.commit_lock_file = None
+        self.journal_file = None
+        self.data_file = None
+        self.maps = {}
+        self.metadata = {}
+        self.metadata_state = None
+        self.reset()
+        if isdir(path):
+            self.open()
+
+    def reset(self):
+        """Reset the in-memory state"""
+        self.blocks = {}
+        self.block_keys = defaultdict(set)
+        self.summaries = defaultdict(dict)
+        self.rollups = {}
+        self.statistics = defaultdict(dict)
+        self.cache = defaultdict(dict)
+        self.positions = {}
+        self.key_ids = {}
+        self.key_names = {}
+        self.next_key_id = 1
+        self.generation = 0
+        self.segment = 0
+        self.checkpoint_bytes = 0
+        self.journal = []
+        self.journal_position = 0
+        self.journal_state = None
+        self.unsynced = set()
+        self.replaying = False
+
+    def file_path(self, name):
+        return join(self.path, name)
+
+    def segment_path(self, segment):
+        return self.file_path('data.%d' % segment)
+
+    def segments(self):
+        return sorted(int(name[5:]) for name in listdir(self.path)
+                      if name.startswith('data.'))
+
+    def open(self):
+        """Lock the directory and load the checkpoint, journal and
+        metadata. A writer discards anything which wasn't committed"""
+        if self.lock_file is None and not self.readonly:
+            self.lock_file = open(self.file_path('lock'), 'a')
+            try:
+                flock(self.lock_file.fileno(), LOCK_EX | LOCK_NB)
+            except IOError:
+                self.lock_file.close()
+                self.lock_file = None
+                raise IOError('%s is in use by another process' % self.path)
+        if self.commit_lock_file is None:
+            self.commit_lock_file = open(self.file_path('commit.lock'), 'a')
+        with self.locked():
+            self.load()
+
+    @contextmanager
+    def locked(self):
+        """Hold the commit lock, which is shared by readers"""
+        fileno = self.commit_lock_file.fileno()
+        flock(fileno, LOCK_SH if self.readonly else LOCK_EX)
+        try:
+            yield
+        finally:
+            flock(fileno, LOCK_UN)
+
+    def load(self):
+        self.reset()
+        checkpoint = self.file_path('checkpoint')
+        if exists(checkpoint):
+            self.checkpoint_bytes = getsize(checkpoint)
+            with open(checkpoint, 'rb') as handle:
+                state = marshal.load(handle)
+            self.generation, self.blocks, summaries, self.rollups, \
+                statistics, cache, self.positions, key_names, \
+                self.next_key_id = state
+            self.summaries.update(summaries)
+            self.statistics.update(statistics)
+            self.cache.update(cache)
+            self.key_names.update(key_names)
+        for namespace, offset, key in self.blocks:
+            self.block_keys[(namespace, offset)].add(key)
+        for id_, name in self.key_names.iteritems():
+            self.key_ids[name] = id_
+        self.load_journal()
+        self.load_metadata()
+        if self.readonly:
+            return
+        segments = self.segments()
+        self.segment = segments[-1] if segments else 0
+        self.data_file = open(self.segment_path(self.segment), 'ab')
+        self.data_file.seek(0, 2)
+
+    def load_journal(self):
+        """Replay the transactions committed since the last checkpoint. A
+        writer truncates a transaction which was only partially written"""
+        path = self.file_path('journal')
+        self.journal_state = self.file_state(path)
+        contents = ''
+        if exists(path):
+            with open(path, 'rb') as handle:
+                contents = handle.read()
+        if len(contents) < GENERATION.size or \
+                GENERATION.unpack_from(contents)[0] != self.generation:
+            # The journal predates the checkpoint, which already holds it
+            if not self.readonly:
+                self.journal_file = open(path, 'wb')
+                self.journal_file.write(GENERATION.pack(self.generation))
+                self.sync(self.journal_file)
+            return
+        position = self.replay(contents, GENERATION.size)
+        if not self.readonly:
+            self.journal_file = open(path, 'r+b')
+            self.journal_file.seek(position)
+            self.journal_file.truncate()
+
+    def replay(self, contents, position):
+        """Replay the complete transactions in the journal contents from
+        the position, and get the position after the last one"""
+        self.replaying = True
+        try:
+            while position + TRANSACTION.size <= len(contents):
+                length, checksum = TRANSACTION.unpack_from(contents, position)
+                start = position + TRANSACTION.size
+                payload = contents[start:start + length]
+                if len(payload) < length or \
+                        crc32(payload) & 0xFFFFFFFF != checksum:
+                    break
+                for method, args in marshal.loads(payload):
+                    getattr(self, method)(*args)
+                position = start + length
+        finally:
+            self.replaying = False
+        self.journal_position = position
+        return position
+
+    def refresh(self):
+        """Bring a reader up to date with the transactions the writer has
+        committed since it last looked"""
+        with self.lock:
+            if self.commit_lock_file is None:
+                if isdir(self.path):
+                    self.open()
+                return
+            path = self.file_path('journal')
+            if self.file_state(path) == self.journal_state:
+                return
+            with self.locked():
+                state = self.file_state(path)
+                previous = self.journal_state
+                contents = ''
+                if exists(path):
+                    with open(path, 'rb') as handle:
+                        contents = handle.read()
+                if previous is None or state is None or \
+                        state[0] != previous[0] or \
+                        self.journal_position < GENERATION.size or \
+                        len(contents) < self.journal_position or \
+                        GENERATION.unpack_from(contents)[0] != \
+                        self.generation:
+                    # A checkpoint was written or the files were replaced
+                    self.load()
+                    return
+                self.journal_state = state
+                self.replay(contents, self.journal_position)
+
+    @staticmethod
+    def file_state(path):
+        try:
+            info = stat(path)
+        except OSError:
+            return None
+        return info.st_ino, info.st_size, info.st_mtime
+
+    def load_metadata(self):
+        path = self.file_path('metadata')
+        state = self.file_state(path)
+        if state != self.metadata_state:
+            self.metadata_state = state
+            self.metadata = {}
+            if state is not None:
+                with open(path, 'rb') as handle:
+                    self.metadata = marshal.load(handle)
+
+    def sync(self, handle):
+        handle.flush()
+        if self.fsync:
+            fsync(handle.fileno())
+
+    def log(self, method, *args):
+        """Record a call to a method which changes the state, so that it can
+        be replayed from the journal"""
+        if not self.replaying:
+            self.check_writable()
+            self.journal.append((method, args))
+
+    def check_writable(self):
+        if self.readonly:
+            raise IOError('%s was opened read-only' % self.path)
+
+    def checkpoint(self):
+        """Write the whole state to a new checkpoint and start a new
+        journal. Segments without live blocks are removed"""
+        self.generation += 1
+        state = (self.generation, self.blocks, dict(self.summaries),
+                 self.rollups, dict(self.statistics), dict(self.cache),
+                 self.positions, self.key_names, self.next_key_id)
+        path = self.file_path('checkpoint')
+        with open(path + '.tmp', 'wb') as handle:
+            marshal.dump(state, handle, 2)
+            self.sync(handle)
+        rename(path + '.tmp', path)
+        self.checkpoint_bytes = getsize(path)
+        self.journal_file.seek(0)
+        self.journal_file.truncate()
+        self.journal_file.write(GENERATION.pack(self.generation))
+        self.sync(self.journal_file)
+        live = set(chunk[0] for _, chunks in self.blocks.itervalues()
+                   for chunk in chunks)
+        for segment in self.segments():
+            if segment != self.segment and segment not in live:
+                self.maps.pop(segment, None)
+                remove(self.segment_path(segment))
+
+    def commit(self):
+        """Commit the current transaction"""
+        with self.lock:
+            if self.data_file is None:
+                return
+            # Data is synced before the journal which refers to it
+            for handle in self.unsynced:
+                self.sync(handle)
+            self.unsynced.clear()
+            if not self.journal:
+                return
+            payload = marshal.dumps(self.journal, 2)
+            self.journal = []
+            journal_file = self.journal_file
+            with self.locked():
+                journal_file.write(TRANSACTION.pack(
+                    len(payload), crc32(payload) & 0xFFFFFFFF))
+                journal_file.write(payload)
+                self.sync(journal_file)
+                if journal_file.tell() > max(self.checkpoint_bytes * 2,
+                                             self.MIN_CHECKPOINT_BYTES):
+                    self.checkpoint()
+
+    def create_schema(self):
+        """Create the directory and the files it holds"""
+        self.check_writable()
+        if not isdir(self.path):
+            makedirs(self.path)
+        if self.data_file is None:
+            self.open()
+
+    def clear_schema(self):
+        """Clear all gauged data"""
+        self.check_writable()
+        if self.commit_lock_file is None:
+            return self.create_schema()
+        with self.lock:
+            with self.locked():
+                self.close_files()
+                self.remove_files(('checkpoint', 'journal'))
+                self.load()
+
+    def drop_schema(self):
+        """Remove all gauged files"""
+        self.check_writable()
+        with self.lock:
+            self.close()
+            if isdir(self.path):
+                self.remove_files(('checkpoint', 'journal', 'metadata',
+                                   'lock', 'commit.lock'))
+            self.metadata = {}
+            self.metadata_state = None
+            self.reset()
+
+    def remove_files(self, names):
+        for name in names:
+            if exists(self.file_path(name)):
+                remove(self.file_path(name))
+        for segment in self.segments():
+            remove(self.segment_path(segment))
+
+    def close(self):
+        self.close_files()
+        for handle in (self.lock_file, self.commit_lock_file):
+            if handle is not None:
+                handle.close()
+        self.lock_file = self.commit_lock_file = None
+
+    def close_files(self):
+        for handle in (self.data_file, self.journal_file):
+            if handle is not None:
+                handle.close()
+        self.data_file = self.journal_file = None
+        self.unsynced.clear()
+        self.maps.clear()
+
+    def prepare_migrations(self):
+        return OrderedDict()
+
+    def keys(self, namespace, prefix=None, limit=None, offset=None):
+        """Get keys from a namespace"""
+        if self.readonly:
+            self.refresh()
+        keys = sorted(key for key_namespace, key in self.key_ids
+                      if key_namespace == namespace and
+                      (prefix is None or key.startswith(prefix)))
+        if limit is not None:
+            start = offset or 0
+            keys = keys[start:start + limit]
+        return keys
+
+    def lookup_ids(self, keys):
+        """Lookup the integer ID associated with each (namespace, key) in the
+        keys list"""
+        if self.readonly:
+            self.refresh()
+        key_ids = self.key_ids
+        return {namespace_key: key_ids.get(namespace_key)
+                for namespace_key in keys}
+
+    def insert_keys(self, keys):
+        """Assign an ID to each new (namespace, key)"""
+        self.check_writable()
+        with self.lock:
+            key_ids = self.key_ids
+            id_ = self.next_key_id
+            added, records = set(), []
+            for name in keys:
+                if name in key_ids or name in added:
+                    continue
+                added.add(name)
+                records.append((id_,) + tuple(name))
+                id_ += 1
+            if records:
+                self.add_keys(records)
+
+    def add_keys(self, keys):
+        """Add (id, namespace, key) records to the key index. Keys are
+        journaled with the blocks that refer to them, so they're committed
+        or discarded together"""
+        self.log('add_keys', keys)
+        key_ids, key_names = self.key_ids, self.key_names
+        for id_, namespace, key in keys:
+            key_ids[(namespace, key)] = id_
+            key_names[id_] = (namespace, key)
+            if id_ >= self.next_key_id:
+                self.next_key_id = id_ + 1
+
+    def remove_keys(self, namespace, key=None):
+        """Remove the keys of a namespace, or a single key by its ID"""
+        self.log('remove_keys', namespace, key)
+        self.drop_keys(namespace, key)
+
+    def drop_keys(self, namespace, key=None):
+        key_ids, key_names = self.key_ids, self.key_names
+        if key is not None:
+            name = key_names.get(key)
+            if name is not None and name[0] == namespace:
+                del key_names[key]
+                del key_ids[name]
+            return
+        for name in [name for name in key_ids if name[0] == namespace]:
+            del key_names[key_ids.pop(name)]
+
+    def read(self, segment, position, length):
+        """Get a buffer which references data in a segment"""
+        if segment == self.segment and self.data_file is not None:
+            self.data_file.flush()
+        data = self.maps.get(segment)
+        if data is None or len(data) < position + length:
+            # Buffers returned earlier keep the previous mapping alive
+            with open(self.segment_path(segment), 'rb') as handle:
+                data = mmap(handle.fileno(), 0, access=ACCESS_READ)
+            self.maps[segment] = data
+        return buffer(data, position, length)
+
+    def get_block(self, namespace, offset, key):
+        """Get the block identified by namespace, offset and key"""
+        if self.readonly:
+            self.refresh()
+        block = self.blocks.get((namespace, offset, key))
+        if block is None:
+            return None, None
+        flags, chunks = block
+        if len(chunks) == 1:
+            return self.read(*chunks[0][:3]), flags
+        data = ''.join(str(self.read(*chunk[:3])) for chunk in chunks)
+        return buffer(data), flags
+
+    def get_blocks(self, namespace, offset):
+        """Get the (key, data, flags) of every block at the namespace and
+        offset"""
+        if self.readonly:
+            self.refresh()
+        blocks = []
+        for key in sorted(self.block_keys.get((namespace, offset), ())):
+            data, flags = self.get_block(namespace, offset, key)
+            blocks.append((key, data, flags))
+        return blocks
+
+    def write_blocks(self, blocks):
+        """Append block data to the current segment and get the (namespace,
+        offset, key, flags, segment, position, length) of each"""
+        self.check_writable()
+        with self.lock:
+            data_file = self.data_file
+            position = data_file.tell()
+            if position >= self.SEGMENT_SIZE:
+                self.sync(data_file)
+                self.unsynced.discard(data_file)
+                data_file.close()
+                self.segment += 1
+                data_file = self.data_file = \
+                    open(self.segment_path(self.segment), 'ab')
+                position = 0
+            chunks = []
+            for namespace, offset, key, data, flags in blocks:
+                length = len(data)
+                data_file.write(data)
+                self.unsynced.add(data_file)
+                chunks.append((namespace, offset, key, flags, self.segment,
+                               position, length))
+                position += length
+            return chunks
+
+    def add_chunks(self, chunks, replace):
+        """Add data written by write_blocks() to the blocks, replacing
+        their existing data if replace is set"""
+        self.log('add_chunks', chunks, replace)
+        blocks = self.blocks
+        for namespace, offset, key, flags, segment, position, length \
+                in chunks:
+            chunk = (segment, position, length, flags)
+            block = blocks.get((namespace, offset, key))
+            if block is None or replace:
+                blocks[(namespace, offset, key)] = [flags, [chunk]]
+                self.block_keys[(namespace, offset)].add(key)
+            else:
+                block[0] |= flags
+                block[1].append(chunk)
+
+    def replace_blocks(self, blocks):
+        """Replace multiple blocks. blocks must be a list of tuples where
+        each tuple consists of (namespace, offset, key, data, flags)"""
+        self.add_chunks(self.write_blocks(blocks), True)
+
+    def insert_or_append_blocks(self, blocks):
+        """Insert multiple blocks. If a block already exists, the data is
+        appended. blocks must be a list of tuples where each tuple consists
+        of (namespace, offset, key, data, flags)"""
+        self.add_chunks(self.write_blocks(blocks), False)
+
+    def insert_segments(self, blocks):
+        """Blocks are already stored as a list of appended segments, so
+        this is the same as insert_or_append_blocks()"""
+        self.insert_or_append_blocks(blocks)
+
+    def get_segments(self, namespace, offset, key):
+        """Get the (data, flags) of each segment of the block"""
+        if self.readonly:
+            self.refresh()
+        block = self.blocks.get((namespace, offset, key))
+        if block is None:
+            return []
+        return [(self.read(*chunk[:3]), chunk[3]) for chunk in block[1]]
+
+    def compact_segments(self, namespace, offset):
+        """Rewrite each of the namespace's blocks before the offset which
+        has more than one segment as a single segment. Returns the number
+        of blocks compacted"""
+        blocks = []
+        for (block_namespace, block_offset, key), (flags, chunks) \
+                in self.blocks.iteritems():
+            if block_namespace == namespace and block_offset < offset and \
+                    len(chunks) > 1:
+                data = self.get_block(namespace, block_offset, key)[0]
+                blocks.append((namespace, block_offset, key, data, flags))
+        if blocks:
+            self.add_chunks(self.write_blocks(blocks), True)
+        return len(blocks)
+
+    def drop_blocks(self, match):
+        """Remove the blocks, summaries and rollups of each (namespace,
+        offset, key) the function matches"""
+        blocks, block_keys = self.blocks, self.block_keys
+        for namespace, offset in block_keys.keys():
+            keys = block_keys[(namespace, offset)]
+            for key in [key for key in keys if match(namespace, offset, key)]:
+                del blocks[(namespace, offset, key)]
+                keys.remove(key)
+            if not keys:
+                del block_keys[(namespace, offset)]
+        for (namespace, key), summaries in self.summaries.iteritems():
+            for offset in [offset for offset in summaries
+                           if match(namespace, offset, key)]:
+                del summaries[offset]
+        self.drop_rollups(match)
+
+    def drop_rollups(self, match):
+        """Remove the rollups of each (namespace, offset, key) the function
+        matches"""
+        for (namespace, key, _), (offsets, blocks) in \
+                self.rollups.iteritems():
+            removed = [offset for offset in offsets
+                       if match(namespace, offset, key)]
+            for offset in removed:
+                del blocks[offset]
+            if removed:
+                offsets[:] = [offset for offset in offsets
+                              if offset in blocks]
+
+    def drop_cache(self, match):
+        """Remove the cached values which the function matches with (namespace,
+        key, start, length)"""
+        for (namespace, _, length), values in self.cache.iteritems():
+            for start in [start for start, (key, _) in values.iteritems()
+                          if match(namespace, key, start, length)]:
+                del values[start]
+
+    def add_block_summaries(self, summaries):
+        """Merge summaries into the summaries of existing blocks. summaries
+        must be a list of tuples where each tuple consists of (namespace,
+        offset, key, data_points, total, minimum, maximum, sum_of_squares,
+        earliest, latest)"""
+        self.log('add_block_summaries', summaries)
+        for summary in summaries:
+            namespace, offset, key = summary[:3]
+            block_summaries = self.summaries[(namespace, key)]
+            existing = block_summaries.get(offset)
+            if existing is not None:
+                summary = merge_summaries((namespace, offset, key) + existing,
+                                          summary)
+            block_summaries[offset] = tuple(summary[3:])
+
+    def replace_block_summaries(self, summaries):
+        """Replace the summaries of multiple blocks"""
+        self.log('replace_block_summaries', summaries)
+        for summary in summaries:
+            namespace, offset, key = summary[:3]
+            self.summaries[(namespace, key)][offset] = tuple(summary[3:])
+
+    def get_block_summaries(self, namespace, key, start_offset, end_offset):
+        """Get a (data_points, total, minimum, maximum, sum_of_squares)
+        summary of each block between start_offset and end_offset
+        (inclusive)"""
+        if self.readonly:
+            self.refresh()
+        summaries = self.summaries.get((namespace, key))
+        if not summaries:
+            return []
+        if end_offset - start_offset < len(summaries):
+            offsets = xrange(start_offset, end_offset + 1)
+        else:
+            offsets = sorted(offset for offset in summaries
+                             if start_offset <= offset <= end_offset)
+        return [summaries[offset][:5] for offset in offsets
+                if offset in summaries]
+
+    def add_rollups(self, rollups):
+        """Merge rollups into existing rollups. rollups must be a list of
+        tuples where each tuple consists of (namespace, offset, key, tier,
+        start, data_points, total, minimum, maximum, sum_of_squares)"""
+        self.log('add_rollups', rollups)
+        self.insert_rollups(rollups)
+
+    def replace_rollups(self, rollups):
+        """Replace all rollups of the blocks which the rollups belong to"""
+        self.log('replace_rollups', rollups)
+        replaced = set(rollup[:3] for rollup in rollups)
+        self.drop_rollups(lambda namespace, offset, key:
+                          (namespace, offset, key) in replaced)
+        self.insert_rollups(rollups)
+
+    def insert_rollups(self, rollups):
+        """Add rollups to the (namespace, key, tier) => [offsets, {offset:
+        rollups}] index. A block's rollups are stored as the rows they were
+        given in, ordered by start, so that a flush of a new block doesn't
+        need to touch each row"""
+        for (namespace, key, tier, offset), rows in \
+                groupby(rollups, itemgetter(0, 2, 3, 1)):
+            tier_rollups = self.rollups.get((namespace, key, tier))
+            if tier_rollups is None:
+                tier_rollups = self.rollups[(namespace, key, tier)] = [[], {}]
+            offsets, blocks = tier_rollups
+            existing = blocks.get(offset)
+            if existing is None:
+                if not offsets or offset > offsets[-1]:
+                    offsets.append(offset)
+                else:
+                    insort(offsets, offset)
+                rows = list(rows)
+            else:
+                merged = {row[4]: row for row in existing}
+                for row in rows:
+                    other = merged.get(row[4])
+                    merged[row[4]] = row if other is None else \
+                        merge_rollups(other, row)
+                rows = merged.values()
+            rows.sort(key=itemgetter(4))
+            blocks[offset] = rows
+
+    def get_rollups(self, namespace, key, tier, start, end):
+        """Get a (start, data_points, total, minimum, maximum,
+        sum_of_squares) rollup of each interval of the tier which starts in
+        the range [start, end), in order"""
+        if self.readonly:
+            self.refresh()
+        tier_rollups = self.rollups.get((namespace, key, tier))
+        if tier_rollups is None:
+            return []
+        offsets, blocks = tier_rollups
+        # Find the first block with a rollup starting at or after start
+        low, high = 0, len(offsets)
+        while low < high:
+            middle = (low + high) // 2
+            if blocks[offsets[middle]][-1][4] < start:
+                low = middle + 1
+            else:
+                high = middle
+        result = []
+        for offset in islice(offsets, low, None):
+            rows = blocks[offset]
+            if rows[0][4] >= end:
+                break
+            result.extend(tuple(row[4:]) for row in rows
+                          if start <= row[4] < end)
+        return result
+
+    def block_offset_bounds(self, namespace):
+        """Get the minimum and maximum block offset for the specified
+        namespace"""
+        if self.readonly:
+            self.refresh()
+        offsets = self.statistics.get(namespace)
+        if not offsets:
+            return None, None
+        return min(offsets), max(offsets)
+
+    def set_metadata(self, metadata, replace=True):
+        self.check_writable()
+        with self.lock:
+            updated = self.metadata.copy()
+            for key, value in metadata.iteritems():
+                if replace or key not in updated:
+                    updated[key] = str(value)
+            path = self.file_path('metadata')
+            with open(path + '.tmp', 'wb') as handle:
+                marshal.dump(updated, handle, 2)
+                self.sync(handle)
+            rename(path + '.tmp', path)
+            self.metadata = updated
+            self.metadata_state = self.file_state(path)
+
+    def get_metadata(self, key):
+        if self.readonly:
+            self.load_metadata()
+        return self.metadata.get(key)
+
+    def all_metadata(self):
+        if self.readonly:
+            self.load_metadata()
+        return self.metadata.copy()
+
+    def set_writer_position(self, name, timestamp):
+        """Insert a timestamp to keep track of the current writer position"""
+        self.log('set_writer_position', name, timestamp)
+        self.positions[name] = timestamp
+
+    def get_writer_position(self, name):
+        """Get the current writer position"""
+        if self.readonly:
+            self.refresh()
+        return self.positions.get(name, 0)
+
+    def get_namespaces(self):
+        """Get a list of namespaces"""
+        if self.readonly:
+            self.refresh()
+        return [namespace for namespace, offsets
+                in self.statistics.iteritems() if offsets]
+
+    def remove_namespace(self, namespace):
+        """Remove all data associated with the current namespace"""
+        with self.lock:
+            self.log('remove_namespace', namespace)
+            self.drop_blocks(lambda block_namespace, offset, key:
+                             block_namespace == namespace)
+            self.statistics.pop(namespace, None)
+            self.drop_cache(lambda cache_namespace, key, start, length:
+                            cache_namespace == namespace)
+            self.drop_keys(namespace)
+
+    def clear_from(self, offset, timestamp):
+        self.log('clear_from', offset, timestamp)
+        self.drop_blocks(lambda namespace, block_offset, key:
+                         block_offset >= offset)
+        for offsets in self.statistics.itervalues():
+            for block_offset in [block_offset for block_offset in offsets
+                                 if block_offset >= offset]:
+                del offsets[block_offset]
+        self.drop_cache(lambda namespace, key, start, length:
+                        start + length >= timestamp)
+        for name, position in self.positions.iteritems():
+            if position > timestamp:
+                self.positions[name] = timestamp
+
+    def expire_blocks(self, namespace, offset, timestamp):
+        """Remove the blocks of a namespace up to and including offset,
+        along with cached values which start before the timestamp"""
+        self.log('expire_blocks', namespace, offset, timestamp)
+        self.drop_blocks(lambda block_namespace, block_offset, key:
+                         block_namespace == namespace and
+                         block_offset <= offset)
+        offsets = self.statistics.get(namespace, {})
+        for block_offset in [block_offset for block_offset in offsets
+                             if block_offset <= offset]:
+            del offsets[block_offset]
+        self.drop_cache(lambda cache_namespace, key, start, length:
+                        cache_namespace == namespace and start < timestamp)
+
+    def remove_blocks(self, namespace, offset):
+        """Remove every block at the namespace and offset"""
+        self.log('remove_blocks', namespace, offset)
+        blocks = self.blocks
+        for key in self.block_keys.pop((namespace, offset), ()):
+            del blocks[(namespace, offset, key)]
+
+    def clear_key_before(self, key, namespace, offset=None, timestamp=None):
+        self.clear_key(key, namespace, offset, timestamp, True)
+
+    def clear_key_after(self, key, namespace, offset=None, timestamp=None):
+        self.clear_key(key, namespace, offset, timestamp, False)
+
+    def clear_key(self, key, namespace, offset, timestamp, before):
+        """Remove the blocks of a key up to and including (or from) the
+        offset, or the key itself if timestamp is None"""
+        with self.lock:
+            namespace_key = (namespace, key)
+            translated_key = self.key_ids.get(namespace_key)
+            self.log('clear_key_id', translated_key, namespace, offset,
+                     timestamp, before)
+            self.clear_key_id(translated_key, namespace, offset, timestamp,
+                              before)
+            if timestamp is None and translated_key is not None:
+                self.remove_keys(namespace, translated_key)
+
+    def clear_key_id(self, key, namespace, offset, timestamp, before):
+        if timestamp is None:
+            self.drop_blocks(lambda block_namespace, block_offset, block_key:
+                             block_namespace == namespace and
+                             block_key == key)
+            self.drop_cache(lambda cache_namespace, cache_key, start, length:
+                            cache_namespace == namespace and
+                            cache_key == key)
+        elif before:
+            self.drop_blocks(lambda block_namespace, block_offset, block_key:
+                             block_namespace == namespace and
+                             block_key == key and block_offset <= offset)
+            self.drop_cache(lambda cache_namespace, cache_key, start, length:
+                            cache_namespace == namespace and
+                            cache_key == key and start + length <= timestamp)
+        else:
+            self.drop_blocks(lambda block_namespace, block_offset, block_key:
+                             block_namespace == namespace and
+                             block_key == key and block_offset >= offset)
+            self.drop_cache(lambda cache_namespace, cache_key, start, length:
+                            cache_namespace == namespace and
+                            cache_key == key and start + length >= timestamp)
+
+    def get_cache(self, namespace, query_hash, length, start, end):
+        """Get a cached value for the specified date range and query"""
+        if self.readonly:
+            self.refresh()
+        values = self.cache.get((namespace, query_hash, length))
+        if not values:
+            return ()
+        return tuple(sorted((cache_start, value) for cache_start, (_, value)
+                            in values.iteritems()
+                            if start <= cache_start <= end))
+
+    def add_cache(self, namespace, key, query_hash, length, cache):
+        """Add cached values for the specified date range and query. A reader
+        doesn't cache values"""
+        if self.readonly and not self.replaying:
+            return
+        self.log('add_cache', namespace, key, query_hash, length, cache)
+        values = self.cache[(namespace, query_hash, length)]
+        for timestamp, value in cache:
+            values.setdefault(timestamp, (key, value))
+        if not self.replaying:
+            self.commit()
+
+    def remove_cache(self, namespace, key=None):
+        """Remove all cached values for the specified namespace,
+        optionally specifying a key"""
+        self.log('remove_cache', namespace, key)
+        self.drop_cache(lambda cache_namespace, cache_key, start, length:
+                        cache_namespace == namespace and
+                        (key is None or cache_key == key))
+
+    def add_namespace_statistics(self, namespace, offset, data_points,
+                                 byte_count):
+        """Update namespace statistics for the period identified by
+        offset"""
+        self.add_namespace_statistics_many([(namespace, offset, data_points,
+                                             byte_count)])
+
+    def add_namespace_statistics_many(self, rows):
+        """Update namespace statistics for multiple (namespace, offset,
+        data_points, byte_count) rows"""
+        self.log('add_namespace_statistics_many', rows)
+        statistics = self.statistics
+        for namespace, offset, data_points, byte_count in rows:
+            offsets = statistics[namespace]
+            existing = offsets.get(offset)
+            if existing is None:
+                offsets[offset] = [data_points, byte_count]
+            else:
+                existing[0] += data_points
+                existing[1] += byte_count
+
+    def get_namespace_statistics(self, namespace, start_offset, end_offset):
+        """Get namespace statistics for the period between start_offset and
+        end_offset (inclusive)"""
+        if self.readonly:
+            self.refresh()
+        data_points = byte_count = 0L
+        for offset, (points, count) in \
+                self.statistics.get(namespace, {}).iteritems():
+            if start_offset <= offset <= end_offset:
+                data_points += points
+                byte_count += count
+        return [data_points, byte_count]
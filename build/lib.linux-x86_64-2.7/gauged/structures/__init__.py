@@ -0,0 +1,8 @@
+"""
+Gauged
+https://github.com/chriso/gauged (MIT Licensed)
+Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
+"""
+
+from .sparse_map import SparseMap
+from .float_array import FloatArray
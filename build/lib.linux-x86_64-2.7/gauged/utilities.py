@@ -0,0 +1,107 @@
+"""
+Gauged
+https://github.com/chriso/gauged (MIT Licensed)
+Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
+"""
+
+from time import time
+from datetime import datetime
+from sys import builtin_module_names
+
+IS_PYPY = '__pypy__' in builtin_module_names
+
+
+def to_bytes(value):
+    """Get a byte array representing the value"""
+    if isinstance(value, unicode):
+        return value.encode('utf8')
+    elif not isinstance(value, str):
+        return str(value)
+    return value
+
+
+def to_float(value):
+    """Get the value as a float, or NaN if it isn't a number"""
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
+
+
+class Time(object):
+    """Common time constants in milliseconds"""
+
+    SECOND = 1000
+    MINUTE = 60 * SECOND
+    HOUR = 60 * MINUTE
+    DAY = 24 * HOUR
+    WEEK = 7 * DAY
+
+    def __get__(self, instance, owner):
+        return long(time() * 1000)
+
+
+def table_repr(columns, rows, data, padding=2):
+    """Generate a table for cli output"""
+    padding = ' ' * padding
+    column_lengths = [len(column) for column in columns]
+    for row in rows:
+        for i, column in enumerate(columns):
+            item = str(data[row][column])
+            column_lengths[i] = max(len(item), column_lengths[i])
+    max_row_length = max(len(row) for row in rows) if len(rows) else 0
+    table_row = ' ' * max_row_length
+    for i, column in enumerate(columns):
+        table_row += padding + column.rjust(column_lengths[i])
+    table_rows = [table_row]
+    for row in rows:
+        table_row = row.rjust(max_row_length)
+        for i, column in enumerate(columns):
+            item = str(data[row][column])
+            table_row += padding + item.rjust(column_lengths[i])
+        table_rows.append(table_row)
+    return '\n'.join(table_rows)
+
+
+def to_datetime(milliseconds):
+    """Convert a timestamp in milliseconds to a datetime"""
+    return datetime.fromtimestamp(milliseconds // 1000)
+
+
+def merge_summaries(summary, appended):
+    """Merge two (namespace, offset, key, data_points, total, minimum,
+    maximum, sum_of_squares, earliest, latest) block summaries, where the
+    second summarizes data appended after the first"""
+    namespace, offset, key, count, total, minimum, maximum, \
+        sum_of_squares, earliest, _ = summary
+    _, _, _, other_count, other_total, other_minimum, other_maximum, \
+        other_sum_of_squares, _, latest = appended
+    sum_of_squares = merge_sum_of_squares(
+        count, total, sum_of_squares,
+        other_count, other_total, other_sum_of_squares)
+    return (namespace, offset, key, count + other_count, total + other_total,
+            min(minimum, other_minimum), max(maximum, other_maximum),
+            sum_of_squares, earliest, latest)
+
+
+def merge_rollups(rollup, appended):
+    """Merge two (namespace, offset, key, tier, start, data_points, total,
+    minimum, maximum, sum_of_squares) rollups of the same interval"""
+    count, total, minimum, maximum, sum_of_squares = rollup[5:]
+    other_count, other_total, other_minimum, other_maximum, \
+        other_sum_of_squares = appended[5:]
+    sum_of_squares = merge_sum_of_squares(
+        count, total, sum_of_squares,
+        other_count, other_total, other_sum_of_squares)
+    return rollup[:5] + (count + other_count, total + other_total,
+                         min(minimum, other_minimum),
+                         max(maximum, other_maximum), sum_of_squares)
+
+
+def merge_sum_of_squares(count, total, sum_of_squares,
+                         other_count, other_total, other_sum_of_squares):
+    """Combine the sums of squares (around their means) of two sets of
+    floats, using the parallel variance formula"""
+    difference = other_total * count - total * other_count
+    return sum_of_squares + other_sum_of_squares + difference * difference / \
+        (float(count) * other_count * (count + other_count))
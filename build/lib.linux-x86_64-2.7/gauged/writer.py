@@ -0,0 +1,778 @@
+"""
+Gauged
+https://github.com/chriso/gauged (MIT Licensed)
+Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
+"""
+
+from time import time
+from threading import Timer, Thread
+from collections import defaultdict, namedtuple
+from heapq import heappush, heappop
+from itertools import izip, islice, repeat
+from pprint import pprint
+from ctypes import (c_uint32, byref, c_float, c_int, c_char_p, c_size_t,
+                    c_ssize_t, c_void_p, py_object, string_at, cast)
+from .errors import (GaugedAppendOnlyError, GaugedKeyOverflowError,
+                     GaugedNaNError, GaugedUseAfterFreeError)
+from .bridge import (Gauged, Arena, Map, MapSummary, MapRollup,
+                     WriterHashNodePtr, WriterStats, WriterErrors, Uint32Ptr)
+from .results import Statistics
+from .utilities import to_bytes, to_float, IS_PYPY
+
+if not IS_PYPY:
+    from ctypes import pythonapi  # pylint: disable=wrong-import-order
+    pythonapi.PyBuffer_FromMemory.argtypes = [c_void_p, c_ssize_t]
+    pythonapi.PyBuffer_FromMemory.restype = py_object
+
+HandleValues = namedtuple('HandleValues', 'handles values')
+
+
+class Writer(object):
+    """Handle queueing and writes to the specified data store"""
+
+    ERROR = 0
+    IGNORE = 1
+    REWRITE = 2
+
+    XOR = 1
+
+    OK = 1
+    KEY_OVERFLOW = -1
+    GAUGE_NAN = -3
+
+    ALLOCATIONS = 0
+
+    def __init__(self, driver, config, archive=None):
+        self.driver = driver
+        self.config = config
+        self.archive = archive
+        self.current_array = 0
+        self.current_block = 0
+        self.flush_now = False
+        self.statistics = defaultdict(Statistics)
+        self.reorder_buffer = []
+        self.reorder_sequence = 0
+        self.reorder_latest = 0
+        self.limit_pending = not config.overwrite_blocks and \
+            bool(config.max_pending_bytes or config.max_pending_keys)
+        self.limit_flushed = False
+        if config.flush_seconds:
+            self.start_flush_timer()
+        self.flush_daemon = None
+        self.flush_thread = None
+        self.flush_error = None
+        self.writer = None
+        self.handle_namespaces = []
+        self.mixed_namespaces = False
+        self.allocate_writer()
+
+    def add(self, data, value=None, timestamp=None, namespace=None,
+            debug=False):
+        """Queue a gauge or gauges to be written. `data` can be a key, a dict,
+        a list of (key, value) pairs or a urlencoded str or buffer"""
+        if value is not None:
+            return self.add(((data, value),), timestamp=timestamp,
+                            namespace=namespace, debug=debug)
+        if self.writer is None:
+            raise GaugedUseAfterFreeError
+        if timestamp is None:
+            timestamp = long(time() * 1000)
+        if namespace is None:
+            namespace = self.config.namespace
+        if self.config.reorder_window and not debug:
+            self.reorder(data, timestamp, namespace)
+        else:
+            self.write(data, timestamp, namespace, debug)
+
+    def write(self, data, timestamp, namespace, debug=False):
+        """Write gauges to the C writer at the specified timestamp"""
+        writer = self.writer
+        config = self.config
+        position = self.check_position(timestamp)
+        if position is None:
+            return
+        if isinstance(data, unicode):
+            data = data.encode('utf8')
+        elif isinstance(data, buffer) and (debug or IS_PYPY):
+            data = str(data)
+        if debug:
+            return self.debug(timestamp, namespace, data)
+        self.seek(*position)
+        if isinstance(data, HandleValues):
+            self.emit_handles(data.handles, data.values)
+            if self.limit_pending:
+                self.check_pending_limits()
+            if self.flush_now:
+                self.flush()
+            return
+        data_points = 0
+        namespace_statistics = self.statistics[namespace]
+        if isinstance(data, buffer):  # fast path without copying the buffer
+            address = c_void_p()
+            length = c_size_t()
+            pythonapi.PyObject_AsReadBuffer(py_object(data), byref(address),
+                                            byref(length))
+            data_points = c_uint32(0)
+            if not Gauged.writer_emit_pairs_length(writer, namespace,
+                                                   address, length,
+                                                   byref(data_points)):
+                raise MemoryError
+            data_points = data_points.value
+        elif isinstance(data, str):
+            data_points = c_uint32(0)
+            if not Gauged.writer_emit_pairs(writer, namespace, data,
+                                            byref(data_points)):
+                raise MemoryError
+            data_points = data_points.value
+        else:
+            if isinstance(data, dict):
+                data = data.iteritems()
+            data_points = self.emit(namespace, data)
+        namespace_statistics.data_points += data_points
+        if self.limit_pending:
+            self.check_pending_limits()
+        if isinstance(data, (str, buffer)) and \
+                (config.gauge_nan != Writer.IGNORE or
+                 config.key_overflow != Writer.IGNORE):
+            self.raise_pair_errors()
+        if self.flush_now:
+            self.flush()
+
+    def register(self, key, namespace=None):
+        """Register a key and get an integer handle which can be passed to
+        add_handles(). Handles are valid until the writer is closed"""
+        writer = self.writer
+        if writer is None:
+            raise GaugedUseAfterFreeError
+        config = self.config
+        if namespace is None:
+            namespace = config.namespace
+        key = to_bytes(key)
+        handle = c_uint32()
+        status = Gauged.writer_register(writer, namespace, key, len(key),
+                                        byref(handle))
+        if not status:
+            raise MemoryError
+        if status == Writer.KEY_OVERFLOW and \
+                config.key_overflow == Writer.ERROR:
+            msg = 'Key is larger than the driver allows (%s)' % key
+            raise GaugedKeyOverflowError(msg)
+        handle = handle.value
+        handle_namespaces = self.handle_namespaces
+        if handle == len(handle_namespaces):
+            handle_namespaces.append(namespace)
+            if handle_namespaces[0] != namespace:
+                self.mixed_namespaces = True
+        return handle
+
+    def add_handles(self, handles, values, timestamp=None):
+        """Queue values for keys registered with register(). The keys aren't
+        hashed again, which makes this the fastest way to write the same
+        keys repeatedly"""
+        if self.writer is None:
+            raise GaugedUseAfterFreeError
+        if len(handles) != len(values):
+            raise ValueError('handles and values must be the same length')
+        if timestamp is None:
+            timestamp = long(time() * 1000)
+        data = HandleValues(handles, values)
+        if self.config.reorder_window:
+            self.reorder(data, timestamp, None)
+        else:
+            self.write(data, timestamp, None)
+
+    def add_many(self, timestamps, keys, values, namespace=None):
+        """Queue gauges from parallel sequences (or buffers) of timestamps,
+        keys and values. Consecutive gauges which fall into the same array
+        are written as a single run"""
+        writer = self.writer
+        if writer is None:
+            raise GaugedUseAfterFreeError
+        count = len(timestamps)
+        if len(keys) != count or len(values) != count:
+            raise ValueError('timestamps, keys and values must be the '
+                             'same length')
+        config = self.config
+        if namespace is None:
+            namespace = config.namespace
+        if config.reorder_window:
+            reorder = self.reorder
+            for timestamp, key, value in izip(timestamps, keys, values):
+                reorder(((key, value),), long(timestamp), namespace)
+            return
+        resolution = config.resolution
+        pairs = izip(keys, values)
+        emit = self.emit
+        check_position = self.check_position
+        limit_pending = self.limit_pending
+        start = 0
+        while start < count:
+            timestamp = long(timestamps[start])
+            run_start = timestamp - timestamp % resolution
+            run_end = run_start + resolution
+            end = start + 1
+            while end < count and run_start <= timestamps[end] < run_end:
+                end += 1
+            run = islice(pairs, end - start)
+            position = check_position(timestamp)
+            if position is None:
+                for _ in run:
+                    pass
+            else:
+                # Statistics are counted for each run so that they match
+                # what's been written if a later run raises or a flush starts
+                self.seek(*position)
+                self.statistics[namespace].data_points += emit(namespace, run)
+                if limit_pending:
+                    self.check_pending_limits()
+            start = end
+        if self.flush_now:
+            self.flush()
+
+    def reorder(self, data, timestamp, namespace):
+        """Buffer gauges so that those arriving up to `reorder_window`
+        milliseconds late can be written in chronological order. Gauges
+        are written once they fall outside the window, or when the buffer
+        holds more than `reorder_buffer_size` entries"""
+        # Buffered gauges are copied since the caller may reuse the object
+        if isinstance(data, buffer):
+            data = str(data)
+        elif isinstance(data, dict):
+            data = dict(data)
+        elif isinstance(data, HandleValues):
+            data = HandleValues(tuple(data.handles), tuple(data.values))
+        elif not isinstance(data, basestring):
+            data = tuple(data)
+        buffered = self.reorder_buffer
+        heappush(buffered, (timestamp, self.reorder_sequence, namespace,
+                            data))
+        self.reorder_sequence += 1
+        if timestamp > self.reorder_latest:
+            self.reorder_latest = timestamp
+        release = self.reorder_latest - self.config.reorder_window
+        max_size = self.config.reorder_buffer_size
+        write = self.write
+        while buffered and (buffered[0][0] <= release or
+                            len(buffered) > max_size):
+            timestamp, _, namespace, data = heappop(buffered)
+            write(data, timestamp, namespace)
+
+    def drain_reorder_buffer(self):
+        """Write all gauges held in the reorder buffer"""
+        buffered = self.reorder_buffer
+        write = self.write
+        while buffered:
+            timestamp, _, namespace, data = heappop(buffered)
+            write(data, timestamp, namespace)
+
+    def flush(self):
+        """Flush all pending gauges. If `flush_async` is enabled the pending
+        blocks are handed to a background thread and writing continues while
+        they're written to the driver, holding the driver's lock"""
+        writer = self.writer
+        if writer is None:
+            raise GaugedUseAfterFreeError
+        if self.config.flush_async and not self.config.overwrite_blocks:
+            self.wait_for_flush()
+            self.resolve_keys()
+            pending = Gauged.writer_detach(writer)
+            if not pending:
+                raise MemoryError
+            statistics = self.statistics
+            self.statistics = defaultdict(Statistics)
+            args = (pending, self.current_block, statistics,
+                    self.writer_position())
+            self.flush_thread = Thread(target=self.flush_detached, args=args)
+            self.flush_thread.setDaemon(True)
+            self.flush_thread.start()
+        else:
+            self.resolve_keys()
+            self.flush_pending(writer.contents.pending,
+                               self.current_block, self.statistics,
+                               self.writer_position())
+            self.statistics.clear()
+            if not self.config.overwrite_blocks and \
+                    not Gauged.writer_flush_maps(writer, True):
+                raise MemoryError
+        self.flush_now = False
+
+    def flush_pending(self, pending, current_block, statistics, position):
+        """Write the maps in the pending hash to the driver"""
+        driver = self.driver
+        count = pending.contents.count
+        namespaces = (c_uint32 * count)()
+        key_ids = (c_uint32 * count)()
+        buffers = (c_void_p * count)()
+        lengths = (c_size_t * count)()
+        count = Gauged.writer_export(pending, namespaces, key_ids, buffers,
+                                     lengths)
+        blocks = []
+        summaries = []
+        rollups = []
+        view, summary = Map(), MapSummary()
+        config = self.config
+        resolution = config.resolution
+        block_start = current_block * config.block_size
+        summarize = config.block_summaries
+        tiers = [(tier, tier // resolution) for tier in config.rollups]
+        intervals, intervals_size = None, 0
+        flags = config.compression or 0
+        encoded = Gauged.map_new() if flags else None
+        if flags and encoded is None:
+            raise MemoryError
+        try:
+            # The block data references the C maps directly rather than a
+            # copy. It's only valid until the pending hash is flushed or
+            # freed. Compressed blocks are copied
+            for i in xrange(count):
+                namespace, length = namespaces[i], lengths[i]
+                view.buffer = cast(buffers[i], Uint32Ptr)
+                view.size = view.length = length // 4
+                if summarize:
+                    Gauged.map_summary(byref(view), byref(summary))
+                    summaries.append((namespace, current_block, key_ids[i],
+                                      summary.count, summary.sum,
+                                      summary.min, summary.max,
+                                      summary.sum_of_squares, summary.first,
+                                      summary.last))
+                # Every array takes at least two words, so this leaves room
+                # for a rollup per array
+                if tiers and view.length // 2 > intervals_size:
+                    intervals_size = view.length // 2
+                    intervals = (MapRollup * intervals_size)()
+                for tier, arrays in tiers:
+                    rollup_count = Gauged.map_rollup(byref(view), arrays,
+                                                     intervals, intervals_size)
+                    for j in xrange(rollup_count):
+                        rollup = intervals[j]
+                        interval = rollup.summary
+                        rollups.append((
+                            namespace, current_block, key_ids[i], tier,
+                            block_start + rollup.position * resolution,
+                            interval.count, interval.sum, interval.min,
+                            interval.max, interval.sum_of_squares))
+                if encoded is not None:
+                    if not Gauged.codec_encode(encoded, buffers[i], length):
+                        raise MemoryError
+                    length = encoded.contents.length * 4
+                    data = buffer(string_at(encoded.contents.buffer, length))
+                elif IS_PYPY:
+                    data = buffer(string_at(buffers[i], length))
+                else:
+                    data = pythonapi.PyBuffer_FromMemory(buffers[i], length)
+                statistics[namespace].byte_count += length
+                blocks.append((namespace, current_block, key_ids[i], data,
+                               flags))
+        finally:
+            if encoded is not None:
+                Gauged.map_free(encoded)
+        # The connection may be shared with other threads, e.g. readers
+        # while this runs in the background
+        with driver.lock:
+            if position:
+                driver.set_writer_position(config.writer_name, position)
+            if config.overwrite_blocks:
+                driver.replace_blocks(blocks)
+                if summarize:
+                    driver.replace_block_summaries(summaries)
+                if tiers:
+                    driver.replace_rollups(rollups)
+            else:
+                if config.segmented_blocks:
+                    driver.insert_segments(blocks)
+                else:
+                    driver.insert_or_append_blocks(blocks)
+                if summarize:
+                    driver.add_block_summaries(summaries)
+                if tiers:
+                    driver.add_rollups(rollups)
+            driver.add_namespace_statistics_many(
+                [(namespace, current_block, stats.data_points,
+                  stats.byte_count)
+                 for namespace, stats in statistics.iteritems()])
+            driver.commit()
+
+    def flush_detached(self, pending, current_block, statistics, position):
+        try:
+            self.flush_pending(pending, current_block, statistics, position)
+        except Exception as error:  # pylint: disable=broad-except
+            self.flush_error = error
+        finally:
+            Gauged.writer_detached_free(pending)
+
+    def wait_for_flush(self):
+        """Wait for a background flush to complete, raising any error that
+        occurred while writing"""
+        flush_thread = self.flush_thread
+        if flush_thread is not None:
+            flush_thread.join()
+            self.flush_thread = None
+        error = self.flush_error
+        if error is not None:
+            self.flush_error = None
+            raise error
+
+    def arena_usage(self):
+        """Get allocation counters for the arena which holds the pending
+        keys, arrays and maps"""
+        writer = self.writer
+        if writer is None:
+            raise GaugedUseAfterFreeError
+        arena = writer.contents.pending.contents.arena.contents
+        return {name: getattr(arena, name) for name, _ in Arena._fields_}
+
+    def pending_stats(self):
+        """Get statistics about the gauges held in memory by the writer:
+        the number of keys, bytes used and allocated by the pending maps
+        and arrays, and the size, load factor and average probes per
+        lookup of the writer's hash table"""
+        writer = self.writer
+        if writer is None:
+            raise GaugedUseAfterFreeError
+        stats = WriterStats()
+        Gauged.writer_stats(writer, byref(stats))
+        result = {name: getattr(stats, name) for name, _ in stats._fields_}
+        result['load_factor'] = float(stats.keys) / stats.hash_size
+        result['probes_per_lookup'] = \
+            float(stats.probes) / stats.lookups if stats.lookups else 0.0
+        return result
+
+    def resume_from(self):
+        """Get a timestamp representing the position just after the last
+        written gauge"""
+        self.wait_for_flush()
+        with self.driver.lock:
+            position = self.driver.get_writer_position(
+                self.config.writer_name)
+        return position + self.config.resolution if position else 0
+
+    def clear_from(self, timestamp):
+        """Clear all data from `timestamp` onwards. Note that the timestamp
+        is rounded down to the nearest block boundary"""
+        block_size = self.config.block_size
+        offset, remainder = timestamp // block_size, timestamp % block_size
+        if remainder:
+            raise ValueError('Timestamp must be on a block boundary')
+        self.wait_for_flush()
+        with self.driver.lock:
+            self.driver.clear_from(offset, timestamp)
+            self.clear_archive(None, offset, after=True)
+
+    def clear_key_before(self, key, namespace=None, timestamp=None):
+        """Clear all data before `timestamp` for a given key. Note that the
+        timestamp is rounded down to the nearest block boundary"""
+        block_size = self.config.block_size
+        if namespace is None:
+            namespace = self.config.namespace
+        self.wait_for_flush()
+        if timestamp is not None:
+            offset, remainder = divmod(timestamp, block_size)
+            if remainder:
+                raise ValueError('timestamp must be on a block boundary')
+            if offset == 0:
+                raise ValueError('cannot delete before offset zero')
+            offset -= 1
+            args = (key, namespace, offset, timestamp)
+        else:
+            args = (key, namespace)
+        with self.driver.lock:
+            self.driver.clear_key_before(*args)
+            if timestamp is not None:
+                self.clear_archive(namespace, offset, key)
+            else:
+                self.clear_archive(namespace, 0, key, after=True)
+
+    def clear_key_after(self, key, namespace=None, timestamp=None):
+        """Clear all data after `timestamp` for a given key. Note that the
+        timestamp is rounded down to the nearest block boundary"""
+        block_size = self.config.block_size
+        if namespace is None:
+            namespace = self.config.namespace
+        self.wait_for_flush()
+        if timestamp is not None:
+            offset, remainder = divmod(timestamp, block_size)
+            if remainder:
+                raise ValueError('timestamp must be on a block boundary')
+            args = (key, namespace, offset, timestamp)
+        else:
+            offset = 0
+            args = (key, namespace)
+        with self.driver.lock:
+            self.driver.clear_key_after(*args)
+            self.clear_archive(namespace, offset, key, after=True)
+
+    def clear_archive(self, namespace, offset, key=None, after=False):
+        """Clear the same blocks from the archive, if there is one, since
+        archived blocks are read before the driver's"""
+        archive = self.archive
+        if archive is None:
+            return
+        if key is not None:
+            namespace_key = (namespace, key)
+            key = self.driver.lookup_ids([namespace_key]).get(namespace_key)
+            if key is None:
+                return
+        archive.clear(namespace, offset, key, after)
+
+    def parse_query(self, query):
+        """Parse a query string and return an iterator which yields
+        (key, value)"""
+        writer = self.writer
+        if writer is None:
+            raise GaugedUseAfterFreeError
+        Gauged.writer_parse_query(writer, query)
+        position = 0
+        writer_contents = writer.contents
+        size = writer_contents.buffer_size
+        pointers = writer_contents.buffer
+        while position < size:
+            yield pointers[position], pointers[position+1]
+            position += 2
+
+    def debug(self, timestamp, namespace, data):  # pragma: no cover
+        print 'Timestamp: %s, Namespace: %s' % (timestamp, namespace)
+        if isinstance(data, str):
+            data = self.parse_query(data)
+        elif isinstance(data, dict):
+            data = data.iteritems()
+        accept = self.accept
+        data_dict = {key: value for key, value in data if accept(key)}
+        pprint(data_dict)
+        print ''
+
+    def check_position(self, timestamp):
+        """Get the (block, array) that the timestamp belongs to, applying
+        the append-only policy. Returns None if the gauge should be
+        ignored"""
+        config = self.config
+        block_size = config.block_size
+        this_block = timestamp // block_size
+        this_array = (timestamp % block_size) // config.resolution
+        if this_block < self.current_block or \
+                (this_block == self.current_block and
+                 this_array < self.current_array):
+            if config.append_only_violation == Writer.ERROR:
+                msg = 'Gauged is append-only; timestamps must be increasing'
+                raise GaugedAppendOnlyError(msg)
+            elif config.append_only_violation == Writer.REWRITE:
+                this_block = self.current_block
+                this_array = self.current_array
+            else:
+                return None
+        return this_block, this_array
+
+    def seek(self, this_block, this_array):
+        """Move the writer to the specified block and array, flushing any
+        arrays or blocks that are now complete"""
+        if this_block > self.current_block:
+            self.flush_blocks()
+            self.current_block = this_block
+            self.current_array = this_array
+            self.limit_flushed = False
+        elif this_array > self.current_array:
+            if not Gauged.writer_flush_arrays(self.writer,
+                                              self.current_array):
+                raise MemoryError
+            self.current_array = this_array
+            self.limit_flushed = False
+
+    def check_pending_limits(self):
+        """Flush the pending maps early if the data or keys waiting to be
+        written have grown past the configured `max_pending_bytes` or
+        `max_pending_keys`. The array being written stays pending, so there's
+        nothing more to flush until the writer moves to the next array"""
+        if self.limit_flushed:
+            return
+        config = self.config
+        pending = self.writer.contents.pending.contents
+        max_keys, max_bytes = config.max_pending_keys, config.max_pending_bytes
+        if (max_keys and pending.active > max_keys) or \
+                (max_bytes and pending.bytes > max_bytes):
+            self.flush()
+            self.limit_flushed = True
+
+    def emit_handles(self, handles, values):
+        """Emit values for registered keys to the C writer"""
+        count = len(handles)
+        if not count:
+            return
+        mixed_namespaces = self.mixed_namespaces
+        statuses = (c_int * count)() if mixed_namespaces else None
+        data_points = c_uint32(0)
+        if not Gauged.writer_emit_handles(self.writer,
+                                          (c_uint32 * count)(*handles),
+                                          (c_float * count)(*values), count,
+                                          statuses, byref(data_points)):
+            raise MemoryError
+        statistics = self.statistics
+        if mixed_namespaces:
+            handle_namespaces = self.handle_namespaces
+            for handle, status in izip(handles, statuses):
+                if status == Writer.OK:
+                    statistics[handle_namespaces[handle]].data_points += 1
+        elif data_points.value:
+            statistics[self.handle_namespaces[0]].data_points += \
+                data_points.value
+        if data_points.value != count and \
+                self.config.gauge_nan == Writer.ERROR:
+            self.raise_pair_errors()
+
+    def emit(self, namespace, pairs):
+        """Emit (key, value) pairs to the C writer in a single batch,
+        applying the NaN and key overflow policies. Keys are filtered by the
+        C writer. If a policy raises an error, none of the pairs are
+        written. Returns the number of data points written"""
+        pairs = zip(*pairs)
+        if not pairs:
+            return 0
+        keys, values = pairs
+        count = len(keys)
+        if set(map(type, keys)) != {str}:
+            keys = map(to_bytes, keys)
+        try:
+            values = (c_float * count)(*values)
+        except TypeError:
+            values = (c_float * count)(*map(to_float, values))
+        key_lengths = (c_size_t * count)(*map(len, keys))
+        key_array = (c_char_p * count)(*keys)
+        config = self.config
+        writer = self.writer
+        check_gauge_nan = config.gauge_nan != Writer.IGNORE
+        check_long_keys = config.key_overflow != Writer.IGNORE
+        if check_gauge_nan or check_long_keys:
+            index = c_size_t(0)
+            status = Gauged.writer_check_batch(writer, key_array, key_lengths,
+                                               values, count, check_gauge_nan,
+                                               check_long_keys, byref(index))
+            if status == Writer.GAUGE_NAN:
+                raise GaugedNaNError
+            elif status == Writer.KEY_OVERFLOW:
+                msg = 'Key is larger than the driver allows '
+                msg += '(%s)' % keys[index.value]
+                raise GaugedKeyOverflowError(msg)
+        data_points = c_uint32(0)
+        if not Gauged.writer_emit_batch(writer,
+                                        (c_uint32 * count)(
+                                            *repeat(namespace, count)),
+                                        key_array, key_lengths, values, count,
+                                        None, byref(data_points)):
+            raise MemoryError
+        return data_points.value
+
+    def raise_pair_errors(self):
+        """Raise an error for gauges skipped by the last urlencoded or handle
+        write if the NaN or key overflow policy is `Writer.ERROR`. Valid
+        gauges from the same write have already been written"""
+        config = self.config
+        errors = WriterErrors()
+        Gauged.writer_errors(self.writer, byref(errors))
+        if errors.nan_count and config.gauge_nan == Writer.ERROR:
+            raise GaugedNaNError
+        if errors.overflow_count and config.key_overflow == Writer.ERROR:
+            keys = [key for key, status in izip(errors.keys, errors.statuses)
+                    if status == Writer.KEY_OVERFLOW]
+            msg = 'Key is larger than the driver allows'
+            if keys:
+                msg += ' (%s)' % keys[0]
+            raise GaugedKeyOverflowError(msg)
+
+    def accept(self, key):
+        """Check whether the key passes the whitelist and prefix filters"""
+        key = to_bytes(key)
+        return Gauged.writer_accept(self.writer, key, len(key))
+
+    def writer_position(self):
+        config = self.config
+        return long(self.current_block) * config.block_size \
+            + long(self.current_array) * config.resolution
+
+    def resolve_keys(self):
+        """Look up the IDs of pending keys which the C writer hasn't seen
+        before, inserting them if necessary"""
+        writer = self.writer
+        count = writer.contents.pending.contents.count
+        if not count:
+            return
+        nodes = (WriterHashNodePtr * count)()
+        count = Gauged.writer_unresolved(writer, nodes, count)
+        if not count:
+            return
+        keys = [(node.contents.namespace, node.contents.key)
+                for node in nodes[:count]]
+        with self.driver.lock:
+            self.driver.insert_keys(keys)
+            ids = self.driver.lookup_ids(keys)
+        ids = (c_uint32 * count)(*[ids[key] for key in keys])
+        if not Gauged.writer_resolve(writer, nodes, ids, count):
+            raise MemoryError
+
+    def flush_blocks(self):
+        writer = self.writer
+        if not Gauged.writer_flush_arrays(writer, self.current_array):
+            raise MemoryError
+        self.flush()
+        if not Gauged.writer_flush_maps(writer, False):
+            raise MemoryError
+
+    def start_flush_timer(self):
+        period = self.config.flush_seconds
+        self.flush_daemon = Timer(period, self.flush_timer_tick)
+        self.flush_daemon.setDaemon(True)
+        self.flush_daemon.start()
+
+    def flush_timer_tick(self):
+        self.flush_now = True
+        self.start_flush_timer()
+
+    def allocate_writer(self):
+        self.current_array = 0
+        self.current_block = 0
+        if self.writer is None:
+            self.writer = Gauged.writer_new(self.driver.MAX_KEY or 0,
+                                            self.config.key_cache_size,
+                                            self.config.expected_keys)
+            self.handle_namespaces = []
+            self.mixed_namespaces = False
+            Writer.ALLOCATIONS += 1
+            if not self.writer:
+                raise MemoryError
+            self.load_filters()
+
+    def load_filters(self):
+        """Load the key whitelist and prefix lists into the C writer"""
+        config = self.config
+        writer = self.writer
+        if config.key_whitelist is not None:
+            keys = list(config.key_whitelist)
+            if not Gauged.writer_whitelist(writer,
+                                           (c_char_p * len(keys))(*keys),
+                                           len(keys)):
+                raise MemoryError
+        for prefixes, allow in ((config.key_prefix_whitelist, True),
+                                (config.key_prefix_blacklist, False)):
+            if prefixes:
+                if not Gauged.writer_prefixes(writer,
+                                              (c_char_p * len(prefixes))(
+                                                  *prefixes),
+                                              len(prefixes), allow):
+                    raise MemoryError
+
+    def cleanup(self):
+        if self.flush_daemon is not None:
+            self.flush_daemon.cancel()
+            self.flush_daemon = None
+        try:
+            self.drain_reorder_buffer()
+            self.flush_blocks()
+        finally:
+            self.wait_for_flush()
+        Gauged.writer_free(self.writer)
+        Writer.ALLOCATIONS -= 1
+        self.writer = None
+
+    def __enter__(self):
+        self.allocate_writer()
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.cleanup()
@@ -7,6 +7,7 @@ Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
 from .gauged import Gauged
 from .context import Context
 from .writer import Writer
+from .sharded_writer import ShardedWriter
 from .bridge import Gauged as GaugedInternal
 from .config import Config
 from .version import __version__, __version_info__
@@ -19,3 +19,5 @@ class Aggregate(object):
     ALL = set([SUM, MIN, MAX, MEAN, STDDEV, PERCENTILE, MEDIAN, COUNT])
 
     ASSOCIATIVE = set([SUM, MIN, MAX, COUNT])
+
+    SUMMARIZED = set([SUM, MIN, MAX, COUNT, MEAN, STDDEV])
@@ -8,7 +8,7 @@ import glob
 import os
 import sys
 from ctypes import (POINTER, Structure, cdll, c_int, c_size_t, c_uint32,
-                    c_char_p, c_bool, c_float)
+                    c_char_p, c_bool, c_float, c_double, c_void_p)
 
 
 class SharedLibrary(object):
@@ -56,7 +56,25 @@ class Map(Structure):
     """A wrapper for the C type gauged_map_t"""
     _fields_ = [('buffer', POINTER(c_uint32)),
                 ('size', c_size_t),
-                ('length', c_size_t)]
+                ('length', c_size_t),
+                ('index', c_void_p)]
+
+
+class MapSummary(Structure):
+    """A wrapper for the C type gauged_map_summary_t"""
+    _fields_ = [('count', c_size_t),
+                ('sum', c_double),
+                ('min', c_float),
+                ('max', c_float),
+                ('sum_of_squares', c_double),
+                ('first', c_float),
+                ('last', c_float)]
+
+
+class MapRollup(Structure):
+    """A wrapper for the C type gauged_map_rollup_t"""
+    _fields_ = [('position', c_uint32),
+                ('summary', MapSummary)]
 
 
 class WriterHashNode(Structure):
@@ -67,15 +85,45 @@ WriterHashNode._fields_ = [('key', c_char_p),
                            ('array', POINTER(Array)),
                            ('namespace', c_uint32),
                            ('seed', c_uint32),
-                           ('next', POINTER(WriterHashNode))]
+                           ('next', POINTER(WriterHashNode)),
+                           ('array_next', POINTER(WriterHashNode)),
+                           ('key_id', c_uint32)]
+
+
+class Arena(Structure):
+    """A wrapper for the C type gauged_arena_t"""
+    _fields_ = [('chunks', c_size_t),
+                ('bytes_reserved', c_size_t),
+                ('bytes_used', c_size_t),
+                ('bytes_recycled', c_size_t),
+                ('allocations', c_size_t),
+                ('resets', c_size_t)]
+
+
+class WriterHashBucket(Structure):
+    """A wrapper for the C type gauged_writer_hash_bucket_t"""
+    _fields_ = [('seed', c_uint32),
+                ('distance', c_uint32),
+                ('node', POINTER(WriterHashNode))]
 
 
 class WriterHash(Structure):
     """A wrapper for the C type gauged_writer_hash_t"""
-    _fields_ = [('nodes', POINTER(POINTER(WriterHashNode))),
+    _fields_ = [('buckets', POINTER(WriterHashBucket)),
                 ('size', c_size_t),
                 ('count', c_size_t),
-                ('head', POINTER(WriterHashNode))]
+                ('head', POINTER(WriterHashNode)),
+                ('tail', POINTER(WriterHashNode)),
+                ('array_head', POINTER(WriterHashNode)),
+                ('array_tail', POINTER(WriterHashNode)),
+                ('arena', POINTER(Arena)),
+                ('bytes', c_size_t),
+                ('lookups', c_size_t),
+                ('probes', c_size_t),
+                ('old_buckets', POINTER(WriterHashBucket)),
+                ('old_size', c_size_t),
+                ('migrated', c_size_t),
+                ('active', c_size_t)]
 
 
 class Writer(Structure):
@@ -86,10 +134,33 @@ class Writer(Structure):
                 ('buffer', POINTER(c_char_p)),
                 ('buffer_size', c_size_t)]
 
+
+class WriterStats(Structure):
+    """A wrapper for the C type gauged_writer_stats_t"""
+    _fields_ = [('keys', c_size_t),
+                ('map_bytes', c_size_t),
+                ('map_capacity', c_size_t),
+                ('array_bytes', c_size_t),
+                ('array_capacity', c_size_t),
+                ('hash_size', c_size_t),
+                ('lookups', c_size_t),
+                ('probes', c_size_t)]
+
+
+class WriterErrors(Structure):
+    """A wrapper for the C type gauged_writer_errors_t"""
+    _fields_ = [('nan_count', c_size_t),
+                ('overflow_count', c_size_t),
+                ('count', c_size_t),
+                ('statuses', c_int * 16),
+                ('keys', c_char_p * 16)]
+
 # Define pointer types
 ArrayPtr = POINTER(Array)
 MapPtr = POINTER(Map)
 WriterPtr = POINTER(Writer)
+WriterHashPtr = POINTER(WriterHash)
+WriterHashNodePtr = POINTER(WriterHashNode)
 SizetPtr = POINTER(c_size_t)
 Uint32Ptr = POINTER(c_uint32)
 FloatPtr = POINTER(c_float)
@@ -109,13 +180,16 @@ Gauged.prototype('map_free', [MapPtr])
 Gauged.prototype('map_export', [MapPtr], Uint32Ptr)
 Gauged.prototype('map_length', [MapPtr], c_size_t)
 Gauged.prototype('map_import', [Uint32Ptr, c_size_t], MapPtr)
+Gauged.prototype('map_clear', [MapPtr])
 Gauged.prototype('map_append', [MapPtr, c_uint32, ArrayPtr], c_int)
+Gauged.prototype('map_seek', [MapPtr, c_uint32], c_size_t)
 Gauged.prototype('map_advance', [Uint32Ptr, SizetPtr, Uint32Ptr, SizetPtr,
                                  POINTER(FloatPtr)], Uint32Ptr)
 Gauged.prototype('map_concat', [MapPtr, MapPtr, c_uint32, c_uint32,
                                 c_uint32], c_int)
 Gauged.prototype('map_first', [MapPtr], c_float)
 Gauged.prototype('map_last', [MapPtr], c_float)
+Gauged.prototype('map_last_before', [MapPtr, c_uint32], c_float)
 Gauged.prototype('map_sum', [MapPtr], c_float)
 Gauged.prototype('map_min', [MapPtr], c_float)
 Gauged.prototype('map_max', [MapPtr], c_float)
@@ -123,8 +197,45 @@ Gauged.prototype('map_mean', [MapPtr], c_float)
 Gauged.prototype('map_stddev', [MapPtr], c_float)
 Gauged.prototype('map_sum_of_squares', [MapPtr, c_float], c_float)
 Gauged.prototype('map_count', [MapPtr], c_float)
+Gauged.prototype('map_summary', [MapPtr, POINTER(MapSummary)])
+Gauged.prototype('map_rollup', [MapPtr, c_uint32, POINTER(MapRollup),
+                                c_size_t], c_size_t)
 Gauged.prototype('map_percentile', [MapPtr, c_float, FloatPtr], c_int)
-Gauged.prototype('writer_new', [c_size_t], WriterPtr)
+Gauged.prototype('codec_encode', [MapPtr, c_void_p, c_size_t], c_int)
+Gauged.prototype('codec_decode', [Uint32Ptr, c_size_t], MapPtr)
+Gauged.prototype('writer_new', [c_size_t, c_size_t, c_size_t], WriterPtr)
 Gauged.prototype('writer_free', [WriterPtr])
+Gauged.prototype('writer_whitelist', [WriterPtr, POINTER(c_char_p), c_size_t],
+                 c_int)
+Gauged.prototype('writer_prefixes', [WriterPtr, POINTER(c_char_p), c_size_t,
+                                     c_bool], c_int)
+Gauged.prototype('writer_accept', [WriterPtr, c_char_p, c_size_t], c_bool)
+Gauged.prototype('writer_register', [WriterPtr, c_uint32, c_char_p, c_size_t,
+                                     Uint32Ptr], c_int)
+Gauged.prototype('writer_emit_handles', [WriterPtr, Uint32Ptr, FloatPtr,
+                                         c_size_t, POINTER(c_int), Uint32Ptr],
+                 c_int)
+Gauged.prototype('writer_emit_batch', [WriterPtr, Uint32Ptr, POINTER(c_char_p),
+                                       SizetPtr, FloatPtr, c_size_t,
+                                       POINTER(c_int), Uint32Ptr], c_int)
+Gauged.prototype('writer_check_batch', [WriterPtr, POINTER(c_char_p),
+                                        SizetPtr, FloatPtr, c_size_t, c_bool,
+                                        c_bool, SizetPtr], c_int)
+Gauged.prototype('writer_emit_pairs_length', [WriterPtr, c_uint32, c_void_p,
+                                              c_size_t, Uint32Ptr], c_int)
+Gauged.prototype('writer_route', [c_char_p, c_size_t, c_uint32, c_char_p,
+                                  SizetPtr], c_int)
+Gauged.prototype('writer_route_keys', [POINTER(c_char_p), SizetPtr, c_size_t,
+                                       c_uint32, Uint32Ptr])
 Gauged.prototype('writer_flush_arrays', [WriterPtr, c_uint32], c_int)
 Gauged.prototype('writer_flush_maps', [WriterPtr, c_bool], c_int)
+Gauged.prototype('writer_errors', [WriterPtr, POINTER(WriterErrors)])
+Gauged.prototype('writer_stats', [WriterPtr, POINTER(WriterStats)])
+Gauged.prototype('writer_unresolved', [WriterPtr, POINTER(WriterHashNodePtr),
+                                       c_size_t], c_size_t)
+Gauged.prototype('writer_resolve', [WriterPtr, POINTER(WriterHashNodePtr),
+                                    Uint32Ptr, c_size_t], c_int)
+Gauged.prototype('writer_export', [WriterHashPtr, Uint32Ptr, Uint32Ptr,
+                                   POINTER(c_void_p), SizetPtr], c_size_t)
+Gauged.prototype('writer_detach', [WriterPtr], WriterHashPtr)
+Gauged.prototype('writer_detached_free', [WriterHashPtr])
@@ -13,10 +13,25 @@ DEFAULTS = {
     'resolution': Time.SECOND,
     'writer_name': 'default',
     'overwrite_blocks': False,
+    'compression': None,
+    'block_summaries': False,
+    'rollups': [],
+    'segmented_blocks': False,
+    'retention': None,
+    'archive_path': None,
+    'archive_after': None,
     'key_overflow': Writer.ERROR,
     'key_whitelist': None,
+    'key_prefix_whitelist': None,
+    'key_prefix_blacklist': None,
     'flush_seconds': 0,
+    'flush_async': False,
+    'max_pending_bytes': 0,
+    'max_pending_keys': 0,
+    'expected_keys': 0,
     'append_only_violation': Writer.ERROR,
+    'reorder_window': 0,
+    'reorder_buffer_size': 64 * 1024,
     'gauge_nan': Writer.ERROR,
     'key_cache_size': 64 * 1024,
     'max_interval_steps': 31 * 24,
@@ -44,8 +59,12 @@ class Config(object):
         self.block_arrays = None
         self.defaults = None
         self.key_whitelist = None
+        self.key_prefix_whitelist = None
+        self.key_prefix_blacklist = None
         self.block_size = None
         self.resolution = None
+        self.rollups = None
+        self.retention = None
         self.update(**kwargs)
 
     def update(self, **kwargs):
@@ -66,5 +85,41 @@ class Config(object):
         if self.block_size % self.resolution != 0:
             raise ValueError('`block_size` must be a multiple of `resolution`')
         self.block_arrays = self.block_size // self.resolution
+        if self.compression not in (None, Writer.XOR):
+            raise ValueError('Unknown compression: %r' % self.compression)
+        for tier in self.rollups or ():
+            if not self.valid_rollup(tier):
+                raise ValueError('Rollups must be a multiple of `resolution` '
+                                 'and a factor of `block_size`: %r' % tier)
+        self.rollups = sorted(set(self.rollups or ()))
+        # Block summaries are the coarsest tier of the rollups
+        self.block_summaries = bool(self.block_summaries or self.rollups)
+        if not isinstance(self.retention, dict):
+            self.retention = {None: self.retention}
+        for period in self.retention.itervalues():
+            if period is not None and period <= 0:
+                raise ValueError('Retention periods must be positive: %r'
+                                 % period)
+        if self.archive_after is not None and self.archive_after <= 0:
+            raise ValueError('`archive_after` must be positive')
         if self.key_whitelist is not None:
             self.key_whitelist = {to_bytes(key) for key in self.key_whitelist}
+        if self.key_prefix_whitelist is not None:
+            self.key_prefix_whitelist = [to_bytes(prefix) for prefix
+                                         in self.key_prefix_whitelist]
+        if self.key_prefix_blacklist is not None:
+            self.key_prefix_blacklist = [to_bytes(prefix) for prefix
+                                         in self.key_prefix_blacklist]
+
+    def retention_period(self, namespace):
+        """Get the retention period of a namespace, or None if its data
+        is kept forever"""
+        retention = self.retention
+        if namespace in retention:
+            return retention[namespace]
+        return retention.get(None)
+
+    def valid_rollup(self, tier):
+        """Check whether the rollup tier fits evenly into blocks"""
+        return self.resolution < tier < self.block_size and \
+            tier % self.resolution == 0 and self.block_size % tier == 0
@@ -24,6 +24,10 @@ class Context(object):
         self.namespace = context.pop('namespace')
         if self.namespace is None:
             self.namespace = config.namespace
+        self.summary_offset = context.pop('summary_offset', None)
+        self.rollup_offsets = context.pop('rollup_offsets', None) or {}
+        self.archive = context.pop('archive', None)
+        self.segments = context.pop('segments', True)
         self.context = config.defaults.copy()
         first, last = self.driver.block_offset_bounds(self.namespace)
         self.no_data = last is None
@@ -65,27 +69,21 @@ class Context(object):
         look_behind = config.max_look_behind // block_size
         timestamp = context['end'] if timestamp is None else timestamp
         end_block, offset = timestamp // block_size, timestamp % block_size
-        offset = offset // config.resolution
+        end_array = offset // config.resolution + 1
         get_block = self.get_block
         result = block = None
         try:
             while end_block >= 0:
                 block = get_block(key, end_block)
                 if block is not None:
-                    if offset is not None:
-                        tmp = block.slice(end=offset+1)
-                        block.free()
-                        block = tmp
-                    if block.byte_length():
-                        result = block.last()
-                        block.free()
-                        block = None
-                        break
+                    result = block.last_before(end_array)
                     block.free()
                     block = None
+                    if result is not None:
+                        break
                 if not look_behind:
                     break
-                offset = None
+                end_array = config.block_arrays
                 look_behind -= 1
                 end_block -= 1
         finally:
@@ -109,6 +107,12 @@ class Context(object):
         end_block = end // block_size
         if start_array:
             start_block += 1
+        # Answer whole blocks and intervals from their summaries if possible
+        if aggregate in Aggregate.SUMMARIZED:
+            summaries = self.summaries(key, start, end)
+            if summaries is not None:
+                result = self.aggregate_summaries(summaries, aggregate)
+                return result if result == result else None
         # Can we break the operation up into smaller chunks that utilise the
         # aggregate_series() cache and then combine the results?
         if start_block + 1 < end_block and aggregate in Aggregate.ASSOCIATIVE:
@@ -199,6 +203,112 @@ class Context(object):
                 block.free()
         return result if result == result else None
 
+    def summary_tiers(self):
+        """Get an (interval, first offset) pair for each tier of summaries,
+        from the coarsest. Blocks before the first offset of a tier have no
+        summaries in that tier"""
+        tiers = sorted(self.rollup_offsets.iteritems(), reverse=True)
+        if self.summary_offset is not None:
+            tiers.insert(0, (self.config.block_size, self.summary_offset))
+        return tiers
+
+    def summaries(self, key, start, end):
+        """Get a (count, sum, min, max, sum_of_squares) summary of each part
+        of the range. Whole blocks are summarized by the driver, then whole
+        intervals of each rollup tier from the coarsest, so only the edges
+        of the range are read. Returns None if no part of the range has a
+        summary"""
+        block_size = self.config.block_size
+        summaries, edges, summarized = [], [(start, end)], False
+        for tier, offset in self.summary_tiers():
+            remaining = []
+            for edge_start, edge_end in edges:
+                first = max(-(-edge_start // tier) * tier, offset * block_size)
+                last = edge_end // tier * tier
+                if first >= last:
+                    remaining.append((edge_start, edge_end))
+                    continue
+                summarized = True
+                summaries.extend(self.tier_summaries(key, tier, first, last))
+                if edge_start < first:
+                    remaining.append((edge_start, first))
+                if last < edge_end:
+                    remaining.append((last, edge_end))
+            edges = remaining
+        if not summarized:
+            return None
+        block = None
+        try:
+            for edge_start, edge_end in edges:
+                for block in self.block_iterator(key, edge_start, edge_end):
+                    summaries.append(block.summary()[:5])
+                    block.free()
+                    block = None
+        finally:
+            if block is not None:
+                block.free()
+        return summaries
+
+    def tier_summaries(self, key, tier, start, end):
+        """Get a (count, sum, min, max, sum_of_squares) summary of each
+        interval of the tier in the range, which must be aligned to the
+        tier"""
+        if tier == self.config.block_size:
+            return self.driver.get_block_summaries(
+                self.namespace, key, start // tier, end // tier - 1)
+        return [rollup[1:] for rollup in self.driver.get_rollups(
+            self.namespace, key, tier, start, end)]
+
+    def series_rollups(self, key, start, end, interval):
+        """Get the rollups of the coarsest tier which evenly divides each
+        interval of a series, grouped by the start of the interval. Returns
+        a (first, groups) pair where intervals which start before `first`
+        have no rollups, or None if no tier fits or if each interval is made
+        of whole blocks"""
+        block_size = self.config.block_size
+        if not interval % block_size and not start % block_size:
+            return None
+        for tier, offset in sorted(self.rollup_offsets.iteritems(),
+                                   reverse=True):
+            if not interval % tier and not start % tier:
+                break
+        else:
+            return None
+        first = max(start, -(-(offset * block_size - start) // interval) *
+                    interval + start)
+        groups = {}
+        for rollup in self.driver.get_rollups(self.namespace, key, tier,
+                                              first, end):
+            group = rollup[0] - (rollup[0] - start) % interval
+            groups.setdefault(group, []).append(rollup[1:])
+        return first, groups
+
+    @staticmethod
+    def aggregate_summaries(summaries, aggregate):
+        count = sum(summary[0] for summary in summaries)
+        if aggregate == Aggregate.COUNT:
+            return float(count)
+        elif aggregate == Aggregate.SUM:
+            return sum(summary[1] for summary in summaries) \
+                if summaries else None
+        summaries = [summary for summary in summaries if summary[0]]
+        if not summaries:
+            return None
+        elif aggregate == Aggregate.MIN:
+            return min(summary[2] for summary in summaries)
+        elif aggregate == Aggregate.MAX:
+            return max(summary[3] for summary in summaries)
+        mean = sum(summary[1] for summary in summaries) / count
+        if aggregate == Aggregate.MEAN:
+            return mean
+        # Combine the sums of squares around each block's mean
+        sum_of_squares = 0
+        for block_count, total, _, _, block_sum_of_squares in summaries:
+            difference = total / block_count - mean
+            sum_of_squares += block_sum_of_squares + \
+                block_count * difference * difference
+        return sqrt(sum_of_squares / count)
+
     def value_series(self):
         key = self.translated_key
         if key is None or self.no_data:
@@ -257,10 +367,18 @@ class Context(object):
             cached = {}
         values = []
         aggregate_fn = self.aggregate
+        # Read every interval's rollups at once if a tier fits
+        rollups = None
+        if aggregate in Aggregate.SUMMARIZED:
+            rollups = self.series_rollups(key, start, end, interval)
         while start < end:
             group_end = min(end, start + interval)
             if start in cached:
                 result = cached[start]
+            elif rollups is not None and start >= rollups[0] and \
+                    group_end - start == interval:
+                result = self.aggregate_summaries(rollups[1].get(start, ()),
+                                                  aggregate)
             else:
                 result = aggregate_fn(start, group_end, aggregate)
             values.append((start, group_end, result))
@@ -334,10 +452,27 @@ class Context(object):
         return result
 
     def get_block(self, key, block):
-        # Note: the second item is a flags column for future extensions, e.g.
-        # to signal that the block needs decompressing
-        buf, _ = self.driver.get_block(self.namespace, block, key)
-        return SparseMap(buf, len(buf)) if buf is not None else None
+        if self.archive is not None:
+            archived = self.archive.get(self.namespace, block, key)
+            if archived is not None:
+                buf, flags = archived
+                return SparseMap(buf, len(buf), flags)
+        if not self.segments:
+            buf, flags = self.driver.get_block(self.namespace, block, key)
+            return None if buf is None else SparseMap(buf, len(buf), flags)
+        # Segments are read whether or not this config writes them, since
+        # another writer may have
+        segments = self.driver.get_segments(self.namespace, block, key)
+        if not segments:
+            return None
+        if len(segments) == 1:
+            buf, flags = segments[0]
+        else:
+            buf = buffer(''.join(str(data) for data, _ in segments))
+            flags = 0
+            for _, segment_flags in segments:
+                flags |= segment_flags
+        return SparseMap(buf, len(buf), flags)
 
     def check_timestamps(self):
         context = self.context
@@ -9,6 +9,7 @@ from urllib import unquote
 from .mysql import MySQLDriver
 from .sqlite import SQLiteDriver
 from .postgresql import PostgreSQLDriver
+from .file import FileDriver
 
 
 def parse_dsn(dsn_string):
@@ -31,6 +32,11 @@ def parse_dsn(dsn_string):
     kwargs = dict(parse_qsl(query, True))
     if scheme == 'sqlite':
         return SQLiteDriver, [dsn.path], {}
+    elif scheme == 'file':
+        for flag in ('fsync', 'readonly'):
+            if flag in kwargs:
+                kwargs[flag] = kwargs[flag].lower() not in ('0', 'false')
+        return FileDriver, [host + dsn.path.split('?')[0]], kwargs
     elif scheme == 'mysql':
         kwargs['user'] = username or 'root'
         kwargs['db'] = database
@@ -30,6 +30,12 @@ class DriverInterface(object):
     def get_block(self, namespace, offset, key):
         raise NotImplementedError
 
+    def get_blocks(self, namespace, offset):
+        raise NotImplementedError
+
+    def remove_blocks(self, namespace, offset):
+        raise NotImplementedError
+
     def insert_keys(self, keys):
         raise NotImplementedError
 
@@ -39,6 +45,33 @@ class DriverInterface(object):
     def insert_or_append_blocks(self, blocks):
         raise NotImplementedError
 
+    def insert_segments(self, blocks):
+        raise NotImplementedError
+
+    def get_segments(self, namespace, offset, key):
+        raise NotImplementedError
+
+    def compact_segments(self, namespace, offset):
+        raise NotImplementedError
+
+    def add_block_summaries(self, summaries):
+        raise NotImplementedError
+
+    def replace_block_summaries(self, summaries):
+        raise NotImplementedError
+
+    def get_block_summaries(self, namespace, key, start_offset, end_offset):
+        raise NotImplementedError
+
+    def add_rollups(self, rollups):
+        raise NotImplementedError
+
+    def replace_rollups(self, rollups):
+        raise NotImplementedError
+
+    def get_rollups(self, namespace, key, tier, start, end):
+        raise NotImplementedError
+
     def commit(self):
         raise NotImplementedError
 
@@ -66,6 +99,9 @@ class DriverInterface(object):
     def clear_from(self, offset, timestamp):
         raise NotImplementedError
 
+    def expire_blocks(self, namespace, offset, timestamp):
+        raise NotImplementedError
+
     def clear_key_after(self, key, namespace, offset=None, timestamp=None):
         raise NotImplementedError
 
@@ -85,5 +121,10 @@ class DriverInterface(object):
                                  data_points, byte_count):
         raise NotImplementedError
 
+    def add_namespace_statistics_many(self, rows):
+        for namespace, offset, data_points, byte_count in rows:
+            self.add_namespace_statistics(namespace, offset, data_points,
+                                          byte_count)
+
     def get_namespace_statistics(self, namespace, start_offset, end_offset):
         raise NotImplementedError
@@ -4,7 +4,10 @@ https://github.com/chriso/gauged (MIT Licensed)
 Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
 """
 
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
+from itertools import groupby
+from operator import itemgetter
+from threading import RLock
 from .interface import DriverInterface
 
 
@@ -21,6 +24,7 @@ class PostgreSQLDriver(DriverInterface):
         self.db = self.psycopg2.connect(**kwargs)
         self.cursor = self.db.cursor()
         self.bulk_insert = 1000
+        self.lock = RLock()
 
     def keys(self, namespace, prefix=None, limit=None, offset=None):
         """Get keys from a namespace"""
@@ -70,6 +74,25 @@ class PostgreSQLDriver(DriverInterface):
         row = cursor.fetchone()
         return (None, None) if row is None else row
 
+    def get_blocks(self, namespace, offset):
+        """Get the (key, data, flags) of every block at the namespace and
+        offset"""
+        cursor = self.cursor
+        cursor.execute('SELECT key, data, flags FROM gauged_data '
+                       'WHERE namespace = %s AND "offset" = %s',
+                       (namespace, offset))
+        return list(cursor.fetchall())
+
+    def remove_blocks(self, namespace, offset):
+        """Remove every block (and block segment) at the namespace and
+        offset"""
+        params = (namespace, offset)
+        execute = self.cursor.execute
+        execute('DELETE FROM gauged_data WHERE namespace = %s '
+                'AND "offset" = %s', params)
+        execute('DELETE FROM gauged_segments WHERE namespace = %s '
+                'AND "offset" = %s', params)
+
     def insert_keys(self, keys):
         """Insert keys into a table which assigns an ID"""
         start = 0
@@ -114,8 +137,9 @@ class PostgreSQLDriver(DriverInterface):
         of (namespace, offset, key, data)"""
         binary = self.psycopg2.Binary
         execute = self.cursor.execute
-        query = 'UPDATE gauged_data SET data = data || %s, flags = %s ' \
-            'WHERE namespace = %s AND "offset" = %s AND key = %s; ' \
+        query = 'UPDATE gauged_data SET data = data || %s, ' \
+            'flags = flags | %s WHERE namespace = %s AND "offset" = %s ' \
+            'AND key = %s; ' \
             'INSERT INTO gauged_data (data, flags, namespace, "offset", key)' \
             'SELECT %s, %s, %s, %s, %s WHERE NOT EXISTS (' \
             'SELECT 1 FROM gauged_data WHERE namespace = %s ' \
@@ -125,6 +149,182 @@ class PostgreSQLDriver(DriverInterface):
             execute(query, (data, flags, namespace, offset, key, data, flags,
                             namespace, offset, key, namespace, offset, key))
 
+    def insert_segments(self, blocks):
+        """Store each block as a new segment rather than appending it to
+        the existing block. blocks must be a list of tuples where each tuple
+        consists of (namespace, offset, key, data, flags)"""
+        start = 0
+        bulk_insert = self.bulk_insert
+        blocks_len = len(blocks)
+        row = '(%s,%s,%s,%s,%s)'
+        query = 'INSERT INTO gauged_segments (namespace, "offset", key, ' \
+            'data, flags) VALUES '
+        execute = self.cursor.execute
+        binary = self.psycopg2.Binary
+        while start < blocks_len:
+            rows = blocks[start:start+bulk_insert]
+            params = []
+            for namespace, offset, key, data, flags in rows:
+                params.extend((namespace, offset, key, binary(data), flags))
+            insert = (row + ',') * (len(rows) - 1) + row
+            execute(query + insert, params)
+            start += bulk_insert
+
+    def get_segments(self, namespace, offset, key):
+        """Get the (data, flags) of the block identified by namespace,
+        offset and key, followed by each of its segments in order"""
+        cursor = self.cursor
+        params = (namespace, offset, key)
+        cursor.execute('SELECT 0, data, flags FROM gauged_data '
+                       'WHERE namespace = %s AND "offset" = %s AND key = %s '
+                       'UNION ALL SELECT id, data, flags FROM gauged_segments '
+                       'WHERE namespace = %s AND "offset" = %s AND key = %s '
+                       'ORDER BY 1', params + params)
+        return [(data, flags) for _, data, flags in cursor]
+
+    def compact_segments(self, namespace, offset):
+        """Append the segments of the namespace's blocks before the offset
+        to their blocks and remove them. The segments are locked as they're
+        read so that a concurrent compaction waits and then skips them, and
+        only the segments which were read are removed. Returns the number
+        of blocks compacted"""
+        cursor = self.cursor
+        cursor.execute('SELECT id, "offset", key, data, flags '
+                       'FROM gauged_segments WHERE namespace = %s '
+                       'AND "offset" < %s ORDER BY "offset", key, id '
+                       'FOR UPDATE', (namespace, offset))
+        blocks, ids = [], []
+        for (block_offset, key), rows in groupby(cursor.fetchall(),
+                                                 itemgetter(1, 2)):
+            data, flags = [], 0
+            for id_, _, _, segment, segment_flags in rows:
+                ids.append(id_)
+                data.append(str(segment))
+                flags |= segment_flags
+            blocks.append((namespace, block_offset, key, ''.join(data),
+                           flags))
+        self.insert_or_append_blocks(blocks)
+        if ids:
+            cursor.execute('DELETE FROM gauged_segments WHERE id = ANY(%s)',
+                           (ids,))
+        return len(blocks)
+
+    def add_block_summaries(self, summaries):
+        """Merge summaries into the summaries of existing blocks. summaries
+        must be a list of tuples where each tuple consists of (namespace,
+        offset, key, data_points, total, minimum, maximum, sum_of_squares,
+        earliest, latest). Requires PostgreSQL 9.5+"""
+        start = 0
+        bulk_insert = self.bulk_insert
+        summaries_len = len(summaries)
+        row = '(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)'
+        query = 'INSERT INTO gauged_block_summary AS s VALUES '
+        update = ' ON CONFLICT (namespace, key, "offset") DO UPDATE SET ' \
+            'sum_of_squares = s.sum_of_squares + EXCLUDED.sum_of_squares + ' \
+            '(EXCLUDED.total * s.data_points - s.total * ' \
+            'EXCLUDED.data_points) ^ 2 / (1.0 * s.data_points * ' \
+            'EXCLUDED.data_points * (s.data_points + EXCLUDED.data_points)),' \
+            'data_points = s.data_points + EXCLUDED.data_points,' \
+            'total = s.total + EXCLUDED.total,' \
+            'minimum = LEAST(s.minimum, EXCLUDED.minimum),' \
+            'maximum = GREATEST(s.maximum, EXCLUDED.maximum),' \
+            'latest = EXCLUDED.latest'
+        execute = self.cursor.execute
+        while start < summaries_len:
+            rows = summaries[start:start+bulk_insert]
+            params = [param for params in rows for param in params]
+            insert = (row + ',') * (len(rows) - 1) + row
+            execute(query + insert + update, params)
+            start += bulk_insert
+
+    def replace_block_summaries(self, summaries):
+        """Replace the summaries of multiple blocks"""
+        start = 0
+        execute = self.cursor.execute
+        query = 'DELETE FROM gauged_block_summary WHERE namespace = %s AND ' \
+            '"offset" = %s AND key = %s'
+        for summary in summaries:
+            execute(query, summary[:3])
+        bulk_insert = self.bulk_insert
+        summaries_len = len(summaries)
+        row = '(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)'
+        query = 'INSERT INTO gauged_block_summary VALUES '
+        while start < summaries_len:
+            rows = summaries[start:start+bulk_insert]
+            params = [param for params in rows for param in params]
+            insert = (row + ',') * (len(rows) - 1) + row
+            execute(query + insert, params)
+            start += bulk_insert
+
+    def get_block_summaries(self, namespace, key, start_offset, end_offset):
+        """Get a (data_points, total, minimum, maximum, sum_of_squares)
+        summary of each block between start_offset and end_offset
+        (inclusive)"""
+        cursor = self.cursor
+        cursor.execute('SELECT data_points, total, minimum, maximum, '
+                       'sum_of_squares FROM gauged_block_summary '
+                       'WHERE namespace = %s AND key = %s AND "offset" '
+                       'BETWEEN %s AND %s',
+                       (namespace, key, start_offset, end_offset))
+        return cursor.fetchall()
+
+    def add_rollups(self, rollups):
+        """Merge rollups into existing rollups. rollups must be a list of
+        tuples where each tuple consists of (namespace, offset, key, tier,
+        start, data_points, total, minimum, maximum, sum_of_squares).
+        Requires PostgreSQL 9.5+"""
+        start = 0
+        bulk_insert = self.bulk_insert
+        rollups_len = len(rollups)
+        row = '(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)'
+        query = 'INSERT INTO gauged_rollups AS r VALUES '
+        update = ' ON CONFLICT (namespace, key, tier, start) DO UPDATE SET ' \
+            'sum_of_squares = r.sum_of_squares + EXCLUDED.sum_of_squares + ' \
+            '(EXCLUDED.total * r.data_points - r.total * ' \
+            'EXCLUDED.data_points) ^ 2 / (1.0 * r.data_points * ' \
+            'EXCLUDED.data_points * (r.data_points + EXCLUDED.data_points)),' \
+            'data_points = r.data_points + EXCLUDED.data_points,' \
+            'total = r.total + EXCLUDED.total,' \
+            'minimum = LEAST(r.minimum, EXCLUDED.minimum),' \
+            'maximum = GREATEST(r.maximum, EXCLUDED.maximum)'
+        execute = self.cursor.execute
+        while start < rollups_len:
+            rows = rollups[start:start+bulk_insert]
+            params = [param for params in rows for param in params]
+            insert = (row + ',') * (len(rows) - 1) + row
+            execute(query + insert + update, params)
+            start += bulk_insert
+
+    def replace_rollups(self, rollups):
+        """Replace all rollups of the blocks which the rollups belong to"""
+        execute = self.cursor.execute
+        for block in set(rollup[:3] for rollup in rollups):
+            execute('DELETE FROM gauged_rollups WHERE namespace = %s '
+                    'AND "offset" = %s AND key = %s', block)
+        start = 0
+        bulk_insert = self.bulk_insert
+        rollups_len = len(rollups)
+        row = '(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)'
+        query = 'INSERT INTO gauged_rollups VALUES '
+        while start < rollups_len:
+            rows = rollups[start:start+bulk_insert]
+            params = [param for params in rows for param in params]
+            insert = (row + ',') * (len(rows) - 1) + row
+            execute(query + insert, params)
+            start += bulk_insert
+
+    def get_rollups(self, namespace, key, tier, start, end):
+        """Get a (start, data_points, total, minimum, maximum,
+        sum_of_squares) rollup of each interval of the tier which starts in
+        the range [start, end), in order"""
+        cursor = self.cursor
+        cursor.execute('SELECT start, data_points, total, minimum, maximum, '
+                       'sum_of_squares FROM gauged_rollups '
+                       'WHERE namespace = %s AND key = %s AND tier = %s '
+                       'AND start >= %s AND start < %s ORDER BY start',
+                       (namespace, key, tier, start, end))
+        return cursor.fetchall()
+
     def block_offset_bounds(self, namespace):
         """Get the minimum and maximum block offset for the specified
         namespace"""
@@ -184,6 +384,10 @@ class PostgreSQLDriver(DriverInterface):
         params = (namespace, )
         execute = self.cursor.execute
         execute('DELETE FROM gauged_data WHERE namespace = %s', params)
+        execute('DELETE FROM gauged_block_summary WHERE namespace = %s',
+                params)
+        execute('DELETE FROM gauged_rollups WHERE namespace = %s', params)
+        execute('DELETE FROM gauged_segments WHERE namespace = %s', params)
         execute('DELETE FROM gauged_statistics WHERE namespace = %s', params)
         execute('DELETE FROM gauged_keys WHERE namespace = %s', params)
         self.remove_cache(namespace)
@@ -192,12 +396,34 @@ class PostgreSQLDriver(DriverInterface):
         params = (offset, )
         execute = self.cursor.execute
         execute('DELETE FROM gauged_data WHERE "offset" >= %s', params)
+        execute('DELETE FROM gauged_block_summary WHERE "offset" >= %s',
+                params)
+        execute('DELETE FROM gauged_rollups WHERE "offset" >= %s', params)
+        execute('DELETE FROM gauged_segments WHERE "offset" >= %s', params)
         execute('DELETE FROM gauged_statistics WHERE "offset" >= %s', params)
         execute('DELETE FROM gauged_cache WHERE start + length >= %s',
                 (timestamp,))
         execute("""UPDATE gauged_writer_history SET timestamp = %s
             WHERE timestamp > %s""", (timestamp, timestamp))
 
+    def expire_blocks(self, namespace, offset, timestamp):
+        """Remove the blocks of a namespace up to and including offset,
+        along with cached values which start before the timestamp"""
+        params = (namespace, offset)
+        execute = self.cursor.execute
+        execute('DELETE FROM gauged_data WHERE namespace = %s '
+                'AND "offset" <= %s', params)
+        execute('DELETE FROM gauged_block_summary WHERE namespace = %s '
+                'AND "offset" <= %s', params)
+        execute('DELETE FROM gauged_rollups WHERE namespace = %s '
+                'AND "offset" <= %s', params)
+        execute('DELETE FROM gauged_segments WHERE namespace = %s '
+                'AND "offset" <= %s', params)
+        execute('DELETE FROM gauged_statistics WHERE namespace = %s '
+                'AND "offset" <= %s', params)
+        execute('DELETE FROM gauged_cache WHERE namespace = %s '
+                'AND start < %s', (namespace, timestamp))
+
     def clear_key_before(self, key, namespace, offset=None, timestamp=None):
         namespace_key = (namespace, key)
         translated_key = self.lookup_ids((namespace_key,)).get(namespace_key)
@@ -206,6 +432,12 @@ class PostgreSQLDriver(DriverInterface):
             params = (translated_key, namespace, offset)
             execute('DELETE FROM gauged_data WHERE key = %s '
                     'AND namespace = %s AND "offset" <= %s', params)
+            execute('DELETE FROM gauged_block_summary WHERE key = %s '
+                    'AND namespace = %s AND "offset" <= %s', params)
+            execute('DELETE FROM gauged_rollups WHERE key = %s '
+                    'AND namespace = %s AND "offset" <= %s', params)
+            execute('DELETE FROM gauged_segments WHERE key = %s '
+                    'AND namespace = %s AND "offset" <= %s', params)
             params = (translated_key, namespace, timestamp)
             execute('DELETE FROM gauged_cache WHERE key = %s '
                     'AND namespace = %s AND start + length <= %s', params)
@@ -213,6 +445,12 @@ class PostgreSQLDriver(DriverInterface):
             params = (translated_key, namespace)
             execute('DELETE FROM gauged_data WHERE key = %s '
                     'AND namespace = %s', params)
+            execute('DELETE FROM gauged_block_summary WHERE key = %s '
+                    'AND namespace = %s', params)
+            execute('DELETE FROM gauged_rollups WHERE key = %s '
+                    'AND namespace = %s', params)
+            execute('DELETE FROM gauged_segments WHERE key = %s '
+                    'AND namespace = %s', params)
             execute('DELETE FROM gauged_keys WHERE key = %s '
                     'AND namespace = %s', params)
             self.remove_cache(namespace, translated_key)
@@ -225,6 +463,12 @@ class PostgreSQLDriver(DriverInterface):
             params = (translated_key, namespace, offset)
             execute('DELETE FROM gauged_data WHERE key = %s '
                     'AND namespace = %s AND "offset" >= %s', params)
+            execute('DELETE FROM gauged_block_summary WHERE key = %s '
+                    'AND namespace = %s AND "offset" >= %s', params)
+            execute('DELETE FROM gauged_rollups WHERE key = %s '
+                    'AND namespace = %s AND "offset" >= %s', params)
+            execute('DELETE FROM gauged_segments WHERE key = %s '
+                    'AND namespace = %s AND "offset" >= %s', params)
             params = (translated_key, namespace, timestamp)
             execute('DELETE FROM gauged_cache WHERE key = %s '
                     'AND namespace = %s AND start + length >= %s', params)
@@ -232,6 +476,12 @@ class PostgreSQLDriver(DriverInterface):
             params = (translated_key, namespace)
             execute('DELETE FROM gauged_data WHERE key = %s '
                     'AND namespace = %s', params)
+            execute('DELETE FROM gauged_block_summary WHERE key = %s '
+                    'AND namespace = %s', params)
+            execute('DELETE FROM gauged_rollups WHERE key = %s '
+                    'AND namespace = %s', params)
+            execute('DELETE FROM gauged_segments WHERE key = %s '
+                    'AND namespace = %s', params)
             execute('DELETE FROM gauged_keys WHERE key = %s '
                     'AND namespace = %s', params)
             self.remove_cache(namespace, translated_key)
@@ -297,6 +547,35 @@ class PostgreSQLDriver(DriverInterface):
                                     offset, namespace, offset, data_points,
                                     byte_count, namespace, offset))
 
+    def add_namespace_statistics_many(self, rows):
+        """Update namespace statistics for multiple (namespace, offset,
+        data_points, byte_count) rows. Requires PostgreSQL 9.5+"""
+        # A row can't be updated twice by the same statement
+        totals = defaultdict(lambda: [0, 0])
+        for namespace, offset, data_points, byte_count in rows:
+            total = totals[(namespace, offset)]
+            total[0] += data_points
+            total[1] += byte_count
+        rows = [key + tuple(total) for key, total in totals.iteritems()]
+        start = 0
+        bulk_insert = self.bulk_insert
+        rows_len = len(rows)
+        row = '(%s,%s,%s,%s)'
+        query = 'INSERT INTO gauged_statistics VALUES '
+        update = ' ON CONFLICT (namespace, "offset") DO UPDATE SET ' \
+            'data_points = gauged_statistics.data_points + ' \
+            'EXCLUDED.data_points, byte_count = ' \
+            'gauged_statistics.byte_count + EXCLUDED.byte_count'
+        execute = self.cursor.execute
+        while start < rows_len:
+            batch = rows[start:start+bulk_insert]
+            params = []
+            for values in batch:
+                params.extend(values)
+            insert = (row + ',') * (len(batch) - 1) + row
+            execute(query + insert + update, params)
+            start += bulk_insert
+
     def get_namespace_statistics(self, namespace, start_offset, end_offset):
         """Get namespace statistics for the period between start_offset and
         end_offset (inclusive)"""
@@ -310,6 +589,40 @@ class PostgreSQLDriver(DriverInterface):
     def create_schema(self):
         """Create all necessary tables"""
         execute = self.cursor.execute
+        execute("""CREATE TABLE IF NOT EXISTS gauged_block_summary (
+                namespace integer NOT NULL,
+                "offset" integer NOT NULL,
+                key bigint NOT NULL,
+                data_points bigint NOT NULL,
+                total double precision NOT NULL,
+                minimum real NOT NULL,
+                maximum real NOT NULL,
+                sum_of_squares double precision NOT NULL,
+                earliest real NOT NULL,
+                latest real NOT NULL,
+                PRIMARY KEY (namespace, key, "offset"))""")
+        execute("""CREATE TABLE IF NOT EXISTS gauged_rollups (
+                namespace integer NOT NULL,
+                "offset" integer NOT NULL,
+                key bigint NOT NULL,
+                tier bigint NOT NULL,
+                start bigint NOT NULL,
+                data_points bigint NOT NULL,
+                total double precision NOT NULL,
+                minimum real NOT NULL,
+                maximum real NOT NULL,
+                sum_of_squares double precision NOT NULL,
+                PRIMARY KEY (namespace, key, tier, start))""")
+        execute("""CREATE TABLE IF NOT EXISTS gauged_segments (
+                id bigserial PRIMARY KEY,
+                namespace integer NOT NULL,
+                "offset" integer NOT NULL,
+                key bigint NOT NULL,
+                data bytea NOT NULL,
+                flags integer NOT NULL)""")
+        execute("""CREATE INDEX IF NOT EXISTS gauged_segment_block
+                ON gauged_segments (namespace, "offset", key, id)""")
+        self.db.commit()
         try:
             return execute('SELECT 1 FROM gauged_statistics')
         except self.psycopg2.ProgrammingError:
@@ -369,6 +682,9 @@ class PostgreSQLDriver(DriverInterface):
         """Clear all gauged data"""
         execute = self.cursor.execute
         execute("""TRUNCATE gauged_data;
+            TRUNCATE gauged_block_summary;
+            TRUNCATE gauged_rollups;
+            TRUNCATE gauged_segments;
             TRUNCATE gauged_keys RESTART IDENTITY;
             TRUNCATE gauged_writer_history;
             TRUNCATE gauged_cache;
@@ -380,6 +696,9 @@ class PostgreSQLDriver(DriverInterface):
         try:
             self.cursor.execute("""
                 DROP TABLE IF EXISTS gauged_data;
+                DROP TABLE IF EXISTS gauged_block_summary;
+                DROP TABLE IF EXISTS gauged_rollups;
+                DROP TABLE IF EXISTS gauged_segments;
                 DROP TABLE IF EXISTS gauged_keys;
                 DROP TABLE IF EXISTS gauged_writer_history;
                 DROP TABLE IF EXISTS gauged_cache;
@@ -396,4 +715,42 @@ class PostgreSQLDriver(DriverInterface):
             'TRUNCATE gauged_cache',
             'ALTER TABLE gauged_cache ADD COLUMN key bigint NOT NULL'
         ]
+        migrations['1.1.0'] = ["""
+            CREATE TABLE IF NOT EXISTS gauged_segments (
+                id bigserial PRIMARY KEY,
+                namespace integer NOT NULL,
+                "offset" integer NOT NULL,
+                key bigint NOT NULL,
+                data bytea NOT NULL,
+                flags integer NOT NULL)
+        """, """
+            CREATE INDEX IF NOT EXISTS gauged_segment_block
+                ON gauged_segments (namespace, "offset", key, id)
+        """, """
+            CREATE TABLE IF NOT EXISTS gauged_block_summary (
+                namespace integer NOT NULL,
+                "offset" integer NOT NULL,
+                key bigint NOT NULL,
+                data_points bigint NOT NULL,
+                total double precision NOT NULL,
+                minimum real NOT NULL,
+                maximum real NOT NULL,
+                sum_of_squares double precision NOT NULL,
+                earliest real NOT NULL,
+                latest real NOT NULL,
+                PRIMARY KEY (namespace, key, "offset"))
+        """, """
+            CREATE TABLE IF NOT EXISTS gauged_rollups (
+                namespace integer NOT NULL,
+                "offset" integer NOT NULL,
+                key bigint NOT NULL,
+                tier bigint NOT NULL,
+                start bigint NOT NULL,
+                data_points bigint NOT NULL,
+                total double precision NOT NULL,
+                minimum real NOT NULL,
+                maximum real NOT NULL,
+                sum_of_squares double precision NOT NULL,
+                PRIMARY KEY (namespace, key, tier, start))
+        """]
         return migrations
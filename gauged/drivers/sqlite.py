@@ -5,6 +5,10 @@ Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
 """
 
 from collections import OrderedDict
+from itertools import groupby
+from operator import itemgetter
+from threading import RLock
+from ..utilities import merge_summaries, merge_rollups
 from .interface import DriverInterface
 
 
@@ -22,7 +26,9 @@ class SQLiteDriver(DriverInterface):
         self.db = sqlite.connect(database, check_same_thread=False)
         self.db.text_factory = str
         self.bulk_insert = bulk_insert
+        self.upsert = sqlite.sqlite_version_info >= (3, 24, 0)
         self.cursor = self.db.cursor()
+        self.lock = RLock()
 
     def keys(self, namespace, prefix=None, limit=None, offset=None):
         """Get keys from a namespace"""
@@ -72,6 +78,25 @@ class SQLiteDriver(DriverInterface):
         row = cursor.fetchone()
         return (None, None) if row is None else row
 
+    def get_blocks(self, namespace, offset):
+        """Get the (key, data, flags) of every block at the namespace and
+        offset"""
+        cursor = self.cursor
+        cursor.execute('SELECT `key`, data, flags FROM gauged_data '
+                       'WHERE namespace = ? AND offset = ?',
+                       (namespace, offset))
+        return list(cursor.fetchall())
+
+    def remove_blocks(self, namespace, offset):
+        """Remove every block (and block segment) at the namespace and
+        offset"""
+        params = (namespace, offset)
+        execute = self.cursor.execute
+        execute('DELETE FROM gauged_data WHERE namespace = ? '
+                'AND offset = ?', params)
+        execute('DELETE FROM gauged_segments WHERE namespace = ? '
+                'AND offset = ?', params)
+
     def insert_keys(self, keys):
         """Insert keys into a table which assigns an ID"""
         start = 0
@@ -125,9 +150,225 @@ class SQLiteDriver(DriverInterface):
             start += bulk_insert
         for namespace, offset, key, data, flags in blocks:
             execute('UPDATE gauged_data SET data = CAST(data || ? AS BLOB),'
-                    'flags = ? WHERE namespace = ? AND offset = ? AND '
+                    'flags = flags | ? WHERE namespace = ? AND offset = ? AND '
                     '`key` = ?', (data, flags, namespace, offset, key))
 
+    def insert_segments(self, blocks):
+        """Store each block as a new segment rather than appending it to
+        the existing block. blocks must be a list of tuples where each tuple
+        consists of (namespace, offset, key, data, flags)"""
+        start = 0
+        bulk_insert = self.bulk_insert
+        blocks_len = len(blocks)
+        row = '(?,?,?,?,?)'
+        query = 'INSERT INTO gauged_segments (namespace, offset, `key`, ' \
+            'data, flags) VALUES '
+        execute = self.cursor.execute
+        while start < blocks_len:
+            rows = blocks[start:start+bulk_insert]
+            params = [param for params in rows for param in params]
+            insert = (row + ',') * (len(rows) - 1) + row
+            execute(query + insert, params)
+            start += bulk_insert
+
+    def get_segments(self, namespace, offset, key):
+        """Get the (data, flags) of the block identified by namespace,
+        offset and key, followed by each of its segments in order"""
+        cursor = self.cursor
+        params = (namespace, offset, key)
+        cursor.execute('SELECT 0, data, flags FROM gauged_data '
+                       'WHERE namespace = ? AND offset = ? AND `key` = ? '
+                       'UNION ALL SELECT id, data, flags FROM gauged_segments '
+                       'WHERE namespace = ? AND offset = ? AND `key` = ? '
+                       'ORDER BY 1', params + params)
+        return [(data, flags) for _, data, flags in cursor]
+
+    def compact_segments(self, namespace, offset):
+        """Append the segments of the namespace's blocks before the offset
+        to their blocks and remove them. The transaction takes the write
+        lock up front so that a concurrent compaction can't append the same
+        segments. Returns the number of blocks compacted"""
+        self.db.commit()
+        cursor = self.cursor
+        cursor.execute('BEGIN IMMEDIATE')
+        params = (namespace, offset)
+        segments = self.db.cursor()
+        segments.execute('SELECT offset, `key`, data, flags '
+                         'FROM gauged_segments WHERE namespace = ? '
+                         'AND offset < ? ORDER BY offset, `key`, id', params)
+        blocks, count = [], 0
+        for (block_offset, key), rows in groupby(segments, itemgetter(0, 1)):
+            data, flags = [], 0
+            for _, _, segment, segment_flags in rows:
+                data.append(str(segment))
+                flags |= segment_flags
+            blocks.append((namespace, block_offset, key,
+                           buffer(''.join(data)), flags))
+            if len(blocks) == self.bulk_insert:
+                self.insert_or_append_blocks(blocks)
+                count += len(blocks)
+                blocks = []
+        self.insert_or_append_blocks(blocks)
+        count += len(blocks)
+        cursor.execute('DELETE FROM gauged_segments WHERE namespace = ? '
+                       'AND offset < ?', params)
+        return count
+
+    def add_block_summaries(self, summaries):
+        """Merge summaries into the summaries of existing blocks. summaries
+        must be a list of tuples where each tuple consists of (namespace,
+        offset, key, data_points, total, minimum, maximum, sum_of_squares,
+        earliest, latest)"""
+        if not self.upsert:
+            return self.merge_block_summaries(summaries)
+        start = 0
+        bulk_insert = self.bulk_insert
+        summaries_len = len(summaries)
+        row = '(?,?,?,?,?,?,?,?,?,?)'
+        query = 'INSERT INTO gauged_block_summary VALUES '
+        update = ' ON CONFLICT (namespace, `key`, offset) DO UPDATE SET ' \
+            'sum_of_squares = sum_of_squares + excluded.sum_of_squares + ' \
+            '(excluded.total * data_points - total * excluded.data_points) ' \
+            '* (excluded.total * data_points - total * excluded.data_points)' \
+            ' / (1.0 * data_points * excluded.data_points * ' \
+            '(data_points + excluded.data_points)),' \
+            'data_points = data_points + excluded.data_points,' \
+            'total = total + excluded.total,' \
+            'minimum = MIN(minimum, excluded.minimum),' \
+            'maximum = MAX(maximum, excluded.maximum),' \
+            'latest = excluded.latest'
+        execute = self.cursor.execute
+        while start < summaries_len:
+            rows = summaries[start:start+bulk_insert]
+            params = [param for params in rows for param in params]
+            insert = (row + ',') * (len(rows) - 1) + row
+            execute(query + insert + update, params)
+            start += bulk_insert
+
+    def merge_block_summaries(self, summaries):
+        """Merge summaries one at a time, for SQLite versions without
+        UPSERT"""
+        cursor = self.cursor
+        replace = []
+        for summary in summaries:
+            namespace, offset, key = summary[:3]
+            cursor.execute('SELECT * FROM gauged_block_summary '
+                           'WHERE namespace = ? AND `key` = ? AND offset = ?',
+                           (namespace, key, offset))
+            existing = cursor.fetchone()
+            if existing is not None:
+                summary = merge_summaries(existing, summary)
+            replace.append(summary)
+        self.replace_block_summaries(replace)
+
+    def replace_block_summaries(self, summaries):
+        """Replace the summaries of multiple blocks"""
+        start = 0
+        bulk_insert = self.bulk_insert
+        summaries_len = len(summaries)
+        row = '(?,?,?,?,?,?,?,?,?,?)'
+        query = 'REPLACE INTO gauged_block_summary VALUES '
+        execute = self.cursor.execute
+        while start < summaries_len:
+            rows = summaries[start:start+bulk_insert]
+            params = [param for params in rows for param in params]
+            insert = (row + ',') * (len(rows) - 1) + row
+            execute(query + insert, params)
+            start += bulk_insert
+
+    def get_block_summaries(self, namespace, key, start_offset, end_offset):
+        """Get a (data_points, total, minimum, maximum, sum_of_squares)
+        summary of each block between start_offset and end_offset
+        (inclusive)"""
+        cursor = self.cursor
+        cursor.execute('SELECT data_points, total, minimum, maximum, '
+                       'sum_of_squares FROM gauged_block_summary '
+                       'WHERE namespace = ? AND `key` = ? AND offset '
+                       'BETWEEN ? AND ?',
+                       (namespace, key, start_offset, end_offset))
+        return cursor.fetchall()
+
+    def add_rollups(self, rollups):
+        """Merge rollups into existing rollups. rollups must be a list of
+        tuples where each tuple consists of (namespace, offset, key, tier,
+        start, data_points, total, minimum, maximum, sum_of_squares)"""
+        if not self.upsert:
+            return self.merge_rollups(rollups)
+        start = 0
+        bulk_insert = self.bulk_insert
+        rollups_len = len(rollups)
+        row = '(?,?,?,?,?,?,?,?,?,?)'
+        query = 'INSERT INTO gauged_rollups VALUES '
+        update = ' ON CONFLICT (namespace, `key`, tier, start) ' \
+            'DO UPDATE SET ' \
+            'sum_of_squares = sum_of_squares + excluded.sum_of_squares + ' \
+            '(excluded.total * data_points - total * excluded.data_points) ' \
+            '* (excluded.total * data_points - total * excluded.data_points)' \
+            ' / (1.0 * data_points * excluded.data_points * ' \
+            '(data_points + excluded.data_points)),' \
+            'data_points = data_points + excluded.data_points,' \
+            'total = total + excluded.total,' \
+            'minimum = MIN(minimum, excluded.minimum),' \
+            'maximum = MAX(maximum, excluded.maximum)'
+        execute = self.cursor.execute
+        while start < rollups_len:
+            rows = rollups[start:start+bulk_insert]
+            params = [param for params in rows for param in params]
+            insert = (row + ',') * (len(rows) - 1) + row
+            execute(query + insert + update, params)
+            start += bulk_insert
+
+    def merge_rollups(self, rollups):
+        """Merge rollups one at a time, for SQLite versions without
+        UPSERT"""
+        cursor = self.cursor
+        replace = []
+        for rollup in rollups:
+            namespace, _, key, tier, start = rollup[:5]
+            cursor.execute('SELECT * FROM gauged_rollups WHERE namespace = ? '
+                           'AND `key` = ? AND tier = ? AND start = ?',
+                           (namespace, key, tier, start))
+            existing = cursor.fetchone()
+            if existing is not None:
+                rollup = merge_rollups(existing, rollup)
+            replace.append(rollup)
+        self.insert_rollups(replace)
+
+    def replace_rollups(self, rollups):
+        """Replace all rollups of the blocks which the rollups belong to"""
+        execute = self.cursor.execute
+        for block in set(rollup[:3] for rollup in rollups):
+            execute('DELETE FROM gauged_rollups WHERE namespace = ? '
+                    'AND offset = ? AND `key` = ?', block)
+        self.insert_rollups(rollups)
+
+    def insert_rollups(self, rollups):
+        """Insert rollups, replacing any with the same interval"""
+        start = 0
+        bulk_insert = self.bulk_insert
+        rollups_len = len(rollups)
+        row = '(?,?,?,?,?,?,?,?,?,?)'
+        query = 'REPLACE INTO gauged_rollups VALUES '
+        execute = self.cursor.execute
+        while start < rollups_len:
+            rows = rollups[start:start+bulk_insert]
+            params = [param for params in rows for param in params]
+            insert = (row + ',') * (len(rows) - 1) + row
+            execute(query + insert, params)
+            start += bulk_insert
+
+    def get_rollups(self, namespace, key, tier, start, end):
+        """Get a (start, data_points, total, minimum, maximum,
+        sum_of_squares) rollup of each interval of the tier which starts in
+        the range [start, end), in order"""
+        cursor = self.cursor
+        cursor.execute('SELECT start, data_points, total, minimum, maximum, '
+                       'sum_of_squares FROM gauged_rollups '
+                       'WHERE namespace = ? AND `key` = ? AND tier = ? '
+                       'AND start >= ? AND start < ? ORDER BY start',
+                       (namespace, key, tier, start, end))
+        return cursor.fetchall()
+
     def block_offset_bounds(self, namespace):
         """Get the minimum and maximum block offset for the specified
         namespace"""
@@ -182,6 +423,10 @@ class SQLiteDriver(DriverInterface):
         params = (namespace, )
         execute = self.cursor.execute
         execute('DELETE FROM gauged_data WHERE namespace = ?', params)
+        execute('DELETE FROM gauged_block_summary WHERE namespace = ?',
+                params)
+        execute('DELETE FROM gauged_rollups WHERE namespace = ?', params)
+        execute('DELETE FROM gauged_segments WHERE namespace = ?', params)
         execute('DELETE FROM gauged_statistics WHERE namespace = ?', params)
         execute('DELETE FROM gauged_keys WHERE namespace = ?', params)
         self.remove_cache(namespace)
@@ -190,12 +435,33 @@ class SQLiteDriver(DriverInterface):
         params = (offset, )
         execute = self.cursor.execute
         execute('DELETE FROM gauged_data WHERE offset >= ?', params)
+        execute('DELETE FROM gauged_block_summary WHERE offset >= ?', params)
+        execute('DELETE FROM gauged_rollups WHERE offset >= ?', params)
+        execute('DELETE FROM gauged_segments WHERE offset >= ?', params)
         execute('DELETE FROM gauged_statistics WHERE offset >= ? ', params)
         execute('DELETE FROM gauged_cache WHERE start + length >= ?',
                 (timestamp,))
         execute('UPDATE gauged_writer_history SET timestamp = ? '
                 'WHERE timestamp > ?', (timestamp, timestamp))
 
+    def expire_blocks(self, namespace, offset, timestamp):
+        """Remove the blocks of a namespace up to and including offset,
+        along with cached values which start before the timestamp"""
+        params = (namespace, offset)
+        execute = self.cursor.execute
+        execute('DELETE FROM gauged_data WHERE namespace = ? '
+                'AND offset <= ?', params)
+        execute('DELETE FROM gauged_block_summary WHERE namespace = ? '
+                'AND offset <= ?', params)
+        execute('DELETE FROM gauged_rollups WHERE namespace = ? '
+                'AND offset <= ?', params)
+        execute('DELETE FROM gauged_segments WHERE namespace = ? '
+                'AND offset <= ?', params)
+        execute('DELETE FROM gauged_statistics WHERE namespace = ? '
+                'AND offset <= ?', params)
+        execute('DELETE FROM gauged_cache WHERE namespace = ? '
+                'AND start < ?', (namespace, timestamp))
+
     def clear_key_before(self, key, namespace, offset=None, timestamp=None):
         namespace_key = (namespace, key)
         translated_key = self.lookup_ids((namespace_key,)).get(namespace_key)
@@ -204,6 +470,12 @@ class SQLiteDriver(DriverInterface):
             params = (translated_key, namespace, offset)
             execute('DELETE FROM gauged_data WHERE `key` = ? '
                     'AND namespace = ? AND offset <= ?', params)
+            execute('DELETE FROM gauged_block_summary WHERE `key` = ? '
+                    'AND namespace = ? AND offset <= ?', params)
+            execute('DELETE FROM gauged_rollups WHERE `key` = ? '
+                    'AND namespace = ? AND offset <= ?', params)
+            execute('DELETE FROM gauged_segments WHERE `key` = ? '
+                    'AND namespace = ? AND offset <= ?', params)
             params = (translated_key, namespace, timestamp)
             execute('DELETE FROM gauged_cache WHERE `key` = ? '
                     'AND namespace = ? AND start + length <= ?', params)
@@ -211,6 +483,12 @@ class SQLiteDriver(DriverInterface):
             params = (translated_key, namespace)
             execute('DELETE FROM gauged_data '
                     'WHERE `key` = ? AND namespace = ?', params)
+            execute('DELETE FROM gauged_block_summary '
+                    'WHERE `key` = ? AND namespace = ?', params)
+            execute('DELETE FROM gauged_rollups '
+                    'WHERE `key` = ? AND namespace = ?', params)
+            execute('DELETE FROM gauged_segments '
+                    'WHERE `key` = ? AND namespace = ?', params)
             execute('DELETE FROM gauged_keys '
                     'WHERE `key` = ? AND namespace = ?', params)
             self.remove_cache(namespace, translated_key)
@@ -223,6 +501,12 @@ class SQLiteDriver(DriverInterface):
             params = (translated_key, namespace, offset)
             execute('DELETE FROM gauged_data WHERE `key` = ? '
                     'AND namespace = ? AND offset >= ?', params)
+            execute('DELETE FROM gauged_block_summary WHERE `key` = ? '
+                    'AND namespace = ? AND offset >= ?', params)
+            execute('DELETE FROM gauged_rollups WHERE `key` = ? '
+                    'AND namespace = ? AND offset >= ?', params)
+            execute('DELETE FROM gauged_segments WHERE `key` = ? '
+                    'AND namespace = ? AND offset >= ?', params)
             params = (translated_key, namespace, timestamp)
             execute('DELETE FROM gauged_cache WHERE `key` = ? '
                     'AND namespace = ? AND start + length >= ?', params)
@@ -230,6 +514,12 @@ class SQLiteDriver(DriverInterface):
             params = (translated_key, namespace)
             execute('DELETE FROM gauged_data WHERE `key` = ? '
                     'AND namespace = ?', params)
+            execute('DELETE FROM gauged_block_summary WHERE `key` = ? '
+                    'AND namespace = ?', params)
+            execute('DELETE FROM gauged_rollups WHERE `key` = ? '
+                    'AND namespace = ?', params)
+            execute('DELETE FROM gauged_segments WHERE `key` = ? '
+                    'AND namespace = ?', params)
             execute('DELETE FROM gauged_keys WHERE `key` = ? '
                     'AND namespace = ?', params)
             self.remove_cache(namespace, translated_key)
@@ -288,6 +578,30 @@ class SQLiteDriver(DriverInterface):
                 'byte_count = byte_count + ? WHERE namespace = ? '
                 'AND offset = ?', (data_points, byte_count, namespace, offset))
 
+    def add_namespace_statistics_many(self, rows):
+        """Update namespace statistics for multiple (namespace, offset,
+        data_points, byte_count) rows"""
+        if not self.upsert:
+            return super(SQLiteDriver, self) \
+                .add_namespace_statistics_many(rows)
+        start = 0
+        bulk_insert = self.bulk_insert
+        rows_len = len(rows)
+        row = '(?,?,?,?)'
+        query = 'INSERT INTO gauged_statistics VALUES '
+        update = ' ON CONFLICT (namespace, offset) DO UPDATE SET ' \
+            'data_points = data_points + excluded.data_points,' \
+            'byte_count = byte_count + excluded.byte_count'
+        execute = self.cursor.execute
+        while start < rows_len:
+            batch = rows[start:start+bulk_insert]
+            params = []
+            for values in batch:
+                params.extend(values)
+            insert = (row + ',') * (len(batch) - 1) + row
+            execute(query + insert + update, params)
+            start += bulk_insert
+
     def get_namespace_statistics(self, namespace, start_offset, end_offset):
         """Get namespace statistics for the period between start_offset and
         end_offset (inclusive)"""
@@ -308,6 +622,40 @@ class SQLiteDriver(DriverInterface):
                 data BLOB,
                 flags UNSIGNED INT NOT NULL,
                 PRIMARY KEY (offset, namespace, `key`));
+            CREATE TABLE IF NOT EXISTS gauged_segments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                namespace UNSIGNED INT NOT NULL,
+                offset UNSIGNED INT NOT NULL,
+                `key` INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                flags UNSIGNED INT NOT NULL);
+            CREATE INDEX IF NOT EXISTS
+                gauged_segment_block ON gauged_segments
+                (namespace, offset, `key`, id);
+            CREATE TABLE IF NOT EXISTS gauged_block_summary (
+                namespace UNSIGNED INT NOT NULL,
+                offset UNSIGNED INT NOT NULL,
+                `key` INTEGER NOT NULL,
+                data_points UNSIGNED BIGINT NOT NULL,
+                total DOUBLE NOT NULL,
+                minimum FLOAT NOT NULL,
+                maximum FLOAT NOT NULL,
+                sum_of_squares DOUBLE NOT NULL,
+                earliest FLOAT NOT NULL,
+                latest FLOAT NOT NULL,
+                PRIMARY KEY (namespace, `key`, offset));
+            CREATE TABLE IF NOT EXISTS gauged_rollups (
+                namespace UNSIGNED INT NOT NULL,
+                offset UNSIGNED INT NOT NULL,
+                `key` INTEGER NOT NULL,
+                tier UNSIGNED BIGINT NOT NULL,
+                start UNSIGNED BIGINT NOT NULL,
+                data_points UNSIGNED BIGINT NOT NULL,
+                total DOUBLE NOT NULL,
+                minimum FLOAT NOT NULL,
+                maximum FLOAT NOT NULL,
+                sum_of_squares DOUBLE NOT NULL,
+                PRIMARY KEY (namespace, `key`, tier, start));
             CREATE TABLE IF NOT EXISTS gauged_keys (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 namespace UNSIGNED INT NOT NULL,
@@ -341,6 +689,9 @@ class SQLiteDriver(DriverInterface):
         """Clear all gauged data"""
         self.cursor.executescript("""
             DELETE FROM gauged_data;
+            DELETE FROM gauged_block_summary;
+            DELETE FROM gauged_rollups;
+            DELETE FROM gauged_segments;
             DELETE FROM gauged_keys;
             DELETE FROM gauged_writer_history;
             DELETE FROM gauged_cache;
@@ -352,6 +703,9 @@ class SQLiteDriver(DriverInterface):
         """Drop all gauged tables"""
         self.cursor.executescript("""
             DROP TABLE IF EXISTS gauged_data;
+            DROP TABLE IF EXISTS gauged_block_summary;
+            DROP TABLE IF EXISTS gauged_rollups;
+            DROP TABLE IF EXISTS gauged_segments;
             DROP TABLE IF EXISTS gauged_keys;
             DROP TABLE IF EXISTS gauged_writer_history;
             DROP TABLE IF EXISTS gauged_cache;
@@ -372,4 +726,43 @@ class SQLiteDriver(DriverInterface):
             value FLOAT,
             PRIMARY KEY (namespace, hash, length, start))
         """]
+        migrations['1.1.0'] = ["""
+        CREATE TABLE IF NOT EXISTS gauged_segments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            namespace UNSIGNED INT NOT NULL,
+            offset UNSIGNED INT NOT NULL,
+            `key` INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            flags UNSIGNED INT NOT NULL)
+        """, """
+        CREATE INDEX IF NOT EXISTS
+            gauged_segment_block ON gauged_segments
+            (namespace, offset, `key`, id)
+        """, """
+        CREATE TABLE IF NOT EXISTS gauged_block_summary (
+            namespace UNSIGNED INT NOT NULL,
+            offset UNSIGNED INT NOT NULL,
+            `key` INTEGER NOT NULL,
+            data_points UNSIGNED BIGINT NOT NULL,
+            total DOUBLE NOT NULL,
+            minimum FLOAT NOT NULL,
+            maximum FLOAT NOT NULL,
+            sum_of_squares DOUBLE NOT NULL,
+            earliest FLOAT NOT NULL,
+            latest FLOAT NOT NULL,
+            PRIMARY KEY (namespace, `key`, offset))
+        """, """
+        CREATE TABLE IF NOT EXISTS gauged_rollups (
+            namespace UNSIGNED INT NOT NULL,
+            offset UNSIGNED INT NOT NULL,
+            `key` INTEGER NOT NULL,
+            tier UNSIGNED BIGINT NOT NULL,
+            start UNSIGNED BIGINT NOT NULL,
+            data_points UNSIGNED BIGINT NOT NULL,
+            total DOUBLE NOT NULL,
+            minimum FLOAT NOT NULL,
+            maximum FLOAT NOT NULL,
+            sum_of_squares DOUBLE NOT NULL,
+            PRIMARY KEY (namespace, `key`, tier, start))
+        """]
         return migrations
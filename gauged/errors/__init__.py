@@ -54,3 +54,7 @@ class GaugedSchemaError(GaugedError):
 
 class GaugedMigrationError(GaugedError):
     """Occurs when migration logic fails"""
+
+
+class GaugedWorkerError(GaugedError):
+    """Occurs when a ShardedWriter worker process fails"""
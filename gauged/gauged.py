@@ -7,7 +7,9 @@ Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
 from time import time
 from warnings import warn
 from .writer import Writer
+from .sharded_writer import ShardedWriter
 from .context import Context
+from .archive import Archive
 from .drivers import get_driver, SQLiteDriver
 from .utilities import Time
 from .aggregates import Aggregate
@@ -33,6 +35,11 @@ class Gauged(object):
     IGNORE = Writer.IGNORE
     REWRITE = Writer.REWRITE
 
+    XOR = Writer.XOR
+
+    # The block flags this version can read
+    BLOCK_FLAGS = XOR
+
     AGGREGATES = Aggregate.ALL
     MIN = Aggregate.MIN
     MAX = Aggregate.MAX
@@ -47,7 +54,10 @@ class Gauged(object):
         in_memory = driver is None
         if in_memory:
             driver = SQLiteDriver.MEMORY
+        self.dsn = None
         if isinstance(driver, basestring):
+            if not in_memory:
+                self.dsn = driver
             driver = get_driver(driver)
         if config is None:
             config = Config()
@@ -56,6 +66,13 @@ class Gauged(object):
         self.driver = driver
         self.config = config
         self.valid_schema = False
+        self.summary_offset = None
+        self.rollup_offsets = {}
+        self.block_flags = 0
+        self.segmented_blocks = False
+        self.block_archive = None
+        if config.archive_path is not None:
+            self.block_archive = Archive(config.archive_path)
         if in_memory:
             self.sync()
 
@@ -63,74 +80,256 @@ class Gauged(object):
     def writer(self):
         """Create a new writer instance"""
         self.check_schema()
-        return Writer(self.driver, self.config)
+        self.record_writer_config()
+        return Writer(self.driver, self.config, self.block_archive)
+
+    def sharded_writer(self, shards=None, **kwargs):
+        """Create a writer which partitions keys across `shards` worker
+        processes (defaults to the number of CPUs). Each worker opens its own
+        connection, so Gauged must have been created with a connection
+        string"""
+        if self.dsn is None:
+            raise ValueError('A sharded writer requires a connection string')
+        self.check_schema()
+        with self.driver.lock:
+            self.record_writer_config()
+            self.driver.commit()
+        return ShardedWriter(self.driver, self.dsn, self.config, shards,
+                             **kwargs)
 
     def value(self, key, timestamp=None, namespace=None):
         """Get the value of a gauge at the specified time"""
-        return self.make_context(key=key, end=timestamp,
-                                 namespace=namespace).value()
+        with self.driver.lock:
+            return self.make_context(key=key, end=timestamp,
+                                     namespace=namespace).value()
 
     def aggregate(self, key, aggregate, start=None, end=None,
                   namespace=None, percentile=None):
         """Get an aggregate of all gauge data stored in the specified date
         range"""
-        return self.make_context(key=key, aggregate=aggregate, start=start,
-                                 end=end, namespace=namespace,
-                                 percentile=percentile).aggregate()
+        with self.driver.lock:
+            return self.make_context(key=key, aggregate=aggregate, start=start,
+                                     end=end, namespace=namespace,
+                                     percentile=percentile).aggregate()
 
     def value_series(self, key, start=None, end=None, interval=None,
                      namespace=None, cache=None):
         """Get a time series of gauge values"""
-        return self.make_context(key=key, start=start, end=end,
-                                 interval=interval, namespace=namespace,
-                                 cache=cache).value_series()
+        with self.driver.lock:
+            return self.make_context(key=key, start=start, end=end,
+                                     interval=interval, namespace=namespace,
+                                     cache=cache).value_series()
 
     def aggregate_series(self, key, aggregate, start=None, end=None,
                          interval=None, namespace=None, cache=None,
                          percentile=None):
         """Get a time series of gauge aggregates"""
-        return self.make_context(key=key, aggregate=aggregate, start=start,
-                                 end=end, interval=interval,
-                                 namespace=namespace, cache=cache,
-                                 percentile=percentile).aggregate_series()
+        with self.driver.lock:
+            return self.make_context(key=key, aggregate=aggregate, start=start,
+                                     end=end, interval=interval,
+                                     namespace=namespace, cache=cache,
+                                     percentile=percentile).aggregate_series()
 
     def keys(self, prefix=None, limit=None, offset=None, namespace=None):
         """Get gauge keys"""
-        return self.make_context(prefix=prefix, limit=limit, offset=offset,
-                                 namespace=namespace).keys()
+        with self.driver.lock:
+            return self.make_context(prefix=prefix, limit=limit, offset=offset,
+                                     namespace=namespace).keys()
 
     def namespaces(self):
         """Get a list of namespaces"""
-        return self.driver.get_namespaces()
+        with self.driver.lock:
+            return self.driver.get_namespaces()
 
     def statistics(self, start=None, end=None, namespace=None):
         """Get write statistics for the specified namespace and date range"""
-        return self.make_context(start=start, end=end,
-                                 namespace=namespace).statistics()
+        with self.driver.lock:
+            return self.make_context(start=start, end=end,
+                                     namespace=namespace).statistics()
+
+    def expire(self, timestamp=None):
+        """Remove the blocks of each namespace which ended before its
+        `retention` period, relative to the timestamp (defaults to now).
+        Blocks are removed one offset at a time, committing after each, so
+        that locks are only held briefly. Returns the number of blocks
+        removed from each namespace"""
+        self.check_schema()
+        if timestamp is None:
+            timestamp = long(time() * 1000)
+        driver = self.driver
+        block_size = self.config.block_size
+        expired = {}
+        for namespace in self.namespaces():
+            period = self.config.retention_period(namespace)
+            if period is None:
+                continue
+            cutoff = (timestamp - period) // block_size
+            count = 0
+            while True:
+                with driver.lock:
+                    offset = driver.block_offset_bounds(namespace)[0]
+                    if offset is None or offset >= cutoff:
+                        break
+                    driver.expire_blocks(namespace, offset,
+                                         (offset + 1) * block_size)
+                    driver.commit()
+                count += 1
+            if count and self.block_archive is not None:
+                self.block_archive.expire(namespace, cutoff - 1)
+            expired[namespace] = count
+        return expired
+
+    def compact(self, timestamp=None, namespace=None):
+        """Append the segments written with `segmented_blocks` to their
+        blocks, for blocks which ended before the timestamp or, by default,
+        every block before the last block of each namespace. Each namespace
+        is compacted in its own transaction. Returns the number of blocks
+        compacted in each namespace"""
+        self.check_schema()
+        driver = self.driver
+        if namespace is None:
+            namespaces = self.namespaces()
+        else:
+            namespaces = [namespace]
+        compacted = {}
+        for namespace in namespaces:
+            with driver.lock:
+                if timestamp is None:
+                    offset = driver.block_offset_bounds(namespace)[1]
+                    if offset is None:
+                        continue
+                else:
+                    offset = timestamp // self.config.block_size
+                compacted[namespace] = driver.compact_segments(namespace,
+                                                               offset)
+                driver.commit()
+        return compacted
+
+    def archive(self, timestamp=None):
+        """Move the blocks which ended more than `archive_after` before the
+        timestamp (defaults to now) from the driver to the archive in
+        `archive_path`. Each block offset is archived and then removed from
+        the driver in its own transaction. Returns the number of blocks
+        archived from each namespace"""
+        self.check_schema()
+        config = self.config
+        archive = self.block_archive
+        if archive is None or config.archive_after is None:
+            raise ValueError('Archiving requires `archive_path` and '
+                             '`archive_after`')
+        if timestamp is None:
+            timestamp = long(time() * 1000)
+        driver = self.driver
+        cutoff = (timestamp - config.archive_after) // config.block_size
+        archived = {}
+        for namespace in self.namespaces():
+            with driver.lock:
+                driver.compact_segments(namespace, cutoff)
+                driver.commit()
+                first, last = driver.block_offset_bounds(namespace)
+            start = max(first, archive.next_offset(namespace))
+            count = 0
+            for offset in xrange(start, min(cutoff, last + 1)):
+                with driver.lock:
+                    blocks = driver.get_blocks(namespace, offset)
+                if not blocks:
+                    continue
+                archive.append(namespace, offset, blocks)
+                with driver.lock:
+                    driver.remove_blocks(namespace, offset)
+                    driver.commit()
+                count += len(blocks)
+            archived[namespace] = count
+        return archived
 
     def sync(self):
-        """Create the necessary schema"""
-        self.driver.create_schema()
-        self.driver.set_metadata({
-            'current_version': Gauged.VERSION,
-            'initial_version': Gauged.VERSION,
-            'block_size': self.config.block_size,
-            'resolution': self.config.resolution,
-            'created_at': long(time() * 1000)
-        }, replace=False)
+        """Create the necessary schema. Blocks which already exist the first
+        time the schema is synced have no summary, so block summaries and
+        each rollup tier are only used after the last of them"""
+        driver = self.driver
+        with driver.lock:
+            driver.create_schema()
+            next_offset = self.next_block_offset()
+            metadata = {
+                'current_version': Gauged.VERSION,
+                'initial_version': Gauged.VERSION,
+                'block_size': self.config.block_size,
+                'resolution': self.config.resolution,
+                'created_at': long(time() * 1000)
+            }
+            if self.config.block_summaries:
+                metadata['summary_offset'] = next_offset
+            for tier in self.config.rollups:
+                metadata['rollup_offset_%s' % tier] = next_offset
+            driver.set_metadata(metadata, replace=False)
 
     def metadata(self):
         """Get gauged metadata"""
         try:
-            metadata = self.driver.all_metadata()
+            with self.driver.lock:
+                metadata = self.driver.all_metadata()
         except:  # pylint: disable=bare-except
             metadata = {}
         return metadata
 
+    def next_block_offset(self):
+        """Get the offset after the last block of any namespace"""
+        driver = self.driver
+        with driver.lock:
+            offsets = [driver.block_offset_bounds(namespace)[1]
+                       for namespace in driver.get_namespaces()]
+        offsets = [offset for offset in offsets if offset is not None]
+        return max(offsets) + 1 if offsets else 0
+
+    def record_writer_config(self):
+        """Record the flags a writer will set on blocks so that readers
+        which can't decode them are rejected, whether it writes segments
+        which readers need to look up, and where block summaries and each
+        rollup tier which haven't been written before start"""
+        driver = self.driver
+        config = self.config
+        flags = config.compression or 0
+        with driver.lock:
+            if flags & ~self.block_flags:
+                self.block_flags |= flags
+                driver.set_metadata({'block_flags': self.block_flags})
+            if config.segmented_blocks and not config.overwrite_blocks and \
+                    not self.segmented_blocks:
+                driver.set_metadata({'segmented_blocks': 1})
+                self.segmented_blocks = True
+            summaries = config.block_summaries and \
+                self.summary_offset is None
+            tiers = [tier for tier in self.config.rollups
+                     if tier not in self.rollup_offsets]
+            if summaries or tiers:
+                next_offset = self.next_block_offset()
+                metadata = {'rollup_offset_%s' % tier: next_offset
+                            for tier in tiers}
+                if summaries:
+                    metadata['summary_offset'] = next_offset
+                driver.set_metadata(metadata, replace=False)
+                if summaries:
+                    self.summary_offset = long(
+                        driver.get_metadata('summary_offset'))
+                for tier in tiers:
+                    self.rollup_offsets[tier] = long(driver.get_metadata(
+                        'rollup_offset_%s' % tier))
+
     def make_context(self, **kwargs):
         """Create a new context for reading data"""
         self.check_schema()
-        return Context(self.driver, self.config, **kwargs)
+        if self.block_archive is not None:
+            self.block_archive.refresh()
+        if not self.segmented_blocks:
+            # A writer in another process may have started writing segments
+            with self.driver.lock:
+                self.segmented_blocks = bool(long(
+                    self.driver.get_metadata('segmented_blocks') or 0))
+        return Context(self.driver, self.config,
+                       summary_offset=self.summary_offset,
+                       rollup_offsets=self.rollup_offsets,
+                       archive=self.block_archive,
+                       segments=self.segmented_blocks, **kwargs)
 
     def check_schema(self):
         """Check the schema exists and matches configuration"""
@@ -151,4 +350,16 @@ class Gauged(object):
         if block_size != expected_block_size:
             msg = 'Expected %s and got %s' % (expected_block_size, block_size)
             warn(msg, GaugedBlockSizeMismatch)
+        if config.block_summaries and 'summary_offset' in metadata:
+            self.summary_offset = long(metadata['summary_offset'])
+        block_flags = long(metadata.get('block_flags', 0))
+        if block_flags & ~Gauged.BLOCK_FLAGS:
+            msg = 'Blocks have been written with flags (%s) which this Gauged '
+            msg += 'version can\'t read. Try upgrading Gauged'
+            raise GaugedVersionMismatchError(msg % block_flags)
+        self.block_flags = block_flags
+        for tier in config.rollups:
+            key = 'rollup_offset_%s' % tier
+            if key in metadata:
+                self.rollup_offsets[tier] = long(metadata[key])
         self.valid_schema = True
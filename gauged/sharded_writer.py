@@ -0,0 +1,258 @@
+"""
+Gauged
+https://github.com/chriso/gauged (MIT Licensed)
+Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
+"""
+
+from copy import copy
+from time import time
+from cPickle import dumps, loads, HIGHEST_PROTOCOL
+from ctypes import c_char_p, c_size_t, c_uint32, create_string_buffer
+from itertools import izip
+from traceback import format_exc
+from multiprocessing import Process, Queue, cpu_count
+from Queue import Empty
+from .bridge import Gauged
+from .writer import Writer
+from .drivers import get_driver
+from .errors import GaugedUseAfterFreeError, GaugedWorkerError
+from .utilities import to_bytes
+
+
+class ShardedWriter(object):
+    """Partition gauges by key across a pool of writer processes. Each
+    shard has its own connection, C writer and writer name. Keys are
+    hashed in C and each shard is only sent its own gauges"""
+
+    def __init__(self, driver, dsn, config, shards=None, batch_size=1024,
+                 max_queued_batches=16):
+        self.driver = driver
+        self.config = config
+        self.shards = shards or cpu_count()
+        self.batch_size = batch_size
+        self.pending = [[] for _ in xrange(self.shards)]
+        self.pending_count = 0
+        self.latest = 0
+        self.failed = {}
+        self.reported = set()
+        self.results = Queue()
+        self.queues = []
+        self.workers = []
+        for shard in xrange(self.shards):
+            queue = Queue(max_queued_batches)
+            worker = Process(target=shard_worker,
+                             args=(dsn, self.shard_config(shard), shard,
+                                   queue, self.results))
+            worker.daemon = True
+            worker.start()
+            self.queues.append(queue)
+            self.workers.append(worker)
+
+    def shard_config(self, shard):
+        config = copy(self.config)
+        config.writer_name = self.shard_name(shard)
+        return config
+
+    def shard_name(self, shard):
+        return '%s.%d' % (self.config.writer_name, shard)
+
+    def add(self, data, value=None, timestamp=None, namespace=None):
+        """Queue a gauge or gauges to be written. `data` can be a key, a dict,
+        a list of (key, value) pairs or a urlencoded str or buffer"""
+        if value is not None:
+            data = ((data, value),)
+        if self.queues is None:
+            raise GaugedUseAfterFreeError
+        if timestamp is None:
+            timestamp = long(time() * 1000)
+        if namespace is None:
+            namespace = self.config.namespace
+        if isinstance(data, unicode):
+            data = data.encode('utf8')
+        elif isinstance(data, buffer):
+            data = str(data)
+        if isinstance(data, str):
+            split = route(data, self.shards)
+        else:
+            split = route_pairs(data, self.shards)
+        pending = self.pending
+        for shard, data in enumerate(split):
+            if data:
+                pending[shard].append((timestamp, namespace, data))
+                self.pending_count += 1
+        if timestamp > self.latest:
+            self.latest = timestamp
+        if self.pending_count >= self.batch_size:
+            self.send()
+
+    def add_many(self, timestamps, keys, values, namespace=None):
+        """Queue gauges from parallel sequences of timestamps, keys and
+        values"""
+        if len(keys) != len(timestamps) or len(values) != len(timestamps):
+            raise ValueError('timestamps, keys and values must be the '
+                             'same length')
+        add = self.add
+        for timestamp, key, value in zip(timestamps, keys, values):
+            add(((key, value),), timestamp=long(timestamp),
+                namespace=namespace)
+
+    def send(self):
+        """Send queued gauges to the shards. The latest timestamp is sent to
+        every shard so that all writer positions move forward together"""
+        self.check_errors()
+        latest = self.latest
+        for shard, queue in enumerate(self.queues):
+            queue.put(('write', latest,
+                       dumps(self.pending[shard], HIGHEST_PROTOCOL)))
+            self.pending[shard] = []
+        self.pending_count = 0
+
+    def flush(self):
+        """Flush all gauges and wait for the shards to commit them"""
+        if self.queues is None:
+            raise GaugedUseAfterFreeError
+        self.send()
+        for queue in self.queues:
+            queue.put(('flush',))
+        self.wait_for_shards()
+
+    def resume_from(self):
+        """Get a timestamp representing the position just after the last
+        gauge written by every shard"""
+        get_position = self.driver.get_writer_position
+        with self.driver.lock:
+            positions = [get_position(self.shard_name(shard))
+                         for shard in xrange(self.shards)]
+        if not all(positions):
+            return 0
+        return min(positions) + self.config.resolution
+
+    def check_errors(self):
+        results = self.results
+        while True:
+            try:
+                reply, shard, detail = results.get_nowait()
+            except Empty:
+                break
+            if reply == 'error':
+                self.failed.setdefault(shard, detail)
+        self.raise_errors()
+
+    def wait_for_shards(self):
+        waiting = set(xrange(self.shards)) - set(self.failed)
+        results = self.results
+        while waiting:
+            try:
+                reply, shard, detail = results.get(timeout=1)
+            except Empty:
+                for shard in list(waiting):
+                    worker = self.workers[shard]
+                    if not worker.is_alive():
+                        waiting.discard(shard)
+                        self.failed[shard] = 'Exited with code %s' % \
+                            worker.exitcode
+                continue
+            waiting.discard(shard)
+            if reply == 'error':
+                self.failed.setdefault(shard, detail)
+        self.raise_errors()
+
+    def raise_errors(self):
+        # Report every shard which has failed since the last check
+        failed = sorted(shard for shard in self.failed
+                        if shard not in self.reported)
+        if failed:
+            self.reported.update(failed)
+            raise GaugedWorkerError('\n'.join(
+                'Shard %s failed: %s' % (shard, self.failed[shard])
+                for shard in failed))
+
+    def cleanup(self):
+        queues = self.queues
+        if queues is None:
+            return
+        try:
+            self.send()
+        finally:
+            self.queues = None
+            for queue in queues:
+                queue.put(None)
+            try:
+                self.wait_for_shards()
+            finally:
+                for worker in self.workers:
+                    worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.cleanup()
+
+
+def route(pairs, shards):
+    """Split a urlencoded str into a str of pairs for each shard"""
+    length = len(pairs)
+    output = create_string_buffer(length + 1)
+    offsets = (c_size_t * (shards + 1))()
+    if not Gauged.writer_route(pairs, length, shards, output, offsets):
+        raise MemoryError
+    output = output.raw
+    # Drop the separator after each shard's last pair
+    return [output[start:end - 1]
+            for start, end in izip(offsets, offsets[1:])]
+
+
+def route_pairs(pairs, shards):
+    """Split a dict or sequence of (key, value) pairs into a list of pairs
+    for each shard"""
+    if isinstance(pairs, dict):
+        pairs = pairs.iteritems()
+    keys, values = [], []
+    for key, value in pairs:
+        keys.append(to_bytes(key))
+        values.append(value)
+    count = len(keys)
+    routes = (c_uint32 * count)()
+    Gauged.writer_route_keys((c_char_p * count)(*keys),
+                             (c_size_t * count)(*map(len, keys)), count,
+                             shards, routes)
+    split = [[] for _ in xrange(shards)]
+    for shard, key, value in izip(routes, keys, values):
+        split[shard].append((key, value))
+    return split
+
+
+def shard_worker(dsn, config, shard, queue, results):
+    """Write gauges received from a ShardedWriter"""
+    try:
+        writer = Writer(get_driver(dsn), config)
+        resume_from = writer.resume_from()
+        reorder = bool(config.reorder_window)
+        advanced = 0
+        while True:
+            message = queue.get()
+            if message is None:
+                break
+            elif message[0] == 'flush':
+                writer.flush()
+                writer.wait_for_flush()
+                results.put(('flushed', shard, None))
+                continue
+            _, latest, batch = message
+            for timestamp, namespace, data in loads(batch):
+                if timestamp >= resume_from:
+                    writer.add(data, timestamp=timestamp,
+                               namespace=namespace)
+            if not reorder and latest > advanced and latest >= resume_from:
+                position = writer.check_position(latest)
+                if position is not None:
+                    writer.seek(*position)
+                advanced = latest
+        writer.cleanup()
+        results.put(('closed', shard, None))
+    except Exception:  # pylint: disable=broad-except
+        results.put(('error', shard, format_exc()))
+        # Keep consuming so that the parent never blocks on a full queue
+        while queue.get() is not None:
+            pass
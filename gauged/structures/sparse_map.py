@@ -6,7 +6,7 @@ Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
 
 from ctypes import (create_string_buffer, c_void_p, py_object, byref,
                     cast, c_uint32, addressof, c_char, c_size_t, c_float)
-from ..bridge import Gauged, MapPtr, Uint32Ptr, FloatPtr
+from ..bridge import Gauged, MapPtr, MapSummary, Uint32Ptr, FloatPtr
 from ..errors import GaugedUseAfterFreeError
 from ..utilities import IS_PYPY
 
@@ -23,10 +23,11 @@ class SparseMap(object):
 
     __slots__ = ['_ptr']
 
-    def __init__(self, buf=None, length=0):
+    def __init__(self, buf=None, length=0, flags=0):
         """Create a new SparseMap. The constructor accepts a buffer and
         byte_length, a python dict containing { offset: array, ... }, or a
-        pointer to a C structure"""
+        pointer to a C structure. Buffers with non-zero block `flags` may
+        contain compressed segments and are decoded"""
         if isinstance(buf, dict):
             items = buf
             buf = None
@@ -47,7 +48,10 @@ class SparseMap(object):
                     buf_length = buf_length.value
                     buf = address
                 buf = cast(buf, Uint32Ptr)
-            self._ptr = Gauged.map_import(buf, length)
+            if flags:
+                self._ptr = Gauged.codec_decode(buf, length)
+            else:
+                self._ptr = Gauged.map_import(buf, length)
         if self._ptr is None:
             raise MemoryError
         SparseMap.ALLOCATIONS += 1
@@ -106,7 +110,7 @@ class SparseMap(object):
 
     def clear(self):
         """Clear the map"""
-        self.ptr.contents.length = 0
+        Gauged.map_clear(self.ptr)
 
     def first(self):
         """Get the first float in the map"""
@@ -116,6 +120,12 @@ class SparseMap(object):
         """Get the last float in the map"""
         return Gauged.map_last(self.ptr)
 
+    def last_before(self, position):
+        """Get the last float in arrays with a position less than the
+        specified position, or None if there are none"""
+        result = Gauged.map_last_before(self.ptr, position)
+        return None if result != result else result
+
     def sum(self):
         """Get the sum of all floats in the map"""
         return Gauged.map_sum(self.ptr)
@@ -145,6 +155,15 @@ class SparseMap(object):
         mean"""
         return Gauged.map_sum_of_squares(self.ptr, c_float(mean))
 
+    def summary(self):
+        """Get a (count, sum, min, max, sum_of_squares, first, last) summary
+        of the floats in the map, where the sum of squares is relative to
+        the mean"""
+        summary = MapSummary()
+        Gauged.map_summary(self.ptr, byref(summary))
+        return (summary.count, summary.sum, summary.min, summary.max,
+                summary.sum_of_squares, summary.first, summary.last)
+
     def percentile(self, percentile):
         """Get a percentile of all floats in the map. Since the sorting is
         done in-place, the map is no longer safe to use after calling this
@@ -20,6 +20,14 @@ def to_bytes(value):
     return value
 
 
+def to_float(value):
+    """Get the value as a float, or NaN if it isn't a number"""
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
+
+
 class Time(object):
     """Common time constants in milliseconds"""
 
@@ -58,3 +66,42 @@ def table_repr(columns, rows, data, padding=2):
 def to_datetime(milliseconds):
     """Convert a timestamp in milliseconds to a datetime"""
     return datetime.fromtimestamp(milliseconds // 1000)
+
+
+def merge_summaries(summary, appended):
+    """Merge two (namespace, offset, key, data_points, total, minimum,
+    maximum, sum_of_squares, earliest, latest) block summaries, where the
+    second summarizes data appended after the first"""
+    namespace, offset, key, count, total, minimum, maximum, \
+        sum_of_squares, earliest, _ = summary
+    _, _, _, other_count, other_total, other_minimum, other_maximum, \
+        other_sum_of_squares, _, latest = appended
+    sum_of_squares = merge_sum_of_squares(
+        count, total, sum_of_squares,
+        other_count, other_total, other_sum_of_squares)
+    return (namespace, offset, key, count + other_count, total + other_total,
+            min(minimum, other_minimum), max(maximum, other_maximum),
+            sum_of_squares, earliest, latest)
+
+
+def merge_rollups(rollup, appended):
+    """Merge two (namespace, offset, key, tier, start, data_points, total,
+    minimum, maximum, sum_of_squares) rollups of the same interval"""
+    count, total, minimum, maximum, sum_of_squares = rollup[5:]
+    other_count, other_total, other_minimum, other_maximum, \
+        other_sum_of_squares = appended[5:]
+    sum_of_squares = merge_sum_of_squares(
+        count, total, sum_of_squares,
+        other_count, other_total, other_sum_of_squares)
+    return rollup[:5] + (count + other_count, total + other_total,
+                         min(minimum, other_minimum),
+                         max(maximum, other_maximum), sum_of_squares)
+
+
+def merge_sum_of_squares(count, total, sum_of_squares,
+                         other_count, other_total, other_sum_of_squares):
+    """Combine the sums of squares (around their means) of two sets of
+    floats, using the parallel variance formula"""
+    difference = other_total * count - total * other_count
+    return sum_of_squares + other_sum_of_squares + difference * difference / \
+        (float(count) * other_count * (count + other_count))
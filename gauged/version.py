@@ -4,6 +4,6 @@ https://github.com/chriso/gauged (MIT Licensed)
 Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
 """
 
-__version__ = '1.0.1'
+__version__ = '1.1.0'
 
 __version_info__ = tuple([int(v) for v in __version__.split('.')])
@@ -0,0 +1,86 @@
+/*!
+ * Gauged
+ * https://github.com/chriso/gauged (MIT Licensed)
+ * Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
+ */
+
+#ifndef GAUGED_ARENA_H_
+#define GAUGED_ARENA_H_
+
+#include <stddef.h>
+
+/**
+ * An arena which hands out memory from large chunks. Individual
+ * allocations are never freed; instead the whole arena is reset at once
+ * and its chunks are reused. Buffers which grow by doubling can be
+ * released back to the arena and are recycled by size class.
+ */
+
+#define GAUGED_ARENA_CLASSES 48
+
+typedef struct gauged_arena_chunk_s {
+    struct gauged_arena_chunk_s *next;
+    size_t size;
+    size_t used;
+} gauged_arena_chunk_t;
+
+typedef struct gauged_arena_s {
+    size_t chunks;
+    size_t bytes_reserved;
+    size_t bytes_used;
+    size_t bytes_recycled;
+    size_t allocations;
+    size_t resets;
+    size_t chunk_size;
+    gauged_arena_chunk_t *head;
+    gauged_arena_chunk_t *spare;
+    void *recycled[GAUGED_ARENA_CLASSES];
+} gauged_arena_t;
+
+/**
+ * The size of the first chunk. Subsequent chunks double in size up to
+ * GAUGED_ARENA_MAX_CHUNK.
+ */
+
+#define GAUGED_ARENA_INITIAL_CHUNK (64 * 1024)
+#define GAUGED_ARENA_MAX_CHUNK (4 * 1024 * 1024)
+
+/**
+ * Create a new arena.
+ */
+
+gauged_arena_t *gauged_arena_new(void);
+
+/**
+ * Free the arena and all memory allocated from it.
+ */
+
+void gauged_arena_free(gauged_arena_t *);
+
+/**
+ * Allocate memory from the arena.
+ */
+
+void *gauged_arena_alloc(gauged_arena_t *, size_t);
+
+/**
+ * Allocate a buffer whose size in bytes is a power of two, reusing a
+ * released buffer of the same size if one is available.
+ */
+
+void *gauged_arena_alloc_buffer(gauged_arena_t *, size_t);
+
+/**
+ * Release a buffer allocated with gauged_arena_alloc_buffer so that it
+ * can be recycled.
+ */
+
+void gauged_arena_release_buffer(gauged_arena_t *, void *, size_t);
+
+/**
+ * Invalidate all allocations. Chunks are kept for reuse.
+ */
+
+void gauged_arena_reset(gauged_arena_t *);
+
+#endif
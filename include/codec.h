@@ -0,0 +1,55 @@
+/*!
+ * Gauged
+ * https://github.com/chriso/gauged (MIT Licensed)
+ * Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
+ */
+
+#ifndef GAUGED_CODEC_H_
+#define GAUGED_CODEC_H_
+
+#include <stddef.h>
+#include <stdint.h>
+
+#include "map.h"
+
+/**
+ * Block compression. A compressed segment is stored in place of the arrays
+ * it encodes, so that segments appended to a block by later flushes can be
+ * either compressed or raw:
+ *
+ * <marker><words><arrays><bitstream...>
+ *
+ * The marker is a long array header with a length of zero, which a map
+ * never contains. <words> is the length of the bitstream in 32-bit words
+ * and <arrays> is the number of arrays it encodes.
+ *
+ * For each array the bitstream holds the delta-of-delta of its position,
+ * its length (or a single bit if it has the same length as the previous
+ * array) and its floats. Each float is XOR'd with the previous float and
+ * only the meaningful bits of the result are stored, as described in
+ * "Gorilla: A Fast, Scalable, In-Memory Time Series Database".
+ */
+
+#define GAUGED_CODEC_NONE 0
+#define GAUGED_CODEC_XOR 1
+
+#define GAUGED_CODEC_MARKER 0
+#define GAUGED_CODEC_HEADER 3
+
+/**
+ * Encode a map buffer (with a length in bytes) as a compressed segment.
+ * The output map is cleared first. If compression doesn't reduce the size
+ * of the buffer, the raw arrays are copied instead.
+ */
+
+int gauged_codec_encode(gauged_map_t *, const uint32_t *, size_t);
+
+/**
+ * Decode a block (with a length in bytes) containing any mix of compressed
+ * segments and raw arrays. Returns NULL if the block is malformed or if
+ * memory can't be allocated.
+ */
+
+gauged_map_t *gauged_codec_decode(const uint32_t *, size_t);
+
+#endif
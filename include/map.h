@@ -26,12 +26,32 @@
  *                 PPPPPPPP PPPPPPPP PPPPPPPP PPPPPPPP
  */
 
+typedef struct gauged_map_index_s gauged_map_index_t;
+
 typedef struct gauged_map_s {
     uint32_t *buffer;
     size_t size;
     size_t length;
+    gauged_map_index_t *index;
 } gauged_map_t;
 
+/**
+ * A sparse skip index which records the word offset of every Nth array in
+ * the map, so that a position can be found with a binary search and a walk
+ * over at most N arrays. The index isn't stored with the map; it's built
+ * the first time the map is searched and extended as arrays are appended.
+ */
+
+struct gauged_map_index_s {
+    size_t *offsets;
+    size_t size;
+    size_t length;
+    size_t words;
+    size_t arrays;
+};
+
+#define GAUGED_MAP_INDEX_INTERVAL 16
+
 /**
  * Create a new map.
  */
@@ -70,12 +90,26 @@ void gauged_map_clear(gauged_map_t *);
 
 gauged_map_t *gauged_map_import(const uint32_t *, size_t);
 
+/**
+ * Ensure the map can hold another N words without being resized.
+ */
+
+int gauged_map_reserve(gauged_map_t *, size_t);
+
 /**
  * Append an array to end of the map.
  */
 
 int gauged_map_append(gauged_map_t *, uint32_t, const gauged_array_t *);
 
+/**
+ * Get the word offset of the first array with a position greater than or
+ * equal to the specified position, or the length of the map if there are
+ * none.
+ */
+
+size_t gauged_map_seek(gauged_map_t *, uint32_t);
+
 /**
  * Slice and concatenate a map on to another.
  */
@@ -83,7 +117,7 @@ int gauged_map_append(gauged_map_t *, uint32_t, const gauged_array_t *);
 #define GAUGED_MAP_START 0
 #define GAUGED_MAP_END 0
 
-int gauged_map_concat(gauged_map_t *a, const gauged_map_t *b, uint32_t start,
+int gauged_map_concat(gauged_map_t *a, gauged_map_t *b, uint32_t start,
                       uint32_t end, uint32_t offset);
 
 /**
@@ -98,6 +132,13 @@ float gauged_map_first(const gauged_map_t *);
 
 float gauged_map_last(const gauged_map_t *);
 
+/**
+ * Get the last float in arrays with a position less than the specified
+ * position, or NaN if there are none.
+ */
+
+float gauged_map_last_before(gauged_map_t *, uint32_t);
+
 /**
  * Get the sum of all floats in the map.
  */
@@ -140,6 +181,47 @@ float gauged_map_sum_of_squares(const gauged_map_t *, float mean);
 
 float gauged_map_count(const gauged_map_t *);
 
+/**
+ * Summary statistics for a map. The sum of squares is relative to the
+ * mean, so that summaries can be combined without losing precision. The
+ * floats are NaN if the map is empty.
+ */
+
+typedef struct gauged_map_summary_s {
+    size_t count;
+    double sum;
+    float min;
+    float max;
+    double sum_of_squares;
+    float first;
+    float last;
+} gauged_map_summary_t;
+
+/**
+ * Summarize the floats in the map.
+ */
+
+void gauged_map_summary(const gauged_map_t *, gauged_map_summary_t *);
+
+/**
+ * A summary of the floats in one interval of a map.
+ */
+
+typedef struct gauged_map_rollup_s {
+    uint32_t position;
+    gauged_map_summary_t summary;
+} gauged_map_rollup_t;
+
+/**
+ * Summarize the floats in each interval of N positions which contains an
+ * array, in order. The position of each rollup is the first position in
+ * its interval. At most `size` rollups are written, which is enough if
+ * there's room for one per array. Returns the number of rollups.
+ */
+
+size_t gauged_map_rollup(const gauged_map_t *, uint32_t interval,
+                         gauged_map_rollup_t *, size_t size);
+
 /**
  * Get a percentile of all floats in the map. Note that this function
  * uses the buffer to sort the floats in-place. You'll need to create
@@ -9,6 +9,7 @@
 
 #include <stdbool.h>
 
+#include "arena.h"
 #include "hash.h"
 #include "map.h"
 
@@ -24,18 +25,110 @@ typedef struct gauged_writer_hash_node_s {
     uint32_t seed;
     struct gauged_writer_hash_node_s *next;
     struct gauged_writer_hash_node_s *array_next;
+    uint32_t key_id;
 } gauged_writer_hash_node_t;
 
+/**
+ * The pending hash is an open addressing table using Robin Hood hashing.
+ * Each bucket stores the key's hash inline so that most probes don't need
+ * to touch the node, and `distance` is one more than the bucket's distance
+ * from the key's ideal position (zero when the bucket is empty). When the
+ * table is 7/8 full a table twice the size is allocated, and nodes are
+ * moved to it GAUGED_WRITER_HASH_MIGRATE buckets at a time on each insert
+ * rather than all at once. Lookups check both tables until the move is
+ * complete. `bytes` and `active` count the data and the keys which are
+ * waiting to be written.
+ */
+
+typedef struct gauged_writer_hash_bucket_s {
+    uint32_t seed;
+    uint32_t distance;
+    gauged_writer_hash_node_t *node;
+} gauged_writer_hash_bucket_t;
+
 typedef struct gauged_writer_hash_s {
-    gauged_writer_hash_node_t **nodes;
+    gauged_writer_hash_bucket_t *buckets;
     size_t size;
     size_t count;
     gauged_writer_hash_node_t *head;
     gauged_writer_hash_node_t *tail;
     gauged_writer_hash_node_t *array_head;
     gauged_writer_hash_node_t *array_tail;
+    gauged_arena_t *arena;
+    size_t bytes;
+    size_t lookups;
+    size_t probes;
+    gauged_writer_hash_bucket_t *old_buckets;
+    size_t old_size;
+    size_t migrated;
+    size_t active;
 } gauged_writer_hash_t;
 
+/**
+ * A table of key IDs which persists across flushes. Key ID zero means
+ * that the key hasn't been resolved. The table is cleared when it holds
+ * `capacity` keys.
+ */
+
+typedef struct gauged_writer_key_s {
+    char *key;
+    uint32_t namespace_;
+    uint32_t seed;
+    uint32_t id;
+} gauged_writer_key_t;
+
+typedef struct gauged_writer_keys_s {
+    gauged_writer_key_t *slots;
+    size_t size;
+    size_t count;
+    size_t capacity;
+    gauged_arena_t *arena;
+} gauged_writer_keys_t;
+
+/**
+ * A list of key prefixes.
+ */
+
+typedef struct gauged_writer_prefixes_s {
+    char **prefixes;
+    size_t *lengths;
+    size_t count;
+} gauged_writer_prefixes_t;
+
+/**
+ * Keys which were skipped by the last call to gauged_writer_emit_pairs
+ * because their value wasn't a number or the key was too large. The first
+ * GAUGED_WRITER_MAX_ERRORS keys are stored along with their status, while
+ * the counts cover every skipped key. Keys are valid until the next call.
+ */
+
+#define GAUGED_WRITER_MAX_ERRORS 16
+
+typedef struct gauged_writer_errors_s {
+    size_t nan_count;
+    size_t overflow_count;
+    size_t count;
+    int statuses[GAUGED_WRITER_MAX_ERRORS];
+    char *keys[GAUGED_WRITER_MAX_ERRORS];
+} gauged_writer_errors_t;
+
+/**
+ * A registered key. The handle caches the key's pending node, which is
+ * only used while `generation` matches the writer's generation. The
+ * writer's generation changes whenever pending nodes are released, i.e.
+ * on a hard flush or when the pending hash is detached.
+ */
+
+typedef struct gauged_writer_handle_s {
+    char *key;
+    size_t key_length;
+    uint32_t namespace_;
+    uint32_t seed;
+    int status;
+    size_t generation;
+    gauged_writer_hash_node_t *node;
+} gauged_writer_handle_t;
+
 typedef struct gauged_writer_s {
     gauged_writer_hash_t *pending;
     size_t max_key;
@@ -43,26 +136,49 @@ typedef struct gauged_writer_s {
     char **buffer;
     size_t buffer_size;
     gauged_xxhash_t hash;
+    gauged_writer_keys_t *keys;
+    gauged_writer_keys_t *whitelist;
+    gauged_writer_prefixes_t allow;
+    gauged_writer_prefixes_t deny;
+    gauged_writer_errors_t errors;
+    size_t copy_size;
+    size_t buffer_capacity;
+    char *partial;
+    size_t partial_length;
+    size_t partial_size;
+    bool streaming;
+    gauged_writer_handle_t *handles;
+    size_t handle_count;
+    size_t handle_size;
+    gauged_writer_keys_t *handle_keys;
+    size_t generation;
 } gauged_writer_t;
 
 /**
- * The initial size of the hash tables.
+ * The initial size of the hash tables, and the number of buckets moved to
+ * a larger pending hash on each insert.
  */
 
 #define GAUGED_WRITER_HASH_INITIAL 16
+#define GAUGED_WRITER_HASH_MIGRATE 64
 
 /**
- * gauged_writer_parse parameters
+ * The initial size of the buffers used to parse query strings. They grow
+ * as required, so there's no limit on the size of a query.
  */
 
-#define GAUGED_WRITER_MAX_QUERY 32768
-#define GAUGED_WRITER_MAX_PAIRS 4096
+#define GAUGED_WRITER_BUFFER_INITIAL 256
 
 /**
- * Create a new writer.
+ * Create a new writer. Up to `key_cache_size` key IDs are remembered
+ * across flushes, and the pending hash is sized to hold `expected_keys`
+ * keys without growing.
  */
 
-gauged_writer_t *gauged_writer_new(size_t max_key);
+gauged_writer_t *gauged_writer_new(size_t max_key, size_t key_cache_size,
+                                   size_t expected_keys);
+
+#define GAUGED_WRITER_KEYS_INITIAL 1024
 
 /**
  * Free the specified writer.
@@ -75,17 +191,143 @@ void gauged_writer_free(gauged_writer_t *);
  */
 
 #define GAUGED_KEY_OVERFLOW -1
+#define GAUGED_KEY_FILTERED -2
+#define GAUGED_GAUGE_NAN -3
 
 int gauged_writer_emit(gauged_writer_t *, uint32_t namespace_, const char *key,
                        float value);
 
 /**
- * Emit multiple key/value pairs as a urlencoded string.
+ * Only accept the specified keys. Keys which aren't whitelisted (or
+ * matched by an allowed prefix) are skipped by the emit functions with a
+ * status of GAUGED_KEY_FILTERED. An empty whitelist rejects every key
+ * which isn't matched by an allowed prefix.
+ */
+
+int gauged_writer_whitelist(gauged_writer_t *, const char **keys,
+                            size_t count);
+
+/**
+ * Set the list of allowed (`allow` = true) or denied key prefixes. When
+ * allowed prefixes are set, keys must match one of them or the whitelist.
+ * Keys matching a denied prefix are always rejected.
+ */
+
+int gauged_writer_prefixes(gauged_writer_t *, const char **prefixes,
+                           size_t count, bool allow);
+
+/**
+ * Check whether the key passes the whitelist and prefix filters.
+ */
+
+bool gauged_writer_accept(gauged_writer_t *, const char *key,
+                          size_t key_length);
+
+/**
+ * Emit a batch of namespace, key and value triples. Keys are passed with
+ * their lengths so that they don't need to be NUL-terminated. NaN values
+ * are skipped. The status of each emit is stored in `statuses` (if
+ * non-NULL) and `data_points` is incremented for each value written.
+ */
+
+int gauged_writer_emit_batch(gauged_writer_t *, const uint32_t *namespaces,
+                             const char **keys, const size_t *key_lengths,
+                             const float *values, size_t count, int *statuses,
+                             uint32_t *data_points);
+
+/**
+ * Find the first pair of a batch which the writer would reject, checking
+ * for NaN values if `nan` is set and keys which are too long if `overflow`
+ * is set. Keys which are filtered out are never rejected. Returns
+ * GAUGED_OK if there's no such pair, or GAUGED_GAUGE_NAN or
+ * GAUGED_KEY_OVERFLOW with the pair's position stored in `index`. Nothing
+ * is emitted, so a batch can be rejected as a whole.
+ */
+
+int gauged_writer_check_batch(gauged_writer_t *, const char **keys,
+                              const size_t *key_lengths, const float *values,
+                              size_t count, bool nan, bool overflow,
+                              size_t *index);
+
+/**
+ * Register a key and store its handle in `handle`. Values can then be
+ * emitted for the key with gauged_writer_emit_handles without hashing it.
+ * Registering the same key again gives the same handle. Handles remain
+ * valid for the life of the writer. Returns the status which emitting the
+ * key would have (GAUGED_OK, GAUGED_KEY_FILTERED or GAUGED_KEY_OVERFLOW);
+ * values for filtered or overflowing keys are skipped.
+ */
+
+int gauged_writer_register(gauged_writer_t *, uint32_t namespace_,
+                           const char *key, size_t key_length,
+                           uint32_t *handle);
+
+/**
+ * Emit a batch of values for registered keys. NaN values are skipped and
+ * recorded in the writer's error buffer. Unknown handles are skipped with
+ * a status of GAUGED_KEY_FILTERED.
+ */
+
+int gauged_writer_emit_handles(gauged_writer_t *, const uint32_t *handles,
+                               const float *values, size_t count,
+                               int *statuses, uint32_t *data_points);
+
+/**
+ * Emit multiple key/value pairs as a urlencoded string. Pairs with a value
+ * that isn't a number, or with a key that's too large, are skipped and
+ * recorded in the writer's error buffer. Keys are decoded in place unless
+ * they contain escapes, and values are parsed without regard to locale.
  */
 
 int gauged_writer_emit_pairs(gauged_writer_t *, uint32_t namespace_,
                              const char *pairs, uint32_t *data_points);
 
+/**
+ * Copy the errors from the last call to gauged_writer_emit_pairs.
+ */
+
+void gauged_writer_errors(const gauged_writer_t *, gauged_writer_errors_t *);
+
+/**
+ * Emit multiple key/value pairs from a urlencoded buffer of the specified
+ * length. The buffer doesn't need to be NUL-terminated. An unfinished
+ * chunked stream is discarded.
+ */
+
+int gauged_writer_emit_pairs_length(gauged_writer_t *, uint32_t namespace_,
+                                    const char *pairs, size_t length,
+                                    uint32_t *data_points);
+
+/**
+ * Emit key/value pairs from one chunk of a urlencoded stream. A pair which
+ * is split across chunks is held by the writer until the next chunk
+ * arrives. Set `last` on the final chunk. Errors are collected across the
+ * whole stream.
+ */
+
+int gauged_writer_emit_pairs_chunk(gauged_writer_t *, uint32_t namespace_,
+                                   const char *chunk, size_t length, bool last,
+                                   uint32_t *data_points);
+
+/**
+ * Partition the key/value pairs of a urlencoded buffer across `shards`
+ * writers by the hash of each (decoded) key. The pairs of shard `i` are
+ * copied to `output` between `offsets[i]` and `offsets[i + 1]`, each
+ * followed by a separator. `output` must have room for `length + 1` bytes
+ * and `offsets` for `shards + 1` offsets. Pairs without a key are dropped.
+ */
+
+int gauged_writer_route(const char *pairs, size_t length, uint32_t shards,
+                        char *output, size_t *offsets);
+
+/**
+ * Store the shard of each key in `routes`, as gauged_writer_route would.
+ */
+
+void gauged_writer_route_keys(const char **keys, const size_t *key_lengths,
+                              size_t count, uint32_t shards,
+                              uint32_t *routes);
+
 /**
  * Parse a query string into the writer buffer.
  */
@@ -99,9 +341,70 @@ void gauged_writer_parse_query(gauged_writer_t *writer, const char *);
 int gauged_writer_flush_arrays(gauged_writer_t *writer, uint32_t offset);
 
 /**
- * Flush pending maps.
+ * Flush pending maps. A soft flush clears the maps but keeps the keys, while
+ * a hard flush releases all pending keys, arrays and maps back to the arena.
  */
 
 int gauged_writer_flush_maps(gauged_writer_t *writer, bool soft);
 
+/**
+ * Statistics about the pending hash. Byte counts cover the data held in
+ * pending maps and arrays, while capacities include unused space in their
+ * buffers. Lookups and probes are counted since the last hard flush.
+ */
+
+typedef struct gauged_writer_stats_s {
+    size_t keys;
+    size_t map_bytes;
+    size_t map_capacity;
+    size_t array_bytes;
+    size_t array_capacity;
+    size_t hash_size;
+    size_t lookups;
+    size_t probes;
+} gauged_writer_stats_t;
+
+void gauged_writer_stats(const gauged_writer_t *, gauged_writer_stats_t *);
+
+/**
+ * Store pointers to up to `max` pending nodes which don't have a key ID.
+ * Returns the number of nodes stored.
+ */
+
+size_t gauged_writer_unresolved(gauged_writer_t *,
+                                gauged_writer_hash_node_t **nodes, size_t max);
+
+/**
+ * Assign key IDs to nodes returned by gauged_writer_unresolved and remember
+ * them for subsequent flushes.
+ */
+
+int gauged_writer_resolve(gauged_writer_t *, gauged_writer_hash_node_t **nodes,
+                          const uint32_t *ids, size_t count);
+
+/**
+ * Export the namespace, key ID, map buffer and map length in bytes of each
+ * node with a non-empty map. The arrays must have room for `hash->count`
+ * elements. Returns the number of maps exported.
+ */
+
+size_t gauged_writer_export(const gauged_writer_hash_t *, uint32_t *namespaces,
+                            uint32_t *key_ids, uint32_t **buffers,
+                            size_t *lengths);
+
+/**
+ * Detach the pending hash from the writer and replace it with an empty one
+ * so that the detached maps can be flushed while writing continues. Values
+ * in the array that is still being written are moved to the new hash.
+ * Returns NULL on failure, in which case the writer is unchanged.
+ */
+
+gauged_writer_hash_t *gauged_writer_detach(gauged_writer_t *writer);
+
+/**
+ * Free a hash returned by gauged_writer_detach.
+ */
+
+void gauged_writer_detached_free(gauged_writer_hash_t *);
+
 #endif
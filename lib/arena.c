@@ -0,0 +1,160 @@
+/*!
+ * Gauged - https://github.com/chriso/gauged
+ * Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
+ */
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "arena.h"
+#include "common.h"
+
+#define GAUGED_ARENA_ALIGN(size) (((size) + 7) & ~(size_t)7)
+
+#define GAUGED_ARENA_CHUNK_DATA(chunk) \
+    ((char *)(chunk) + GAUGED_ARENA_ALIGN(sizeof(gauged_arena_chunk_t)))
+
+GAUGED_EXPORT gauged_arena_t *gauged_arena_new() {
+    gauged_arena_t *arena = calloc(1, sizeof(gauged_arena_t));
+    if (!arena) {
+        return NULL;
+    }
+    arena->chunk_size = GAUGED_ARENA_INITIAL_CHUNK;
+    return arena;
+}
+
+static inline void gauged_arena_chunks_free(gauged_arena_chunk_t *chunk) {
+    gauged_arena_chunk_t *next;
+    for (; chunk; chunk = next) {
+        next = chunk->next;
+        free(chunk);
+    }
+}
+
+GAUGED_EXPORT void gauged_arena_free(gauged_arena_t *arena) {
+    gauged_arena_chunks_free(arena->head);
+    gauged_arena_chunks_free(arena->spare);
+    free(arena);
+}
+
+static gauged_arena_chunk_t *gauged_arena_chunk_new(gauged_arena_t *arena,
+                                                    size_t size) {
+    gauged_arena_chunk_t *chunk =
+        malloc(GAUGED_ARENA_ALIGN(sizeof(gauged_arena_chunk_t)) + size);
+    if (!chunk) {
+        return NULL;
+    }
+    chunk->size = size;
+    chunk->used = 0;
+    arena->chunks++;
+    arena->bytes_reserved += size;
+    return chunk;
+}
+
+static gauged_arena_chunk_t *gauged_arena_chunk_reuse(gauged_arena_t *arena,
+                                                      size_t size) {
+    gauged_arena_chunk_t **spare = &arena->spare, *chunk;
+    for (; *spare; spare = &(*spare)->next) {
+        if ((*spare)->size >= size) {
+            chunk = *spare;
+            *spare = chunk->next;
+            chunk->used = 0;
+            return chunk;
+        }
+    }
+    return NULL;
+}
+
+GAUGED_EXPORT void *gauged_arena_alloc(gauged_arena_t *arena, size_t size) {
+    size = GAUGED_ARENA_ALIGN(size);
+    gauged_arena_chunk_t *chunk = arena->head;
+    if (!chunk || chunk->size - chunk->used < size) {
+        // Reuse a chunk from before the last reset if one is large enough
+        chunk = gauged_arena_chunk_reuse(arena, size);
+        if (!chunk && size > arena->chunk_size / 4) {
+            // Give large allocations their own chunk so that the space
+            // left in the current chunk isn't wasted
+            chunk = gauged_arena_chunk_new(arena, size);
+            if (!chunk) {
+                return NULL;
+            }
+            if (arena->head) {
+                chunk->next = arena->head->next;
+                arena->head->next = chunk;
+                chunk->used = size;
+                arena->bytes_used += size;
+                arena->allocations++;
+                return GAUGED_ARENA_CHUNK_DATA(chunk);
+            }
+        } else if (!chunk) {
+            chunk = gauged_arena_chunk_new(arena, arena->chunk_size);
+            if (!chunk) {
+                return NULL;
+            }
+            if (arena->chunk_size < GAUGED_ARENA_MAX_CHUNK) {
+                arena->chunk_size *= 2;
+            }
+        }
+        chunk->next = arena->head;
+        arena->head = chunk;
+    }
+    void *ptr = GAUGED_ARENA_CHUNK_DATA(chunk) + chunk->used;
+    chunk->used += size;
+    arena->bytes_used += size;
+    arena->allocations++;
+    return ptr;
+}
+
+static inline size_t gauged_arena_class(size_t size) {
+    size_t class = 0;
+    while (size > 1) {
+        size >>= 1;
+        class++;
+    }
+    return class;
+}
+
+GAUGED_EXPORT void *gauged_arena_alloc_buffer(gauged_arena_t *arena,
+                                              size_t size) {
+    size_t class = gauged_arena_class(size);
+    void *buffer = arena->recycled[class];
+    if (buffer) {
+        memcpy(&arena->recycled[class], buffer, sizeof(void *));
+        arena->bytes_recycled -= size;
+        return buffer;
+    }
+    return gauged_arena_alloc(arena, size < sizeof(void *) ? sizeof(void *)
+                                                           : size);
+}
+
+GAUGED_EXPORT void gauged_arena_release_buffer(gauged_arena_t *arena,
+                                               void *buffer, size_t size) {
+    if (size < sizeof(void *)) {
+        return;
+    }
+    size_t class = gauged_arena_class(size);
+    memcpy(buffer, &arena->recycled[class], sizeof(void *));
+    arena->recycled[class] = buffer;
+    arena->bytes_recycled += size;
+}
+
+GAUGED_EXPORT void gauged_arena_reset(gauged_arena_t *arena) {
+    gauged_arena_chunk_t *chunk, *next;
+    for (chunk = arena->head; chunk; chunk = next) {
+        next = chunk->next;
+        if (chunk->size > GAUGED_ARENA_MAX_CHUNK) {
+            arena->chunks--;
+            arena->bytes_reserved -= chunk->size;
+            free(chunk);
+        } else {
+            chunk->next = arena->spare;
+            arena->spare = chunk;
+        }
+    }
+    arena->head = NULL;
+    memset(arena->recycled, 0, sizeof(arena->recycled));
+    arena->bytes_used = 0;
+    arena->bytes_recycled = 0;
+    arena->resets++;
+}
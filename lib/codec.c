@@ -0,0 +1,327 @@
+/*!
+ * Gauged - https://github.com/chriso/gauged
+ * Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
+ */
+
+#include <stdlib.h>
+#include <string.h>
+
+#include "array.h"
+#include "codec.h"
+
+// The most bits needed to encode an array header and a float
+#define GAUGED_CODEC_ARRAY_BITS 137
+#define GAUGED_CODEC_FLOAT_BITS 44
+
+typedef struct gauged_codec_writer_s {
+    uint32_t *buffer;
+    size_t length;
+    uint64_t bits;
+    unsigned count;
+} gauged_codec_writer_t;
+
+typedef struct gauged_codec_reader_s {
+    const uint32_t *buffer;
+    size_t length;
+    size_t offset;
+    uint64_t bits;
+    unsigned count;
+    int overflow;
+} gauged_codec_reader_t;
+
+static inline uint32_t gauged_codec_mask(uint32_t value, unsigned width) {
+    return width < 32 ? value & (((uint32_t)1 << width) - 1) : value;
+}
+
+static inline unsigned gauged_codec_leading(uint32_t value) {
+#ifdef __GNUC__
+    return (unsigned)__builtin_clz(value);
+#else
+    unsigned count = 0;
+    for (; !(value & 0x80000000); value <<= 1) {
+        count++;
+    }
+    return count;
+#endif
+}
+
+static inline unsigned gauged_codec_trailing(uint32_t value) {
+#ifdef __GNUC__
+    return (unsigned)__builtin_ctz(value);
+#else
+    unsigned count = 0;
+    for (; !(value & 1); value >>= 1) {
+        count++;
+    }
+    return count;
+#endif
+}
+
+static inline void gauged_codec_write(gauged_codec_writer_t *writer,
+                                      uint32_t value, unsigned width) {
+    writer->bits = (writer->bits << width) | gauged_codec_mask(value, width);
+    writer->count += width;
+    if (writer->count >= 32) {
+        writer->count -= 32;
+        writer->buffer[writer->length++] =
+            (uint32_t)(writer->bits >> writer->count);
+    }
+}
+
+static inline void gauged_codec_write_flush(gauged_codec_writer_t *writer) {
+    if (writer->count) {
+        writer->buffer[writer->length++] =
+            (uint32_t)(writer->bits << (32 - writer->count));
+        writer->count = 0;
+    }
+}
+
+static inline uint32_t gauged_codec_read(gauged_codec_reader_t *reader,
+                                         unsigned width) {
+    if (reader->count < width) {
+        if (reader->offset == reader->length) {
+            reader->overflow = 1;
+            return 0;
+        }
+        reader->bits = (reader->bits << 32) | reader->buffer[reader->offset++];
+        reader->count += 32;
+    }
+    reader->count -= width;
+    return gauged_codec_mask((uint32_t)(reader->bits >> reader->count), width);
+}
+
+static inline size_t gauged_codec_remaining(
+    const gauged_codec_reader_t *reader) {
+    return (reader->length - reader->offset) * 32 + reader->count;
+}
+
+// Small integers are written with a short prefix, and zero with a single bit
+
+static inline void gauged_codec_write_integer(gauged_codec_writer_t *writer,
+                                              uint64_t value) {
+    if (!value) {
+        gauged_codec_write(writer, 0, 1);
+    } else if (value < (1 << 6)) {
+        gauged_codec_write(writer, 2, 2);
+        gauged_codec_write(writer, (uint32_t)value, 6);
+    } else if (value < (1 << 13)) {
+        gauged_codec_write(writer, 6, 3);
+        gauged_codec_write(writer, (uint32_t)value, 13);
+    } else if (value < (1 << 20)) {
+        gauged_codec_write(writer, 14, 4);
+        gauged_codec_write(writer, (uint32_t)value, 20);
+    } else {
+        gauged_codec_write(writer, 15, 4);
+        gauged_codec_write(writer, (uint32_t)(value >> 32), 32);
+        gauged_codec_write(writer, (uint32_t)value, 32);
+    }
+}
+
+static inline uint64_t gauged_codec_read_integer(
+    gauged_codec_reader_t *reader) {
+    if (!gauged_codec_read(reader, 1)) {
+        return 0;
+    } else if (!gauged_codec_read(reader, 1)) {
+        return gauged_codec_read(reader, 6);
+    } else if (!gauged_codec_read(reader, 1)) {
+        return gauged_codec_read(reader, 13);
+    } else if (!gauged_codec_read(reader, 1)) {
+        return gauged_codec_read(reader, 20);
+    }
+    uint64_t high = gauged_codec_read(reader, 32);
+    return (high << 32) | gauged_codec_read(reader, 32);
+}
+
+static inline uint64_t gauged_codec_zigzag(int64_t value) {
+    return value < 0 ? ((uint64_t)(-(value + 1)) << 1) | 1
+                     : (uint64_t)value << 1;
+}
+
+static inline int64_t gauged_codec_unzigzag(uint64_t value) {
+    return value & 1 ? -(int64_t)(value >> 1) - 1 : (int64_t)(value >> 1);
+}
+
+static inline uint32_t gauged_codec_float_bits(float value) {
+    uint32_t bits;
+    memcpy(&bits, &value, sizeof(bits));
+    return bits;
+}
+
+static inline float gauged_codec_bits_float(uint32_t bits) {
+    float value;
+    memcpy(&value, &bits, sizeof(value));
+    return value;
+}
+
+GAUGED_EXPORT int gauged_codec_encode(gauged_map_t *out,
+                                      const uint32_t *buffer, size_t size) {
+    size_t length = size / sizeof(uint32_t), header, array_length;
+    size_t bits = 0, arrays = 0, words;
+    uint32_t *raw = (uint32_t *)buffer, *end = raw + length, *it, position;
+    float *values;
+    gauged_map_clear(out);
+    for (it = raw; it < end;) {
+        it = gauged_map_advance(it, &header, &position, &array_length, NULL);
+        bits += GAUGED_CODEC_ARRAY_BITS;
+        bits += GAUGED_CODEC_FLOAT_BITS * array_length;
+        arrays++;
+    }
+    words = GAUGED_CODEC_HEADER + bits / 32 + 1;
+    if (!gauged_map_reserve(out, words > length ? words : length)) {
+        return GAUGED_ERROR;
+    }
+    gauged_codec_writer_t writer = {out->buffer + GAUGED_CODEC_HEADER, 0, 0,
+                                    0};
+    int64_t previous_position = 0, previous_delta = 0, delta;
+    size_t previous_length = 0;
+    uint32_t previous = 0, current, xor;
+    unsigned leading, trailing, window_leading = 33, window_trailing = 0;
+    for (it = raw; it < end;) {
+        it = gauged_map_advance(it, &header, &position, &array_length,
+                                &values);
+        delta = (int64_t)position - previous_position;
+        gauged_codec_write_integer(&writer,
+                                   gauged_codec_zigzag(delta - previous_delta));
+        previous_position = position;
+        previous_delta = delta;
+        if (array_length == previous_length) {
+            gauged_codec_write(&writer, 0, 1);
+        } else {
+            gauged_codec_write(&writer, 1, 1);
+            gauged_codec_write_integer(&writer, array_length);
+            previous_length = array_length;
+        }
+        for (size_t i = 0; i < array_length; i++) {
+            current = gauged_codec_float_bits(values[i]);
+            xor = current ^ previous;
+            previous = current;
+            if (!xor) {
+                gauged_codec_write(&writer, 0, 1);
+                continue;
+            }
+            leading = gauged_codec_leading(xor);
+            trailing = gauged_codec_trailing(xor);
+            // Reuse the previous window if the meaningful bits fit and the
+            // window isn't so wide that a new one would be smaller
+            if (leading >= window_leading && trailing >= window_trailing &&
+                leading + trailing <= window_leading + window_trailing + 10) {
+                gauged_codec_write(&writer, 2, 2);
+                gauged_codec_write(&writer, xor >> window_trailing,
+                                   32 - window_leading - window_trailing);
+            } else {
+                gauged_codec_write(&writer, 3, 2);
+                gauged_codec_write(&writer, leading, 5);
+                gauged_codec_write(&writer, 31 - leading - trailing, 5);
+                gauged_codec_write(&writer, xor >> trailing,
+                                   32 - leading - trailing);
+                window_leading = leading;
+                window_trailing = trailing;
+            }
+        }
+    }
+    gauged_codec_write_flush(&writer);
+    if (GAUGED_CODEC_HEADER + writer.length >= length) {
+        memcpy(out->buffer, buffer, length * sizeof(uint32_t));
+        out->length = length;
+        return GAUGED_OK;
+    }
+    out->buffer[0] = GAUGED_CODEC_MARKER;
+    out->buffer[1] = (uint32_t)writer.length;
+    out->buffer[2] = (uint32_t)arrays;
+    out->length = GAUGED_CODEC_HEADER + writer.length;
+    return GAUGED_OK;
+}
+
+static int gauged_codec_decode_segment(gauged_map_t *map,
+                                       gauged_array_t *array,
+                                       const uint32_t *buffer, size_t words,
+                                       size_t arrays) {
+    gauged_codec_reader_t reader = {buffer, words, 0, 0, 0, 0};
+    int64_t position = 0, delta = 0;
+    uint64_t array_length = 0;
+    uint32_t value = 0, xor;
+    unsigned leading, meaningful, window_leading = 33, window_trailing = 0;
+    for (size_t i = 0; i < arrays; i++) {
+        delta += gauged_codec_unzigzag(gauged_codec_read_integer(&reader));
+        position += delta;
+        if (gauged_codec_read(&reader, 1)) {
+            array_length = gauged_codec_read_integer(&reader);
+        }
+        if (reader.overflow || position < 0 || position > UINT32_MAX ||
+            !array_length || array_length >= 0x40000000 ||
+            array_length > gauged_codec_remaining(&reader)) {
+            return GAUGED_ERROR;
+        }
+        gauged_array_clear(array);
+        for (size_t j = 0; j < array_length; j++) {
+            if (gauged_codec_read(&reader, 1)) {
+                if (gauged_codec_read(&reader, 1)) {
+                    leading = gauged_codec_read(&reader, 5);
+                    meaningful = gauged_codec_read(&reader, 5) + 1;
+                    if (leading + meaningful > 32) {
+                        return GAUGED_ERROR;
+                    }
+                    window_leading = leading;
+                    window_trailing = 32 - leading - meaningful;
+                } else if (window_leading > 32) {
+                    return GAUGED_ERROR;
+                }
+                meaningful = 32 - window_leading - window_trailing;
+                xor = gauged_codec_read(&reader, meaningful);
+                value ^= xor << window_trailing;
+            }
+            if (!gauged_array_append(array, gauged_codec_bits_float(value))) {
+                return GAUGED_ERROR;
+            }
+        }
+        if (reader.overflow ||
+            !gauged_map_append(map, (uint32_t)position, array)) {
+            return GAUGED_ERROR;
+        }
+    }
+    return GAUGED_OK;
+}
+
+GAUGED_EXPORT gauged_map_t *gauged_codec_decode(const uint32_t *buffer,
+                                                size_t size) {
+    gauged_map_t *map = gauged_map_new();
+    gauged_array_t *array = gauged_array_new();
+    if (!map || !array) {
+        goto error;
+    }
+    const uint32_t *end = buffer + size / sizeof(uint32_t);
+    gauged_array_t raw;
+    size_t header, remaining;
+    uint32_t position;
+    while (buffer < end) {
+        remaining = (size_t)(end - buffer);
+        if (*buffer == GAUGED_CODEC_MARKER) {
+            if (remaining < GAUGED_CODEC_HEADER ||
+                buffer[1] > remaining - GAUGED_CODEC_HEADER ||
+                !gauged_codec_decode_segment(
+                    map, array, buffer + GAUGED_CODEC_HEADER, buffer[1],
+                    buffer[2])) {
+                goto error;
+            }
+            buffer += GAUGED_CODEC_HEADER + buffer[1];
+            continue;
+        }
+        header = *buffer & 0x80000000 ? 1 : 2;
+        raw.length =
+            header == 1 ? (*buffer >> 22) & 0x1FF : *buffer & 0x3FFFFFFF;
+        if (header > remaining || raw.length > remaining - header) {
+            goto error;
+        }
+        buffer = gauged_map_advance((uint32_t *)buffer, &header, &position,
+                                    &raw.length, &raw.buffer);
+        if (!gauged_map_append(map, position, &raw)) {
+            goto error;
+        }
+    }
+    gauged_array_free(array);
+    return map;
+error:
+    if (map) gauged_map_free(map);
+    if (array) gauged_array_free(array);
+    return NULL;
+}
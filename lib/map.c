@@ -19,6 +19,7 @@ GAUGED_EXPORT gauged_map_t *gauged_map_import(const uint32_t *buffer,
         return NULL;
     }
     map->length = 0;
+    map->index = NULL;
     map->size = size ? size / sizeof(uint32_t) : GAUGED_MAP_INITIAL_SIZE;
     map->buffer = malloc(map->size * sizeof(uint32_t));
     if (!map->buffer) {
@@ -39,10 +40,20 @@ GAUGED_EXPORT gauged_map_t *gauged_map_new() {
 }
 
 GAUGED_EXPORT void gauged_map_free(gauged_map_t *map) {
+    if (map->index) {
+        free(map->index->offsets);
+        free(map->index);
+    }
     free(map->buffer);
     free(map);
 }
 
+static inline void gauged_map_index_reset(gauged_map_t *map) {
+    if (map->index) {
+        map->index->length = map->index->words = map->index->arrays = 0;
+    }
+}
+
 static inline int gauged_map_resize(gauged_map_t *map, size_t size) {
     size_t new_size = map->size;
     while (new_size < size) {
@@ -59,6 +70,10 @@ static inline int gauged_map_resize(gauged_map_t *map, size_t size) {
     return GAUGED_OK;
 }
 
+GAUGED_EXPORT int gauged_map_reserve(gauged_map_t *map, size_t words) {
+    return gauged_map_resize(map, map->length + words);
+}
+
 GAUGED_EXPORT size_t gauged_map_length(const gauged_map_t *map) {
     return map->length * sizeof(uint32_t);
 }
@@ -67,7 +82,10 @@ GAUGED_EXPORT uint32_t *gauged_map_export(const gauged_map_t *map) {
     return map->buffer;
 }
 
-GAUGED_EXPORT void gauged_map_clear(gauged_map_t *map) { map->length = 0; }
+GAUGED_EXPORT void gauged_map_clear(gauged_map_t *map) {
+    map->length = 0;
+    gauged_map_index_reset(map);
+}
 
 GAUGED_EXPORT uint32_t *gauged_map_advance(uint32_t *buffer, size_t *header,
                                            uint32_t *position, size_t *length,
@@ -87,6 +105,86 @@ GAUGED_EXPORT uint32_t *gauged_map_advance(uint32_t *buffer, size_t *header,
     return *header + *length + buffer;
 }
 
+static inline uint32_t gauged_map_position(const uint32_t *buffer) {
+    return *buffer & 0x80000000 ? *buffer & 0x3FFFFF : buffer[1];
+}
+
+// Extend the index until it covers every array with a position less than
+// the specified position. Arrays past that point are indexed by later
+// searches, so a single search costs no more than walking the map
+
+static int gauged_map_index_extend(gauged_map_t *map, uint32_t position) {
+    gauged_map_index_t *index = map->index;
+    if (!index) {
+        index = calloc(1, sizeof(gauged_map_index_t));
+        if (!index) {
+            return GAUGED_ERROR;
+        }
+        map->index = index;
+    } else if (index->words > map->length) {
+        gauged_map_index_reset(map);
+    }
+    if (index->length &&
+        gauged_map_position(map->buffer + index->offsets[index->length - 1]) >=
+            position) {
+        return GAUGED_OK;
+    }
+    uint32_t *buffer = map->buffer + index->words,
+             *end = map->buffer + map->length, current;
+    size_t header, length, size, *offsets;
+    while (buffer < end && gauged_map_position(buffer) < position) {
+        if (!(index->arrays % GAUGED_MAP_INDEX_INTERVAL)) {
+            if (index->length == index->size) {
+                size = index->size ? index->size * 2 : GAUGED_MAP_INITIAL_SIZE;
+                offsets = realloc(index->offsets, size * sizeof(size_t));
+                if (!offsets) {
+                    gauged_map_index_reset(map);
+                    return GAUGED_ERROR;
+                }
+                index->offsets = offsets;
+                index->size = size;
+            }
+            index->offsets[index->length++] = (size_t)(buffer - map->buffer);
+        }
+        buffer = gauged_map_advance(buffer, &header, &current, &length, NULL);
+        index->arrays++;
+    }
+    index->words = (size_t)(buffer - map->buffer);
+    return GAUGED_OK;
+}
+
+// Find the word offset of an array with a position less than the specified
+// position, from which a walk of at most GAUGED_MAP_INDEX_INTERVAL arrays
+// reaches the position
+
+static size_t gauged_map_index_search(gauged_map_t *map, uint32_t position) {
+    if (!gauged_map_index_extend(map, position)) {
+        return 0;
+    }
+    size_t low = 0, high = map->index->length, middle;
+    const size_t *offsets = map->index->offsets;
+    while (low < high) {
+        middle = low + (high - low) / 2;
+        if (gauged_map_position(map->buffer + offsets[middle]) < position) {
+            low = middle + 1;
+        } else {
+            high = middle;
+        }
+    }
+    return low ? offsets[low - 1] : 0;
+}
+
+GAUGED_EXPORT size_t gauged_map_seek(gauged_map_t *map, uint32_t position) {
+    uint32_t *buffer = map->buffer + gauged_map_index_search(map, position),
+             *end = map->buffer + map->length;
+    size_t header, length;
+    uint32_t current;
+    while (buffer < end && gauged_map_position(buffer) < position) {
+        buffer = gauged_map_advance(buffer, &header, &current, &length, NULL);
+    }
+    return (size_t)(buffer - map->buffer);
+}
+
 static inline size_t gauged_map_header_size(uint32_t position, size_t length) {
     assert(length < 0x80000000);
     return (position > ((1 << 22) - 1) || length > ((1 << 9) - 1)) + 1;
@@ -123,20 +221,22 @@ GAUGED_EXPORT int gauged_map_append(gauged_map_t *map, uint32_t position,
     return GAUGED_OK;
 }
 
-GAUGED_EXPORT int gauged_map_concat(gauged_map_t *a, const gauged_map_t *b,
+GAUGED_EXPORT int gauged_map_concat(gauged_map_t *a, gauged_map_t *b,
                                     uint32_t start, uint32_t end,
                                     uint32_t offset) {
-    size_t initial_length = a->length;
-    gauged_array_t *array;
-    uint32_t position;
-    GAUGED_MAP_FOREACH(b, position, array) {
-        if (position < start) {
-            continue;
-        }
+    size_t initial_length = a->length, header;
+    gauged_array_t array;
+    uint32_t position, *buffer = b->buffer, *last = b->buffer + b->length;
+    if (start) {
+        buffer += gauged_map_seek(b, start);
+    }
+    while (buffer < last) {
+        buffer = gauged_map_advance(buffer, &header, &position, &array.length,
+                                    &array.buffer);
         if (end && position >= end) {
             break;
         }
-        if (!gauged_map_append(a, position + offset, array)) {
+        if (!gauged_map_append(a, position + offset, &array)) {
             a->length = initial_length;
             return GAUGED_ERROR;
         }
@@ -169,6 +269,7 @@ static inline gauged_array_t *gauged_map_merge(gauged_map_t *map) {
     map->buffer = replacement->buffer;
     map->size = replacement->size;
     map->length = 0;
+    gauged_map_index_reset(map);
     free(replacement);
     return merged;
 error:
@@ -200,6 +301,21 @@ GAUGED_EXPORT float gauged_map_last(const gauged_map_t *map) {
     return result;
 }
 
+GAUGED_EXPORT float gauged_map_last_before(gauged_map_t *map,
+                                          uint32_t position) {
+    uint32_t *buffer = map->buffer + gauged_map_index_search(map, position),
+             *end = map->buffer + map->length, current;
+    size_t header, length;
+    float *array, result = NAN;
+    while (buffer < end && gauged_map_position(buffer) < position) {
+        buffer = gauged_map_advance(buffer, &header, &current, &length, &array);
+        if (length) {
+            result = array[length - 1];
+        }
+    }
+    return result;
+}
+
 GAUGED_EXPORT float gauged_map_sum(const gauged_map_t *map) {
     gauged_array_t *array;
     double result = 0;
@@ -284,6 +400,76 @@ GAUGED_EXPORT float gauged_map_count(const gauged_map_t *map) {
     return result;
 }
 
+static void gauged_map_summarize(uint32_t *start, uint32_t *end,
+                                 gauged_map_summary_t *summary) {
+    float *array, element = 0, min = INFINITY, max = -INFINITY;
+    double sum = 0, mean, sum_of_squares = 0;
+    size_t count = 0, header, length;
+    uint32_t *buffer, position;
+    summary->first = summary->last = NAN;
+    for (buffer = start; buffer < end;) {
+        buffer =
+            gauged_map_advance(buffer, &header, &position, &length, &array);
+        if (!count && length) {
+            summary->first = array[0];
+        }
+        count += length;
+        for (size_t i = 0; i < length; i++) {
+            element = array[i];
+            sum += element;
+            if (element < min) {
+                min = element;
+            }
+            if (element > max) {
+                max = element;
+            }
+        }
+    }
+    if (count) {
+        summary->last = element;
+        mean = sum / (double)count;
+        for (buffer = start; buffer < end;) {
+            buffer =
+                gauged_map_advance(buffer, &header, &position, &length, &array);
+            for (size_t i = 0; i < length; i++) {
+                sum_of_squares += (array[i] - mean) * (array[i] - mean);
+            }
+        }
+    }
+    summary->count = count;
+    summary->sum = sum;
+    summary->min = count ? min : NAN;
+    summary->max = count ? max : NAN;
+    summary->sum_of_squares = sum_of_squares;
+}
+
+GAUGED_EXPORT void gauged_map_summary(const gauged_map_t *map,
+                                      gauged_map_summary_t *summary) {
+    gauged_map_summarize(map->buffer, map->buffer + map->length, summary);
+}
+
+GAUGED_EXPORT size_t gauged_map_rollup(const gauged_map_t *map,
+                                       uint32_t interval,
+                                       gauged_map_rollup_t *rollups,
+                                       size_t size) {
+    uint32_t *buffer = map->buffer, *end = map->buffer + map->length, *start;
+    uint32_t position, bucket;
+    size_t count = 0, header, length;
+    while (buffer < end && count < size) {
+        start = buffer;
+        bucket = gauged_map_position(buffer) / interval;
+        while (buffer < end &&
+               gauged_map_position(buffer) / interval == bucket) {
+            buffer =
+                gauged_map_advance(buffer, &header, &position, &length, NULL);
+        }
+        rollups[count].position = bucket * interval;
+        gauged_map_summarize(start, buffer, &rollups[count].summary);
+        count++;
+    }
+    return count;
+}
+
 GAUGED_EXPORT int gauged_map_percentile(gauged_map_t *map, float percentile,
                                         float *result_) {
     if (!map->length || percentile < 0 || percentile > 100 ||
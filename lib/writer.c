@@ -10,179 +10,1008 @@
 
 #include "writer.h"
 
-static inline void gauged_writer_hash_node_free(
-    gauged_writer_hash_node_t *node) {
-    gauged_map_free(node->map);
-    gauged_array_free(node->array);
-    free(node->key);
-    free(node);
-}
+/**
+ * Hash nodes are allocated from the hash's arena along with their array
+ * and map so that a new key costs a single (usually malloc-free) arena
+ * allocation, and a block rollover frees every node at once.
+ */
+
+typedef struct gauged_writer_hash_slot_s {
+    gauged_writer_hash_node_t node;
+    gauged_array_t array;
+    gauged_map_t map;
+} gauged_writer_hash_slot_t;
 
 static inline gauged_writer_hash_t *gauged_writer_hash_new(size_t size) {
     gauged_writer_hash_t *hash = calloc(1, sizeof(gauged_writer_hash_t));
     if (!hash) {
         goto error;
     }
-    hash->nodes = calloc(size, sizeof(gauged_writer_hash_node_t *));
-    if (!hash->nodes) {
+    hash->buckets = calloc(size, sizeof(gauged_writer_hash_bucket_t));
+    hash->arena = gauged_arena_new();
+    if (!hash->buckets || !hash->arena) {
         goto error;
     }
     hash->size = size;
     return hash;
 error:
-    if (hash) free(hash);
+    if (hash) {
+        if (hash->buckets) free(hash->buckets);
+        if (hash->arena) gauged_arena_free(hash->arena);
+        free(hash);
+    }
     return NULL;
 }
 
 static inline void gauged_writer_hash_free(gauged_writer_hash_t *hash) {
-    gauged_writer_hash_node_t *node;
-    for (uint32_t i = 0; i < hash->size; i++) {
-        if (hash->nodes[i]) {
-            node = hash->nodes[i];
-            gauged_writer_hash_node_free(node);
+    gauged_arena_free(hash->arena);
+    free(hash->buckets);
+    free(hash->old_buckets);
+    free(hash);
+}
+
+static inline size_t gauged_writer_hash_size(size_t expected_keys) {
+    size_t size = GAUGED_WRITER_HASH_INITIAL;
+    while (size - size / 8 <= expected_keys) {
+        size *= 2;
+    }
+    return size;
+}
+
+static inline int gauged_writer_array_append(gauged_arena_t *arena,
+                                             gauged_array_t *array,
+                                             float value) {
+    if (array->length == array->size) {
+        size_t size = array->size * sizeof(float);
+        float *buffer = gauged_arena_alloc_buffer(arena, size * 2);
+        if (!buffer) {
+            return GAUGED_ERROR;
         }
+        memcpy(buffer, array->buffer, array->length * sizeof(float));
+        gauged_arena_release_buffer(arena, array->buffer, size);
+        array->buffer = buffer;
+        array->size *= 2;
     }
-    free(hash->nodes);
-    free(hash);
+    array->buffer[array->length++] = value;
+    return GAUGED_OK;
 }
 
-static int gauged_writer_hash_rehash(gauged_writer_hash_t *);
+static inline int gauged_writer_map_append(gauged_arena_t *arena,
+                                           gauged_map_t *map,
+                                           uint32_t position,
+                                           const gauged_array_t *array) {
+    // Make room for the array and a long header up front so that
+    // gauged_map_append() never needs to realloc the arena buffer
+    size_t required = map->length + array->length + 2;
+    if (required > map->size) {
+        size_t size = map->size;
+        while (size < required) {
+            size *= 2;
+        }
+        uint32_t *buffer =
+            gauged_arena_alloc_buffer(arena, size * sizeof(uint32_t));
+        if (!buffer) {
+            return GAUGED_ERROR;
+        }
+        memcpy(buffer, map->buffer, map->length * sizeof(uint32_t));
+        gauged_arena_release_buffer(arena, map->buffer,
+                                    map->size * sizeof(uint32_t));
+        map->buffer = buffer;
+        map->size = size;
+    }
+    return gauged_map_append(map, position, array);
+}
 
-static inline gauged_writer_hash_node_t *gauged_writer_hash_get(
-    gauged_writer_hash_t *hash, uint32_t namespace_, const char *key,
+static inline gauged_writer_hash_node_t *gauged_writer_hash_find(
+    gauged_writer_hash_t *hash, const gauged_writer_hash_bucket_t *buckets,
+    size_t size, uint32_t namespace_, const char *key, size_t key_length,
     uint32_t seed) {
-    size_t mask = hash->size - 1;
-    size_t hash_key = seed & mask;
+    size_t mask = size - 1;
+    const gauged_writer_hash_bucket_t *bucket;
     gauged_writer_hash_node_t *node;
-    for (uint32_t j = 1; j < hash->size; j++) {
-        if (!hash->nodes[hash_key]) {
-            break;
+    size_t i = seed & mask;
+    for (uint32_t distance = 1;; distance++, i = (i + 1) & mask) {
+        hash->probes++;
+        bucket = &buckets[i];
+        // Buckets are ordered by distance, so the key can't be any further
+        if (bucket->distance < distance) {
+            return NULL;
         }
-        node = hash->nodes[hash_key];
-        if (node->seed == seed && node->namespace_ == namespace_ &&
-            !strcmp(key, node->key)) {
-            return node;
+        if (bucket->seed == seed) {
+            node = bucket->node;
+            if (node->namespace_ == namespace_ &&
+                !strncmp(key, node->key, key_length) &&
+                node->key[key_length] == '\0') {
+                return node;
+            }
         }
-        hash_key = (seed + j * j) & mask;
     }
-    return NULL;
+}
+
+static inline gauged_writer_hash_node_t *gauged_writer_hash_get(
+    gauged_writer_hash_t *hash, uint32_t namespace_, const char *key,
+    size_t key_length, uint32_t seed) {
+    hash->lookups++;
+    gauged_writer_hash_node_t *node =
+        gauged_writer_hash_find(hash, hash->buckets, hash->size, namespace_,
+                                key, key_length, seed);
+    if (!node && hash->old_buckets) {
+        node = gauged_writer_hash_find(hash, hash->old_buckets,
+                                       hash->old_size, namespace_, key,
+                                       key_length, seed);
+    }
+    return node;
+}
+
+static inline void gauged_writer_hash_put(gauged_writer_hash_bucket_t *buckets,
+                                          size_t size, uint32_t seed,
+                                          gauged_writer_hash_node_t *node) {
+    size_t mask = size - 1;
+    gauged_writer_hash_bucket_t entry = {seed, 1, node}, displaced;
+    for (size_t i = seed & mask;; i = (i + 1) & mask) {
+        if (!buckets[i].distance) {
+            buckets[i] = entry;
+            return;
+        }
+        // Take the bucket from a node which is closer to its ideal position
+        if (buckets[i].distance < entry.distance) {
+            displaced = buckets[i];
+            buckets[i] = entry;
+            entry = displaced;
+        }
+        entry.distance++;
+    }
+}
+
+static inline void gauged_writer_hash_migrate(gauged_writer_hash_t *hash,
+                                              size_t count) {
+    size_t end = hash->migrated + count;
+    if (end > hash->old_size) {
+        end = hash->old_size;
+    }
+    // Nodes are copied rather than moved so that lookups in the old table
+    // keep working until it's freed
+    const gauged_writer_hash_bucket_t *bucket;
+    for (size_t i = hash->migrated; i < end; i++) {
+        bucket = &hash->old_buckets[i];
+        if (bucket->distance) {
+            gauged_writer_hash_put(hash->buckets, hash->size, bucket->seed,
+                                   bucket->node);
+        }
+    }
+    hash->migrated = end;
+    if (end == hash->old_size) {
+        free(hash->old_buckets);
+        hash->old_buckets = NULL;
+        hash->old_size = hash->migrated = 0;
+    }
 }
 
 static inline int gauged_writer_hash_insert(gauged_writer_hash_t *hash,
                                             gauged_writer_hash_node_t *node) {
-    if (hash->count > hash->size / 2) {
-        gauged_writer_hash_rehash(hash);
-    }
-    size_t mask = hash->size - 1;
-    size_t hash_key = node->seed & mask;
-    for (uint32_t j = 1; j < hash->size; j++) {
-        if (!hash->nodes[hash_key]) {
-            hash->nodes[hash_key] = node;
-            hash->count++;
-            if (hash->tail) {
-                hash->tail->next = node;
-                hash->tail = node;
-            } else {
-                hash->head = hash->tail = node;
-            }
-            return GAUGED_OK;
+    if (hash->old_buckets) {
+        gauged_writer_hash_migrate(hash, GAUGED_WRITER_HASH_MIGRATE);
+    }
+    if (hash->count >= hash->size - hash->size / 8) {
+        if (hash->old_buckets) {
+            gauged_writer_hash_migrate(hash, hash->old_size);
+        }
+        gauged_writer_hash_bucket_t *buckets =
+            calloc(hash->size * 2, sizeof(gauged_writer_hash_bucket_t));
+        if (!buckets) {
+            return GAUGED_ERROR;
         }
-        hash_key = (node->seed + j * j) & mask;
+        hash->old_buckets = hash->buckets;
+        hash->old_size = hash->size;
+        hash->migrated = 0;
+        hash->buckets = buckets;
+        hash->size *= 2;
     }
-    if (!gauged_writer_hash_rehash(hash)) {
-        return GAUGED_ERROR;
+    gauged_writer_hash_put(hash->buckets, hash->size, node->seed, node);
+    hash->count++;
+    if (hash->tail) {
+        hash->tail->next = node;
+        hash->tail = node;
+    } else {
+        hash->head = hash->tail = node;
     }
-    return gauged_writer_hash_insert(hash, node);
+    return GAUGED_OK;
 }
 
-static inline int gauged_writer_hash_rehash(gauged_writer_hash_t *hash) {
-    size_t current_size = hash->size;
-    size_t current_count = hash->count;
-    gauged_writer_hash_node_t *current_head = hash->head,
-                              *current_tail = hash->tail;
-    gauged_writer_hash_node_t *node, **current_nodes = hash->nodes;
-    hash->size *= 2;
-    hash->count = 0;
-    hash->head = hash->tail = NULL;
-    hash->nodes = calloc(hash->size, sizeof(gauged_writer_hash_node_t *));
-    if (!hash->nodes) {
+static gauged_writer_keys_t *gauged_writer_keys_new(size_t capacity) {
+    gauged_writer_keys_t *keys = calloc(1, sizeof(gauged_writer_keys_t));
+    if (!keys) {
+        return NULL;
+    }
+    keys->size = GAUGED_WRITER_KEYS_INITIAL;
+    keys->slots = calloc(keys->size, sizeof(gauged_writer_key_t));
+    keys->arena = gauged_arena_new();
+    if (!keys->slots || !keys->arena) {
         goto error;
     }
-    for (size_t i = 0; i < current_size; i++) {
-        node = current_nodes[i];
-        if (node && !gauged_writer_hash_insert(hash, node)) {
-            goto error;
+    keys->capacity = capacity;
+    return keys;
+error:
+    if (keys->slots) free(keys->slots);
+    if (keys->arena) gauged_arena_free(keys->arena);
+    free(keys);
+    return NULL;
+}
+
+static void gauged_writer_keys_free(gauged_writer_keys_t *keys) {
+    gauged_arena_free(keys->arena);
+    free(keys->slots);
+    free(keys);
+}
+
+static uint32_t gauged_writer_keys_get(const gauged_writer_keys_t *keys,
+                                       uint32_t namespace_, const char *key,
+                                       size_t key_length, uint32_t seed) {
+    size_t mask = keys->size - 1;
+    const gauged_writer_key_t *slot;
+    for (size_t i = seed & mask;; i = (i + 1) & mask) {
+        slot = &keys->slots[i];
+        if (!slot->key) {
+            return 0;
+        }
+        if (slot->seed == seed && slot->namespace_ == namespace_ &&
+            !strncmp(key, slot->key, key_length) &&
+            slot->key[key_length] == '\0') {
+            return slot->id;
+        }
+    }
+}
+
+static void gauged_writer_keys_put(gauged_writer_key_t *slots, size_t size,
+                                   const gauged_writer_key_t *key) {
+    size_t mask = size - 1;
+    size_t i = key->seed & mask;
+    while (slots[i].key) {
+        i = (i + 1) & mask;
+    }
+    slots[i] = *key;
+}
+
+static int gauged_writer_keys_set(gauged_writer_keys_t *keys,
+                                  uint32_t namespace_, const char *key,
+                                  size_t key_length, uint32_t seed,
+                                  uint32_t id) {
+    if (!keys->capacity) {
+        return GAUGED_OK;
+    }
+    if (keys->count >= keys->capacity) {
+        memset(keys->slots, 0, keys->size * sizeof(gauged_writer_key_t));
+        gauged_arena_reset(keys->arena);
+        keys->count = 0;
+    }
+    if (keys->count >= keys->size / 2) {
+        size_t size = keys->size * 2;
+        gauged_writer_key_t *slots = calloc(size, sizeof(gauged_writer_key_t));
+        if (!slots) {
+            return GAUGED_ERROR;
         }
+        for (size_t i = 0; i < keys->size; i++) {
+            if (keys->slots[i].key) {
+                gauged_writer_keys_put(slots, size, &keys->slots[i]);
+            }
+        }
+        free(keys->slots);
+        keys->slots = slots;
+        keys->size = size;
     }
-    free(current_nodes);
+    gauged_writer_key_t slot;
+    slot.key = gauged_arena_alloc(keys->arena, key_length + 1);
+    if (!slot.key) {
+        return GAUGED_ERROR;
+    }
+    memcpy(slot.key, key, key_length);
+    slot.key[key_length] = '\0';
+    slot.namespace_ = namespace_;
+    slot.seed = seed;
+    slot.id = id;
+    gauged_writer_keys_put(keys->slots, keys->size, &slot);
+    keys->count++;
     return GAUGED_OK;
-error:
-    if (hash->nodes) {
-        free(hash->nodes);
-    }
-    hash->head = current_head;
-    hash->tail = current_tail;
-    hash->size = current_size;
-    hash->nodes = current_nodes;
-    hash->count = current_count;
-    return GAUGED_ERROR;
 }
 
-GAUGED_EXPORT gauged_writer_t *gauged_writer_new(size_t max_key) {
+GAUGED_EXPORT gauged_writer_t *gauged_writer_new(size_t max_key,
+                                                 size_t key_cache_size,
+                                                 size_t expected_keys) {
     gauged_writer_t *writer = malloc(sizeof(gauged_writer_t));
     if (!writer) {
         return NULL;
     }
-    writer->pending = gauged_writer_hash_new(GAUGED_WRITER_HASH_INITIAL);
-    writer->buffer = malloc(GAUGED_WRITER_MAX_PAIRS * 2 * sizeof(char *));
-    writer->copy = malloc(GAUGED_WRITER_MAX_QUERY * sizeof(char));
-    if (!writer->pending || !writer->buffer || !writer->copy) {
+    writer->pending =
+        gauged_writer_hash_new(gauged_writer_hash_size(expected_keys));
+    writer->keys = gauged_writer_keys_new(key_cache_size);
+    writer->buffer = malloc(GAUGED_WRITER_BUFFER_INITIAL * sizeof(char *));
+    writer->copy = malloc(GAUGED_WRITER_BUFFER_INITIAL * sizeof(char));
+    writer->partial = malloc(GAUGED_WRITER_BUFFER_INITIAL * sizeof(char));
+    if (!writer->pending || !writer->keys || !writer->buffer ||
+        !writer->copy || !writer->partial) {
         goto error;
     }
     writer->max_key = max_key;
     writer->buffer_size = 0;
+    writer->buffer_capacity = GAUGED_WRITER_BUFFER_INITIAL;
+    writer->copy_size = GAUGED_WRITER_BUFFER_INITIAL;
+    writer->partial_size = GAUGED_WRITER_BUFFER_INITIAL;
+    writer->partial_length = 0;
+    writer->streaming = false;
+    writer->whitelist = NULL;
+    memset(&writer->allow, 0, sizeof(gauged_writer_prefixes_t));
+    memset(&writer->deny, 0, sizeof(gauged_writer_prefixes_t));
+    memset(&writer->errors, 0, sizeof(gauged_writer_errors_t));
+    writer->handles = NULL;
+    writer->handle_count = writer->handle_size = 0;
+    writer->handle_keys = NULL;
+    writer->generation = 0;
     return writer;
 error:
     if (writer->pending) {
         gauged_writer_hash_free(writer->pending);
     }
+    if (writer->keys) gauged_writer_keys_free(writer->keys);
     if (writer->buffer) free(writer->buffer);
     if (writer->copy) free(writer->copy);
+    if (writer->partial) free(writer->partial);
     free(writer);
     return NULL;
 }
 
+static void gauged_writer_errors_reset(gauged_writer_errors_t *errors) {
+    for (size_t i = 0; i < errors->count; i++) {
+        free(errors->keys[i]);
+    }
+    memset(errors, 0, sizeof(gauged_writer_errors_t));
+}
+
+static void gauged_writer_prefixes_free(gauged_writer_prefixes_t *prefixes) {
+    for (size_t i = 0; i < prefixes->count; i++) {
+        free(prefixes->prefixes[i]);
+    }
+    free(prefixes->prefixes);
+    free(prefixes->lengths);
+    memset(prefixes, 0, sizeof(gauged_writer_prefixes_t));
+}
+
 GAUGED_EXPORT void gauged_writer_free(gauged_writer_t *writer) {
     gauged_writer_hash_free(writer->pending);
+    gauged_writer_keys_free(writer->keys);
+    if (writer->whitelist) {
+        gauged_writer_keys_free(writer->whitelist);
+    }
+    gauged_writer_prefixes_free(&writer->allow);
+    gauged_writer_prefixes_free(&writer->deny);
+    gauged_writer_errors_reset(&writer->errors);
     free(writer->buffer);
     free(writer->copy);
+    free(writer->partial);
+    free(writer->handles);
+    if (writer->handle_keys) {
+        gauged_writer_keys_free(writer->handle_keys);
+    }
     free(writer);
 }
 
+static int gauged_writer_emit_key(gauged_writer_t *, uint32_t, const char *,
+                                  size_t, float);
+
+static bool gauged_writer_reserve(char **buffer, size_t *size,
+                                  size_t required) {
+    if (required <= *size) {
+        return true;
+    }
+    size_t new_size = *size ? *size : GAUGED_WRITER_BUFFER_INITIAL;
+    while (new_size < required) {
+        new_size *= 2;
+    }
+    char *new_buffer = realloc(*buffer, new_size);
+    if (!new_buffer) {
+        return false;
+    }
+    *buffer = new_buffer;
+    *size = new_size;
+    return true;
+}
+
+static inline int gauged_writer_error(gauged_writer_errors_t *errors,
+                                      const char *key, size_t key_length,
+                                      int status) {
+    if (status == GAUGED_GAUGE_NAN) {
+        errors->nan_count++;
+    } else {
+        errors->overflow_count++;
+    }
+    if (errors->count < GAUGED_WRITER_MAX_ERRORS) {
+        char *copy = malloc(key_length + 1);
+        if (!copy) {
+            return GAUGED_ERROR;
+        }
+        memcpy(copy, key, key_length);
+        copy[key_length] = '\0';
+        errors->statuses[errors->count] = status;
+        errors->keys[errors->count++] = copy;
+    }
+    return GAUGED_OK;
+}
+
+GAUGED_EXPORT void gauged_writer_errors(const gauged_writer_t *writer,
+                                        gauged_writer_errors_t *errors) {
+    memcpy(errors, &writer->errors, sizeof(gauged_writer_errors_t));
+}
+
+static const double gauged_writer_powers[] = {
+    1e0,  1e1,  1e2,  1e3,  1e4,  1e5,  1e6,  1e7,  1e8,  1e9,  1e10, 1e11,
+    1e12, 1e13, 1e14, 1e15, 1e16, 1e17, 1e18, 1e19, 1e20, 1e21, 1e22};
+
+static bool gauged_writer_parse_float_slow(const char *str, size_t length,
+                                           float *result) {
+    char stack[64], *copy = stack, *end_ptr;
+    if (length >= sizeof(stack)) {
+        copy = malloc(length + 1);
+        if (!copy) {
+            return false;
+        }
+    }
+    memcpy(copy, str, length);
+    copy[length] = '\0';
+    *result = strtof(copy, &end_ptr);
+    bool valid = length && end_ptr == copy + length;
+    if (copy != stack) {
+        free(copy);
+    }
+    return valid;
+}
+
+// Parse a decimal number without regard to the locale. Numbers with up to
+// 15 significant digits and a small exponent (nearly all gauges) need a
+// single multiplication or division of exact doubles, while anything else
+// is passed to strtof. The whole string must be consumed.
+static inline bool gauged_writer_parse_float(const char *str, size_t length,
+                                             float *result) {
+    const char *ptr = str, *end = str + length, *digits_start;
+    bool negative = false;
+    uint64_t mantissa = 0;
+    int exponent = 0, digits = 0, exponent_value = 0;
+    if (ptr < end && (*ptr == '-' || *ptr == '+')) {
+        negative = *ptr++ == '-';
+    }
+    digits_start = ptr;
+    for (; ptr < end && *ptr >= '0' && *ptr <= '9'; ptr++) {
+        if (digits >= 15) {
+            goto slow;
+        }
+        mantissa = mantissa * 10 + (*ptr - '0');
+        digits += mantissa != 0;
+    }
+    size_t integer_digits = ptr - digits_start;
+    if (ptr < end && *ptr == '.') {
+        const char *fraction_start = ++ptr;
+        for (; ptr < end && *ptr >= '0' && *ptr <= '9'; ptr++) {
+            if (digits >= 15) {
+                goto slow;
+            }
+            mantissa = mantissa * 10 + (*ptr - '0');
+            digits += mantissa != 0;
+            exponent--;
+        }
+        if (!integer_digits && ptr == fraction_start) {
+            goto slow;
+        }
+    } else if (!integer_digits) {
+        goto slow;
+    }
+    if (ptr < end && (*ptr == 'e' || *ptr == 'E')) {
+        bool negative_exponent = false;
+        ptr++;
+        if (ptr < end && (*ptr == '-' || *ptr == '+')) {
+            negative_exponent = *ptr++ == '-';
+        }
+        if (ptr == end) {
+            goto slow;
+        }
+        for (; ptr < end && *ptr >= '0' && *ptr <= '9'; ptr++) {
+            if (exponent_value > 100) {
+                goto slow;
+            }
+            exponent_value = exponent_value * 10 + (*ptr - '0');
+        }
+        exponent += negative_exponent ? -exponent_value : exponent_value;
+    }
+    if (ptr != end || exponent < -22 || exponent > 22) {
+        goto slow;
+    }
+    double value = (double)mantissa;
+    if (exponent < 0) {
+        value /= gauged_writer_powers[-exponent];
+    } else {
+        value *= gauged_writer_powers[exponent];
+    }
+    *result = (float)(negative ? -value : value);
+    return true;
+slow:
+    return gauged_writer_parse_float_slow(str, length, result);
+}
+
+static inline char gauged_writer_hex_decode(char c) {
+    return isdigit(c) ? c - '0' : tolower(c) - 'a' + 10;
+}
+
+static size_t gauged_writer_url_decode(char *dst, const char *src,
+                                       size_t len) {
+    char *start = dst, c;
+    while (len--) {
+        c = *src++;
+        if (c == '+') {
+            c = ' ';
+        } else if (c == '%' && len >= 2 && isxdigit((unsigned char)src[0]) &&
+                   isxdigit((unsigned char)src[1])) {
+            c = (gauged_writer_hex_decode(src[0]) << 4) |
+                gauged_writer_hex_decode(src[1]);
+            src += 2;
+            len -= 2;
+        }
+        *dst++ = c;
+    }
+    *dst = '\0';
+    return dst - start;
+}
+
+static inline bool gauged_writer_is_encoded(const char *str, size_t length) {
+    return memchr(str, '%', length) || memchr(str, '+', length);
+}
+
+static int gauged_writer_emit_pair(gauged_writer_t *writer,
+                                   uint32_t namespace_, const char *pair,
+                                   size_t length, uint32_t *data_points) {
+    const char *equals = memchr(pair, '=', length);
+    if (!equals || equals == pair) {
+        return GAUGED_OK;
+    }
+    const char *key = pair, *value = equals + 1;
+    size_t key_length = equals - pair;
+    size_t value_length = length - key_length - 1;
+    if (gauged_writer_is_encoded(pair, length)) {
+        if (!gauged_writer_reserve(&writer->copy, &writer->copy_size,
+                                   length + 2)) {
+            return GAUGED_ERROR;
+        }
+        char *decoded_key = writer->copy;
+        key_length = gauged_writer_url_decode(decoded_key, key, key_length);
+        char *decoded_value = decoded_key + key_length + 1;
+        value_length =
+            gauged_writer_url_decode(decoded_value, value, value_length);
+        key = decoded_key;
+        value = decoded_value;
+    }
+    float float_value;
+    if (!gauged_writer_parse_float(value, value_length, &float_value) ||
+        isnan(float_value)) {
+        if (gauged_writer_accept(writer, key, key_length)) {
+            return gauged_writer_error(&writer->errors, key, key_length,
+                                       GAUGED_GAUGE_NAN);
+        }
+        return GAUGED_OK;
+    }
+    int status = gauged_writer_emit_key(writer, namespace_, key, key_length,
+                                        float_value);
+    switch (status) {
+        case GAUGED_OK:
+            *data_points += 1;
+            break;
+        case GAUGED_KEY_OVERFLOW:
+            return gauged_writer_error(&writer->errors, key, key_length,
+                                       status);
+        case GAUGED_ERROR:
+            return GAUGED_ERROR;
+    }
+    return GAUGED_OK;
+}
+
 GAUGED_EXPORT int gauged_writer_emit_pairs(gauged_writer_t *writer,
                                            uint32_t namespace_,
                                            const char *pairs,
                                            uint32_t *data_points) {
-    gauged_writer_parse_query(writer, pairs);
-    char *key, *value, *end_ptr;
-    float float_value;
-    int status;
-    if (!writer->buffer_size) {
-        return GAUGED_OK;
+    return gauged_writer_emit_pairs_length(
+        writer, namespace_, pairs, pairs ? strlen(pairs) : 0, data_points);
+}
+
+GAUGED_EXPORT int gauged_writer_emit_pairs_length(gauged_writer_t *writer,
+                                                  uint32_t namespace_,
+                                                  const char *pairs,
+                                                  size_t length,
+                                                  uint32_t *data_points) {
+    writer->partial_length = 0;
+    writer->streaming = false;
+    return gauged_writer_emit_pairs_chunk(writer, namespace_, pairs, length,
+                                          true, data_points);
+}
+
+GAUGED_EXPORT int gauged_writer_emit_pairs_chunk(gauged_writer_t *writer,
+                                                 uint32_t namespace_,
+                                                 const char *chunk,
+                                                 size_t length, bool last,
+                                                 uint32_t *data_points) {
+    if (!writer->streaming) {
+        gauged_writer_errors_reset(&writer->errors);
+    }
+    writer->streaming = !last;
+    if (!chunk) {
+        chunk = "";
+        length = 0;
+    }
+    const char *end = chunk + length, *separator;
+    if (last) {
+        // Ignore a trailing newline
+        if (length && end[-1] == '\n') {
+            end--;
+        } else if (!length && writer->partial_length &&
+                   writer->partial[writer->partial_length - 1] == '\n') {
+            writer->partial_length--;
+        }
     }
-    for (size_t i = 0; i <= writer->buffer_size - 2;) {
-        key = writer->buffer[i++];
-        value = writer->buffer[i++];
-        float_value = strtof(value, &end_ptr);
-        if (value == end_ptr) {  // NaN?
+    if (writer->partial_length) {
+        // Complete the pair which was split across chunks
+        separator = memchr(chunk, '&', end - chunk);
+        size_t tail = (separator ? separator : end) - chunk;
+        if (!gauged_writer_reserve(&writer->partial, &writer->partial_size,
+                                   writer->partial_length + tail)) {
+            return GAUGED_ERROR;
+        }
+        memcpy(writer->partial + writer->partial_length, chunk, tail);
+        writer->partial_length += tail;
+        if (!separator && !last) {
+            return GAUGED_OK;
+        }
+        length = writer->partial_length;
+        writer->partial_length = 0;
+        if (!gauged_writer_emit_pair(writer, namespace_, writer->partial,
+                                     length, data_points)) {
+            return GAUGED_ERROR;
+        }
+        if (!separator) {
+            return GAUGED_OK;
+        }
+        chunk = separator + 1;
+    }
+    while (chunk < end) {
+        separator = memchr(chunk, '&', end - chunk);
+        if (!separator) {
+            if (!last) {
+                length = end - chunk;
+                if (!gauged_writer_reserve(&writer->partial,
+                                           &writer->partial_size, length)) {
+                    return GAUGED_ERROR;
+                }
+                memcpy(writer->partial, chunk, length);
+                writer->partial_length = length;
+                return GAUGED_OK;
+            }
+            separator = end;
+        }
+        if (!gauged_writer_emit_pair(writer, namespace_, chunk,
+                                     separator - chunk, data_points)) {
+            return GAUGED_ERROR;
+        }
+        if (separator == end) {
+            break;
+        }
+        chunk = separator + 1;
+    }
+    return GAUGED_OK;
+}
+
+static inline int gauged_writer_hash_append(gauged_writer_hash_t *hash,
+                                            gauged_writer_hash_node_t *node,
+                                            float value) {
+    // Count the key as active when it had nothing waiting to be written
+    if (!node->array->length && !node->map->length) {
+        hash->active++;
+    }
+    if (!gauged_writer_array_append(hash->arena, node->array, value)) {
+        return GAUGED_ERROR;
+    }
+    hash->bytes += sizeof(float);
+    if (hash->array_tail != node && node->array_next == NULL) {
+        if (hash->array_tail) {
+            hash->array_tail->array_next = node;
+            hash->array_tail = node;
+        } else {
+            hash->array_head = hash->array_tail = node;
+        }
+    }
+    return GAUGED_OK;
+}
+
+static int gauged_writer_hash_emit(gauged_writer_hash_t *hash,
+                                   const gauged_writer_keys_t *keys,
+                                   uint32_t namespace_, const char *key,
+                                   size_t key_length, uint32_t seed,
+                                   float value,
+                                   gauged_writer_hash_node_t **emitted) {
+    // See if the hash node already exists
+    gauged_writer_hash_node_t *lookup =
+        gauged_writer_hash_get(hash, namespace_, key, key_length, seed);
+    if (lookup) {
+        if (emitted) {
+            *emitted = lookup;
+        }
+        return gauged_writer_hash_append(hash, lookup, value);
+    }
+    // Not found, create a new hash node
+    gauged_arena_t *arena = hash->arena;
+    gauged_writer_hash_slot_t *slot =
+        gauged_arena_alloc(arena, sizeof(gauged_writer_hash_slot_t));
+    if (!slot) {
+        return GAUGED_ERROR;
+    }
+    gauged_writer_hash_node_t *node = &slot->node;
+    node->array = &slot->array;
+    node->map = &slot->map;
+    node->array->buffer = gauged_arena_alloc_buffer(
+        arena, GAUGED_ARRAY_INITIAL_SIZE * sizeof(float));
+    node->array->size = GAUGED_ARRAY_INITIAL_SIZE;
+    node->array->length = 0;
+    node->map->buffer = gauged_arena_alloc_buffer(
+        arena, GAUGED_MAP_INITIAL_SIZE * sizeof(uint32_t));
+    node->map->size = GAUGED_MAP_INITIAL_SIZE;
+    node->map->length = 0;
+    node->map->index = NULL;
+    node->key = gauged_arena_alloc(arena, key_length + 1);
+    if (!node->key || !node->array->buffer || !node->map->buffer) {
+        return GAUGED_ERROR;
+    }
+    node->array->buffer[node->array->length++] = value;
+    memcpy(node->key, key, key_length);
+    node->key[key_length] = '\0';
+    node->namespace_ = namespace_;
+    node->seed = seed;
+    node->key_id =
+        gauged_writer_keys_get(keys, namespace_, key, key_length, seed);
+    node->next = node->array_next = NULL;
+    if (!gauged_writer_hash_insert(hash, node)) {
+        return GAUGED_ERROR;
+    }
+    if (hash->array_tail) {
+        hash->array_tail->array_next = node;
+        hash->array_tail = node;
+    } else {
+        hash->array_head = hash->array_tail = node;
+    }
+    hash->bytes += sizeof(float);
+    hash->active++;
+    if (emitted) {
+        *emitted = node;
+    }
+    return GAUGED_OK;
+}
+
+static inline uint32_t gauged_writer_shard(gauged_xxhash_t *hash,
+                                           const char *key,
+                                           size_t key_length,
+                                           uint32_t shards) {
+    gauged_hash_init(hash);
+    gauged_hash_update(hash, key, key_length);
+    return gauged_hash_digest(hash) % shards;
+}
+
+GAUGED_EXPORT void gauged_writer_route_keys(const char **keys,
+                                            const size_t *key_lengths,
+                                            size_t count, uint32_t shards,
+                                            uint32_t *routes) {
+    gauged_xxhash_t hash;
+    for (size_t i = 0; i < count; i++) {
+        routes[i] = gauged_writer_shard(&hash, keys[i], key_lengths[i],
+                                        shards);
+    }
+}
+
+GAUGED_EXPORT int gauged_writer_route(const char *pairs, size_t length,
+                                      uint32_t shards, char *output,
+                                      size_t *offsets) {
+    const char *end = pairs + length, *pair, *separator, *equals, *key;
+    if (length && end[-1] == '\n') {
+        end--;
+    }
+    size_t count = 1;
+    for (pair = pairs; (separator = memchr(pair, '&', end - pair));
+         pair = separator + 1) {
+        count++;
+    }
+    uint32_t *routes = malloc(count * sizeof(uint32_t));
+    char *copy = malloc(length + 1);
+    if (!routes || !copy) {
+        free(routes);
+        free(copy);
+        return GAUGED_ERROR;
+    }
+    gauged_xxhash_t hash;
+    size_t i, pair_length, key_length;
+    memset(offsets, 0, (shards + 1) * sizeof(size_t));
+    // Count the bytes routed to each shard, remembering each pair's shard
+    for (pair = pairs, i = 0; pair < end; pair += pair_length + 1, i++) {
+        separator = memchr(pair, '&', end - pair);
+        pair_length = (separator ? separator : end) - pair;
+        equals = memchr(pair, '=', pair_length);
+        if (!equals || equals == pair) {
+            // The writer skips pairs without a key
+            routes[i] = shards;
             continue;
         }
-        status = gauged_writer_emit(writer, namespace_, key, float_value);
+        key = pair;
+        key_length = equals - pair;
+        if (gauged_writer_is_encoded(key, key_length)) {
+            key_length = gauged_writer_url_decode(copy, key, key_length);
+            key = copy;
+        }
+        routes[i] = gauged_writer_shard(&hash, key, key_length, shards);
+        offsets[routes[i]] += pair_length + 1;
+    }
+    // Turn the counts into the offset where each shard starts, then copy
+    // each pair (followed by a separator) to the end of its shard
+    size_t position = 0, shard_length;
+    for (i = 0; i <= shards; i++) {
+        shard_length = offsets[i];
+        offsets[i] = position;
+        position += shard_length;
+    }
+    for (pair = pairs, i = 0; pair < end; pair += pair_length + 1, i++) {
+        separator = memchr(pair, '&', end - pair);
+        pair_length = (separator ? separator : end) - pair;
+        if (routes[i] < shards) {
+            memcpy(output + offsets[routes[i]], pair, pair_length);
+            offsets[routes[i]] += pair_length + 1;
+            output[offsets[routes[i]] - 1] = '&';
+        }
+    }
+    // Each shard now ends where the next one starts
+    for (i = shards; i; i--) {
+        offsets[i] = offsets[i - 1];
+    }
+    offsets[0] = 0;
+    free(routes);
+    free(copy);
+    return GAUGED_OK;
+}
+
+GAUGED_EXPORT int gauged_writer_whitelist(gauged_writer_t *writer,
+                                          const char **keys, size_t count) {
+    if (writer->whitelist) {
+        gauged_writer_keys_free(writer->whitelist);
+    }
+    writer->whitelist = gauged_writer_keys_new(SIZE_MAX);
+    if (!writer->whitelist) {
+        return GAUGED_ERROR;
+    }
+    size_t key_length;
+    uint32_t seed;
+    for (size_t i = 0; i < count; i++) {
+        key_length = strlen(keys[i]);
+        gauged_hash_init(&writer->hash);
+        gauged_hash_update(&writer->hash, keys[i], key_length);
+        seed = gauged_hash_digest(&writer->hash);
+        if (gauged_writer_keys_get(writer->whitelist, 0, keys[i], key_length,
+                                   seed)) {
+            continue;
+        }
+        if (!gauged_writer_keys_set(writer->whitelist, 0, keys[i],
+                                    key_length, seed, 1)) {
+            return GAUGED_ERROR;
+        }
+    }
+    return GAUGED_OK;
+}
+
+GAUGED_EXPORT int gauged_writer_prefixes(gauged_writer_t *writer,
+                                         const char **prefixes, size_t count,
+                                         bool allow) {
+    gauged_writer_prefixes_t *list = allow ? &writer->allow : &writer->deny;
+    gauged_writer_prefixes_free(list);
+    if (!count) {
+        return GAUGED_OK;
+    }
+    list->prefixes = calloc(count, sizeof(char *));
+    list->lengths = malloc(count * sizeof(size_t));
+    if (!list->prefixes || !list->lengths) {
+        goto error;
+    }
+    for (size_t i = 0; i < count; i++) {
+        list->lengths[i] = strlen(prefixes[i]);
+        list->prefixes[i] = malloc(list->lengths[i] + 1);
+        if (!list->prefixes[i]) {
+            goto error;
+        }
+        memcpy(list->prefixes[i], prefixes[i], list->lengths[i] + 1);
+        list->count++;
+    }
+    return GAUGED_OK;
+error:
+    gauged_writer_prefixes_free(list);
+    return GAUGED_ERROR;
+}
+
+static inline bool gauged_writer_prefixes_match(
+    const gauged_writer_prefixes_t *list, const char *key, size_t key_length) {
+    for (size_t i = 0; i < list->count; i++) {
+        if (list->lengths[i] <= key_length &&
+            !memcmp(key, list->prefixes[i], list->lengths[i])) {
+            return true;
+        }
+    }
+    return false;
+}
+
+GAUGED_EXPORT bool gauged_writer_accept(gauged_writer_t *writer,
+                                        const char *key, size_t key_length) {
+    if (writer->whitelist || writer->allow.count) {
+        bool allowed = false;
+        if (writer->whitelist) {
+            gauged_hash_init(&writer->hash);
+            gauged_hash_update(&writer->hash, key, key_length);
+            uint32_t seed = gauged_hash_digest(&writer->hash);
+            allowed = gauged_writer_keys_get(writer->whitelist, 0, key,
+                                             key_length, seed) != 0;
+        }
+        if (!allowed &&
+            !gauged_writer_prefixes_match(&writer->allow, key, key_length)) {
+            return false;
+        }
+    }
+    return !gauged_writer_prefixes_match(&writer->deny, key, key_length);
+}
+
+static int gauged_writer_emit_key(gauged_writer_t *writer,
+                                  uint32_t namespace_, const char *key,
+                                  size_t key_length, float value) {
+    if ((writer->whitelist || writer->allow.count || writer->deny.count) &&
+        !gauged_writer_accept(writer, key, key_length)) {
+        return GAUGED_KEY_FILTERED;
+    }
+    if (writer->max_key && key_length + 1 > writer->max_key) {
+        return GAUGED_KEY_OVERFLOW;
+    }
+    gauged_hash_init(&writer->hash);
+    gauged_hash_update(&writer->hash, (char *)&namespace_, sizeof(uint32_t));
+    gauged_hash_update(&writer->hash, key, key_length);
+    uint32_t seed = gauged_hash_digest(&writer->hash);
+    return gauged_writer_hash_emit(writer->pending, writer->keys, namespace_,
+                                   key, key_length, seed, value, NULL);
+}
+
+GAUGED_EXPORT int gauged_writer_emit(gauged_writer_t *writer,
+                                     uint32_t namespace_, const char *key,
+                                     float value) {
+    return gauged_writer_emit_key(writer, namespace_, key, strlen(key), value);
+}
+
+GAUGED_EXPORT int gauged_writer_emit_batch(gauged_writer_t *writer,
+                                           const uint32_t *namespaces,
+                                           const char **keys,
+                                           const size_t *key_lengths,
+                                           const float *values, size_t count,
+                                           int *statuses,
+                                           uint32_t *data_points) {
+    int status;
+    for (size_t i = 0; i < count; i++) {
+        if (isnan(values[i])) {
+            status = gauged_writer_accept(writer, keys[i], key_lengths[i])
+                         ? GAUGED_GAUGE_NAN
+                         : GAUGED_KEY_FILTERED;
+        } else {
+            status = gauged_writer_emit_key(writer, namespaces[i], keys[i],
+                                            key_lengths[i], values[i]);
+        }
+        if (statuses) {
+            statuses[i] = status;
+        }
         switch (status) {
             case GAUGED_OK:
                 *data_points += 1;
                 break;
             case GAUGED_KEY_OVERFLOW:
+            case GAUGED_KEY_FILTERED:
+            case GAUGED_GAUGE_NAN:
                 break;
             case GAUGED_ERROR:
                 return GAUGED_ERROR;
@@ -191,80 +1020,150 @@ GAUGED_EXPORT int gauged_writer_emit_pairs(gauged_writer_t *writer,
     return GAUGED_OK;
 }
 
-GAUGED_EXPORT int gauged_writer_emit(gauged_writer_t *writer,
-                                     uint32_t namespace_, const char *key,
-                                     float value) {
-    size_t key_len = strlen(key) + 1;
-    if (writer->max_key && key_len > writer->max_key) {
-        return GAUGED_KEY_OVERFLOW;
+GAUGED_EXPORT int gauged_writer_check_batch(gauged_writer_t *writer,
+                                           const char **keys,
+                                           const size_t *key_lengths,
+                                           const float *values, size_t count,
+                                           bool nan, bool overflow,
+                                           size_t *index) {
+    for (size_t i = 0; i < count; i++) {
+        bool is_nan = nan && isnan(values[i]);
+        bool is_long = overflow && writer->max_key &&
+                       key_lengths[i] + 1 > writer->max_key;
+        if ((is_nan || is_long) &&
+            gauged_writer_accept(writer, keys[i], key_lengths[i])) {
+            *index = i;
+            return is_nan ? GAUGED_GAUGE_NAN : GAUGED_KEY_OVERFLOW;
+        }
+    }
+    return GAUGED_OK;
+}
+
+GAUGED_EXPORT int gauged_writer_register(gauged_writer_t *writer,
+                                        uint32_t namespace_, const char *key,
+                                        size_t key_length, uint32_t *handle) {
+    if (!writer->handle_keys) {
+        writer->handle_keys = gauged_writer_keys_new(SIZE_MAX);
+        if (!writer->handle_keys) {
+            return GAUGED_ERROR;
+        }
     }
     gauged_hash_init(&writer->hash);
     gauged_hash_update(&writer->hash, (char *)&namespace_, sizeof(uint32_t));
-    gauged_hash_update(&writer->hash, key, key_len);
+    gauged_hash_update(&writer->hash, key, key_length);
     uint32_t seed = gauged_hash_digest(&writer->hash);
-    // See if the hash node already exists
-    gauged_writer_hash_node_t *lookup =
-        gauged_writer_hash_get(writer->pending, namespace_, key, seed);
-    if (lookup) {
-        if (!gauged_array_append(lookup->array, value)) {
+    // Registering a key twice returns the same handle
+    uint32_t id = gauged_writer_keys_get(writer->handle_keys, namespace_, key,
+                                         key_length, seed);
+    if (id) {
+        *handle = id - 1;
+        return writer->handles[id - 1].status;
+    }
+    if (writer->handle_count == writer->handle_size) {
+        size_t size = writer->handle_size ? writer->handle_size * 2
+                                          : GAUGED_WRITER_HASH_INITIAL;
+        gauged_writer_handle_t *handles =
+            realloc(writer->handles, size * sizeof(gauged_writer_handle_t));
+        if (!handles) {
             return GAUGED_ERROR;
         }
-        if (writer->pending->array_tail != lookup &&
-            lookup->array_next == NULL) {
-            if (writer->pending->array_tail) {
-                writer->pending->array_tail->array_next = lookup;
-                writer->pending->array_tail = lookup;
-            } else {
-                writer->pending->array_head = writer->pending->array_tail =
-                    lookup;
-            }
-        }
-        return GAUGED_OK;
+        writer->handles = handles;
+        writer->handle_size = size;
     }
-    // Not found, create a new hash node
-    gauged_writer_hash_node_t *node = malloc(sizeof(gauged_writer_hash_node_t));
-    if (!node) {
+    gauged_writer_handle_t *entry = &writer->handles[writer->handle_count];
+    entry->key = gauged_arena_alloc(writer->handle_keys->arena, key_length + 1);
+    if (!entry->key) {
         return GAUGED_ERROR;
     }
-    node->array = gauged_array_new();
-    node->map = gauged_map_new();
-    node->key = malloc(sizeof(char) * key_len);
-    if (!node->key || !node->array || !node->map) {
-        goto error;
+    memcpy(entry->key, key, key_length);
+    entry->key[key_length] = '\0';
+    if (!gauged_writer_keys_set(writer->handle_keys, namespace_, key,
+                                key_length, seed, writer->handle_count + 1)) {
+        return GAUGED_ERROR;
     }
-    if (!gauged_array_append(node->array, value)) {
-        goto error;
+    entry->key_length = key_length;
+    entry->namespace_ = namespace_;
+    entry->seed = seed;
+    entry->node = NULL;
+    entry->generation = writer->generation;
+    if ((writer->whitelist || writer->allow.count || writer->deny.count) &&
+        !gauged_writer_accept(writer, key, key_length)) {
+        entry->status = GAUGED_KEY_FILTERED;
+    } else if (writer->max_key && key_length + 1 > writer->max_key) {
+        entry->status = GAUGED_KEY_OVERFLOW;
+    } else {
+        entry->status = GAUGED_OK;
     }
-    memcpy(node->key, key, key_len);
-    node->namespace_ = namespace_;
-    node->seed = seed;
-    node->next = node->array_next = NULL;
-    if (!gauged_writer_hash_insert(writer->pending, node)) {
-        goto error;
+    *handle = writer->handle_count++;
+    return entry->status;
+}
+
+static inline int gauged_writer_emit_handle(gauged_writer_t *writer,
+                                            gauged_writer_handle_t *handle,
+                                            float value) {
+    if (handle->node && handle->generation == writer->generation) {
+        return gauged_writer_hash_append(writer->pending, handle->node,
+                                         value);
     }
-    if (writer->pending->array_tail) {
-        writer->pending->array_tail->array_next = node;
-        writer->pending->array_tail = node;
-    } else {
-        writer->pending->array_head = writer->pending->array_tail = node;
+    handle->generation = writer->generation;
+    return gauged_writer_hash_emit(writer->pending, writer->keys,
+                                   handle->namespace_, handle->key,
+                                   handle->key_length, handle->seed, value,
+                                   &handle->node);
+}
+
+GAUGED_EXPORT int gauged_writer_emit_handles(gauged_writer_t *writer,
+                                             const uint32_t *handles,
+                                             const float *values, size_t count,
+                                             int *statuses,
+                                             uint32_t *data_points) {
+    gauged_writer_handle_t *handle;
+    int status;
+    gauged_writer_errors_reset(&writer->errors);
+    for (size_t i = 0; i < count; i++) {
+        if (handles[i] >= writer->handle_count) {
+            status = GAUGED_KEY_FILTERED;
+        } else {
+            handle = &writer->handles[handles[i]];
+            status = handle->status;
+            if (status == GAUGED_OK && isnan(values[i])) {
+                status = GAUGED_GAUGE_NAN;
+                if (!gauged_writer_error(&writer->errors, handle->key,
+                                         handle->key_length, status)) {
+                    return GAUGED_ERROR;
+                }
+            } else if (status == GAUGED_OK) {
+                status = gauged_writer_emit_handle(writer, handle, values[i]);
+            }
+        }
+        if (statuses) {
+            statuses[i] = status;
+        }
+        switch (status) {
+            case GAUGED_OK:
+                *data_points += 1;
+                break;
+            case GAUGED_ERROR:
+                return GAUGED_ERROR;
+        }
     }
     return GAUGED_OK;
-error:
-    if (node->array) gauged_array_free(node->array);
-    if (node->map) gauged_map_free(node->map);
-    if (node->key) free(node->key);
-    free(node);
-    return GAUGED_ERROR;
 }
 
 GAUGED_EXPORT int gauged_writer_flush_arrays(gauged_writer_t *writer,
                                              uint32_t offset) {
     gauged_writer_hash_node_t *node, *next;
     gauged_writer_hash_t *hash = writer->pending;
+    size_t map_length;
     for (node = hash->array_head; node; node = node->array_next) {
-        if (!gauged_map_append(node->map, offset, node->array)) {
+        map_length = node->map->length;
+        if (!gauged_writer_map_append(hash->arena, node->map, offset,
+                                      node->array)) {
             goto error;
         }
+        // The array's values are already counted; add the map header
+        hash->bytes += (node->map->length - map_length - node->array->length) *
+                       sizeof(uint32_t);
         node->array->length = 0;
     }
     for (node = hash->array_head; node; node = next) {
@@ -280,104 +1179,178 @@ error:
 
 GAUGED_EXPORT int gauged_writer_flush_maps(gauged_writer_t *writer, bool soft) {
     gauged_writer_hash_node_t *node;
+    gauged_writer_hash_t *hash = writer->pending;
     if (soft) {
-        for (node = writer->pending->head; node; node = node->next) {
+        // Keys with an array still being written remain active
+        hash->active = 0;
+        for (node = hash->head; node; node = node->next) {
+            hash->bytes -= gauged_map_length(node->map);
             node->map->length = 0;
-        }
-    } else {
-        gauged_writer_hash_t *hash = writer->pending;
-        for (size_t i = 0; i < hash->size; i++) {
-            if (hash->nodes[i]) {
-                node = hash->nodes[i];
-                if (soft) {
-                    node->map->length = 0;
-                } else {
-                    gauged_writer_hash_node_free(node);
-                    hash->nodes[i] = NULL;
-                }
+            if (node->array->length) {
+                hash->active++;
             }
         }
+    } else {
+        memset(hash->buckets, 0,
+               hash->size * sizeof(gauged_writer_hash_bucket_t));
+        free(hash->old_buckets);
+        hash->old_buckets = NULL;
+        hash->old_size = hash->migrated = 0;
+        gauged_arena_reset(hash->arena);
+        writer->generation++;
         hash->head = hash->tail = NULL;
-        hash->count = 0;
+        hash->array_head = hash->array_tail = NULL;
+        hash->count = hash->active = 0;
+        hash->bytes = 0;
+        hash->lookups = hash->probes = 0;
     }
     return GAUGED_OK;
 }
 
-static inline char gauged_writer_hex_decode(char c) {
-    return isdigit(c) ? c - '0' : tolower(c) - 'a' + 10;
+GAUGED_EXPORT void gauged_writer_stats(const gauged_writer_t *writer,
+                                       gauged_writer_stats_t *stats) {
+    const gauged_writer_hash_t *hash = writer->pending;
+    gauged_writer_hash_node_t *node;
+    memset(stats, 0, sizeof(gauged_writer_stats_t));
+    for (node = hash->head; node; node = node->next) {
+        stats->map_bytes += node->map->length * sizeof(uint32_t);
+        stats->map_capacity += node->map->size * sizeof(uint32_t);
+        stats->array_bytes += node->array->length * sizeof(float);
+        stats->array_capacity += node->array->size * sizeof(float);
+    }
+    stats->keys = hash->count;
+    stats->hash_size = hash->size;
+    stats->lookups = hash->lookups;
+    stats->probes = hash->probes;
 }
 
-static void gauged_writer_url_decode(char *dst, const char *src, size_t len) {
-    while (len-- && (*dst = *src++)) {
-        if (*dst == '+') {
-            *dst = ' ';
-        } else if (*dst == '%' && src[0] && src[1] && len >= 2) {
-            *dst = (gauged_writer_hex_decode(src[0]) << 4) |
-                   gauged_writer_hex_decode(src[1]);
-            src += 2;
-            len -= 2;
+GAUGED_EXPORT size_t gauged_writer_unresolved(
+    gauged_writer_t *writer, gauged_writer_hash_node_t **nodes, size_t max) {
+    size_t count = 0;
+    gauged_writer_hash_node_t *node = writer->pending->head;
+    for (; node && count < max; node = node->next) {
+        if (!node->key_id) {
+            nodes[count++] = node;
         }
-        dst++;
     }
-    *dst = '\0';
+    return count;
 }
 
-GAUGED_EXPORT void gauged_writer_parse_query(gauged_writer_t *writer,
-                                             const char *query) {
+GAUGED_EXPORT int gauged_writer_resolve(gauged_writer_t *writer,
+                                        gauged_writer_hash_node_t **nodes,
+                                        const uint32_t *ids, size_t count) {
+    for (size_t i = 0; i < count; i++) {
+        nodes[i]->key_id = ids[i];
+        if (!gauged_writer_keys_set(writer->keys, nodes[i]->namespace_,
+                                    nodes[i]->key, strlen(nodes[i]->key),
+                                    nodes[i]->seed, ids[i])) {
+            return GAUGED_ERROR;
+        }
+    }
+    return GAUGED_OK;
+}
+
+GAUGED_EXPORT size_t gauged_writer_export(const gauged_writer_hash_t *hash,
+                                          uint32_t *namespaces,
+                                          uint32_t *key_ids,
+                                          uint32_t **buffers,
+                                          size_t *lengths) {
+    size_t count = 0;
+    gauged_writer_hash_node_t *node;
+    for (node = hash->head; node; node = node->next) {
+        if (!node->map->length) {
+            continue;
+        }
+        namespaces[count] = node->namespace_;
+        key_ids[count] = node->key_id;
+        buffers[count] = node->map->buffer;
+        lengths[count] = gauged_map_length(node->map);
+        count++;
+    }
+    return count;
+}
+
+GAUGED_EXPORT gauged_writer_hash_t *gauged_writer_detach(
+    gauged_writer_t *writer) {
+    gauged_writer_hash_t *detached = writer->pending;
+    gauged_writer_hash_t *hash = gauged_writer_hash_new(detached->size);
+    if (!hash) {
+        return NULL;
+    }
+    // Carry the array which is still being written over to the new hash
+    gauged_writer_hash_node_t *node;
+    for (node = detached->array_head; node; node = node->array_next) {
+        for (size_t i = 0; i < node->array->length; i++) {
+            if (gauged_writer_hash_emit(hash, writer->keys, node->namespace_,
+                                        node->key, strlen(node->key),
+                                        node->seed, node->array->buffer[i],
+                                        NULL) != GAUGED_OK) {
+                gauged_writer_hash_free(hash);
+                return NULL;
+            }
+        }
+    }
+    for (node = detached->array_head; node; node = node->array_next) {
+        node->array->length = 0;
+    }
+    writer->pending = hash;
+    writer->generation++;
+    return detached;
+}
+
+GAUGED_EXPORT void gauged_writer_detached_free(gauged_writer_hash_t *hash) {
+    gauged_writer_hash_free(hash);
+}
+
+static void gauged_writer_parse_query_length(gauged_writer_t *writer,
+                                             const char *query,
+                                             size_t query_len) {
     writer->buffer_size = 0;
     if (!query) {
         return;
     }
-    size_t query_len = strlen(query) + 1;
-    if (query_len >= 2 && query[query_len - 2] == '\n') {
+    if (query_len && query[query_len - 1] == '\n') {
         query_len--;
     }
-    if (query_len > GAUGED_WRITER_MAX_QUERY) {
-        query_len = GAUGED_WRITER_MAX_QUERY;
+    if (!gauged_writer_reserve(&writer->copy, &writer->copy_size,
+                               query_len + 1)) {
+        return;
     }
     memcpy(writer->copy, query, query_len);
-    writer->copy[query_len - 1] = '\0';
-    char *str = writer->copy;
-    char c;
-    size_t key_width = 0, value_width = 0, pos = 0;
-    bool in_key = true;
-    char *key_start = str, *value_start = NULL;
-    while (1) {
-        c = *str++;
-        if (c == '&' || c == '\0') {
-            if (key_width) {
-                key_start[key_width] = '\0';
-                gauged_writer_url_decode(key_start, key_start, key_width);
-                if (value_start) {
-                    value_start[value_width] = '\0';
-                    gauged_writer_url_decode(value_start, value_start,
-                                             value_width);
-                    writer->buffer[pos++] = key_start;
-                    writer->buffer[pos++] = value_start;
-                    writer->buffer_size += 2;
-                    if (writer->buffer_size == GAUGED_WRITER_MAX_PAIRS * 2) {
-                        break;
-                    }
-                }
-            }
-            if (c == '\0') {
-                break;
-            }
-            key_width = value_width = 0;
-            value_start = NULL;
-            key_start = str;
-            in_key = 1;
-        } else if (in_key) {
-            if (c == '=') {
-                in_key = 0;
-                value_start = str;
-            } else {
-                key_width++;
+    writer->copy[query_len] = '\0';
+    char *pair = writer->copy, *end = pair + query_len, *separator, *equals;
+    size_t key_length;
+    for (; pair < end; pair = separator + 1) {
+        separator = memchr(pair, '&', end - pair);
+        if (!separator) {
+            separator = end;
+        }
+        *separator = '\0';
+        equals = memchr(pair, '=', separator - pair);
+        if (!equals || equals == pair) {
+            continue;
+        }
+        if (writer->buffer_size + 2 > writer->buffer_capacity) {
+            size_t capacity = writer->buffer_capacity * 2;
+            char **buffer = realloc(writer->buffer, capacity * sizeof(char *));
+            if (!buffer) {
+                return;
             }
-        } else {
-            value_width++;
+            writer->buffer = buffer;
+            writer->buffer_capacity = capacity;
         }
+        key_length = equals - pair;
+        gauged_writer_url_decode(pair, pair, key_length);
+        gauged_writer_url_decode(equals + 1, equals + 1,
+                                 separator - equals - 1);
+        writer->buffer[writer->buffer_size++] = pair;
+        writer->buffer[writer->buffer_size++] = equals + 1;
     }
 }
 
+GAUGED_EXPORT void gauged_writer_parse_query(gauged_writer_t *writer,
+                                             const char *query) {
+    gauged_writer_parse_query_length(writer, query, query ? strlen(query) : 0);
+}
+
 GAUGED_EXPORT void init_gauged() {}
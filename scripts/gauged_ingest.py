@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+from gauged import Gauged
+from mmap import mmap, ACCESS_READ
+from os.path import getsize
+from time import time
+import argparse
+import logging
+import sys
+
+
+def ingest(writer, handle, namespace=None, resume_from=0):
+    """Replay `timestamp<TAB>query-string` lines into the writer. Payloads
+    are passed to the writer as buffers over the memory-mapped file so that
+    no Python string is created for them. Returns a tuple of
+    (lines, skipped)"""
+    try:
+        data = mmap(handle.fileno(), 0, access=ACCESS_READ)
+    except ValueError:  # empty file
+        return 0, 0
+    lines = skipped = position = 0
+    size = len(data)
+    find = data.find
+    add = writer.add
+    try:
+        while position < size:
+            end = find('\n', position)
+            if end == -1:
+                end = size
+            tab = find('\t', position, end)
+            if tab == -1:
+                if end > position:
+                    logging.warning('skipping malformed line at byte %s',
+                                    position)
+                    skipped += 1
+                position = end + 1
+                continue
+            try:
+                timestamp = long(data[position:tab])
+            except ValueError:
+                timestamp = None
+            if timestamp is None:
+                logging.warning('skipping malformed line at byte %s',
+                                position)
+                skipped += 1
+            elif timestamp < resume_from:
+                skipped += 1
+            else:
+                add(buffer(data, tab + 1, end - tab - 1), timestamp=timestamp,
+                    namespace=namespace)
+                lines += 1
+            position = end + 1
+    finally:
+        data.close()
+    return lines, skipped
+
+
+def main(options):
+    gauged = Gauged(options.uri, block_size=options.block_size,
+                    resolution=options.resolution, key_overflow=Gauged.IGNORE,
+                    gauge_nan=Gauged.IGNORE, writer_name=options.writer_name)
+    gauged.sync()
+    total_lines = total_skipped = total_bytes = 0
+    start = time()
+    with gauged.writer as writer:
+        resume_from = writer.resume_from()
+        if resume_from:
+            logging.info('resuming from %s', resume_from)
+        for path in options.files:
+            with open(path, 'rb') as handle:
+                lines, skipped = ingest(writer, handle, options.namespace,
+                                        resume_from)
+            logging.info('%s: %s lines written, %s skipped', path, lines,
+                         skipped)
+            total_bytes += getsize(path)
+            total_lines += lines
+            total_skipped += skipped
+    elapsed = max(time() - start, 1e-6)
+    statistics = gauged.statistics()
+    print 'Wrote %s lines in %ss (%s lines/s, %s MB/s), skipped %s' % \
+        (total_lines, round(elapsed, 3), int(total_lines / elapsed),
+         round(total_bytes / elapsed / 1048576, 2), total_skipped)
+    print 'The database now holds %s data points' % statistics.data_points
+    return 0
+
+
+if __name__ == '__main__':
+    descr = 'Ingest timestamp<TAB>query-string lines into a Gauged database'
+    parser = argparse.ArgumentParser(description=descr)
+    parser.add_argument(
+        '-v', '--verbose',
+        help='Enable basic logging',
+        action='store_const', dest='loglevel',
+        const=logging.INFO,
+        default=logging.WARNING
+    )
+    parser.add_argument(
+        '-u', '--uri',
+        help='Uri to the Gauged Database',
+        action='store',
+        required=True
+    )
+    parser.add_argument(
+        '-n', '--namespace',
+        help='The namespace to write to',
+        type=int, default=None
+    )
+    parser.add_argument(
+        '-w', '--writer-name',
+        help='The writer name used to track the resume position',
+        default='default'
+    )
+    parser.add_argument(
+        '-b', '--block-size',
+        help='The block size to use',
+        type=int, default=Gauged.DAY
+    )
+    parser.add_argument(
+        '-r', '--resolution',
+        help='The resolution to use',
+        type=int, default=Gauged.SECOND
+    )
+    parser.add_argument('files', nargs='+', help='Files to ingest')
+    options = parser.parse_args()
+    logging.basicConfig(level=options.loglevel)
+
+    rtn = main(options)
+
+    sys.exit(rtn)
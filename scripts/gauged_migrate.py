@@ -45,6 +45,10 @@ def migrate(options):
         logging.info('successfully migrated to %s', version)
         gauged.driver.set_metadata({'current_version': version})
         current_version = version
+    # Record where block summaries and rollups start for the existing data
+    gauged.sync()
+    return 0
+
 
 if __name__ == '__main__':
     descr = 'Migrate a Gauged database to the latest version'
@@ -8,7 +8,7 @@ from distutils.core import setup, Extension
 
 cflags = ['-O3', '-std=c99', '-pedantic', '-Wall', '-Wextra', '-pthread']
 
-src = ('array', 'hash', 'sort', 'map', 'writer')
+src = ('arena', 'array', 'hash', 'sort', 'map', 'codec', 'writer')
 
 gauged = Extension('_gauged', sources=['lib/%s.c' % f for f in src],
                    include_dirs=['include'], extra_compile_args=cflags)
@@ -5,6 +5,7 @@
 
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 #include <time.h>
 
 #include "test.h"
@@ -15,6 +16,11 @@
 #define ARRAY_SIZE_HUMAN "4"
 #define ARRAY_FLOATS_TOTAL "40M"
 
+#define QUERY_PAIRS 1000000
+#define QUERY_PAIRS_HUMAN "1M"
+#define QUERY_KEYS 1000
+#define QUERY_CHUNK (64 * 1024)
+
 gauged_map_t *gauged_map_random(size_t array_count, size_t array_size) {
     gauged_map_t *map = gauged_map_new();
     gauged_array_t *array = gauged_array_new();
@@ -40,6 +46,50 @@ error:
     return NULL;
 }
 
+char *gauged_query_random(size_t pairs, size_t *length) {
+    char *query = malloc(pairs * 32);
+    if (!query) {
+        return NULL;
+    }
+    size_t position = 0;
+    for (size_t i = 0; i < pairs; i++) {
+        position += sprintf(query + position, "%smetric.%zu=%.3f",
+                            i ? "&" : "", i % QUERY_KEYS, drand48() * 1000);
+    }
+    *length = position;
+    return query;
+}
+
+void gauged_bench_writer_hash(size_t count, const char *human,
+                              size_t expected_keys) {
+    char *keys = malloc(count * 16), *key;
+    assert(keys);
+    size_t keys_length = 0;
+    for (size_t i = 0; i < count; i++) {
+        keys_length += sprintf(keys + keys_length, "gauge.%zu", i) + 1;
+    }
+    gauged_writer_t *writer = gauged_writer_new(0, 0, expected_keys);
+    assert(writer);
+    char message[128];
+    sprintf(message, "Inserting %s keys%s", human,
+            expected_keys ? " (pre-sized)" : "");
+    GAUGED_BENCH_START(message);
+    for (key = keys; key < keys + keys_length; key += strlen(key) + 1) {
+        gauged_writer_emit(writer, 0, key, 1);
+    }
+    GAUGED_BENCH_END(keys_length);
+    if (!expected_keys) {
+        sprintf(message, "Updating %s keys", human);
+        GAUGED_BENCH_START(message);
+        for (key = keys; key < keys + keys_length; key += strlen(key) + 1) {
+            gauged_writer_emit(writer, 0, key, 2);
+        }
+        GAUGED_BENCH_END(keys_length);
+    }
+    gauged_writer_free(writer);
+    free(keys);
+}
+
 int main() {
     gauged_map_t *map, *copy;
     volatile float result;
@@ -56,6 +106,32 @@ int main() {
     assert(map);
     GAUGED_BENCH_END(map->length);
 
+    GAUGED_SUITE("Codec");
+
+    gauged_map_t *encoded = gauged_map_new(), *decoded;
+    assert(encoded);
+    GAUGED_BENCH_START("Encoding the map");
+    int encoded_ok =
+        gauged_codec_encode(encoded, map->buffer, gauged_map_length(map));
+    assert(encoded_ok);
+    GAUGED_BENCH_END(size);
+    GAUGED_BENCH_START("Decoding the map");
+    decoded = gauged_codec_decode(encoded->buffer, gauged_map_length(encoded));
+    assert(decoded);
+    GAUGED_BENCH_END(size);
+    (void)encoded_ok;
+    gauged_map_free(decoded);
+    gauged_map_free(encoded);
+
+    GAUGED_SUITE("Seek");
+
+    GAUGED_BENCH_START("Last before 1000 random positions");
+    for (size_t i = 0; i < 1000; i++) {
+        result =
+            gauged_map_last_before(map, (uint32_t)(drand48() * ARRAY_COUNT));
+    }
+    GAUGED_BENCH_END(size);
+
     GAUGED_SUITE("Aggregates");
 
     GAUGED_BENCH_START("First");
@@ -112,6 +188,51 @@ int main() {
 
     gauged_map_free(map);
 
+    GAUGED_SUITE("Writer");
+
+    size_t query_length;
+    char *query = gauged_query_random(QUERY_PAIRS, &query_length);
+    assert(query);
+    gauged_writer_t *writer = gauged_writer_new(0, QUERY_KEYS, 0);
+    assert(writer);
+    uint32_t data_points = 0;
+
+    GAUGED_BENCH_START("Parsing " QUERY_PAIRS_HUMAN " values with strtof");
+    char *value = query;
+    while ((value = strchr(value, '='))) {
+        result = strtof(++value, NULL);
+    }
+    GAUGED_BENCH_END(query_length);
+    GAUGED_BENCH_START("Emitting a query of " QUERY_PAIRS_HUMAN " pairs");
+    assert(gauged_writer_emit_pairs_length(writer, 0, query, query_length,
+                                           &data_points));
+    GAUGED_BENCH_END(query_length);
+    assert(data_points == QUERY_PAIRS);
+    gauged_writer_flush_maps(writer, false);
+    GAUGED_BENCH_START("Emitting a query of " QUERY_PAIRS_HUMAN
+                       " pairs in 64KB chunks");
+    for (size_t offset = 0; offset < query_length; offset += QUERY_CHUNK) {
+        size_t chunk = query_length - offset;
+        if (chunk > QUERY_CHUNK) {
+            chunk = QUERY_CHUNK;
+        }
+        assert(gauged_writer_emit_pairs_chunk(
+            writer, 0, query + offset, chunk, offset + chunk == query_length,
+            &data_points));
+    }
+    GAUGED_BENCH_END(query_length);
+    assert(data_points == QUERY_PAIRS * 2);
+
+    gauged_writer_free(writer);
+    free(query);
+
+    GAUGED_SUITE("Writer hash");
+
+    gauged_bench_writer_hash(10000, "10K", 0);
+    gauged_bench_writer_hash(1000000, "1M", 0);
+    gauged_bench_writer_hash(1000000, "1M", 1000000);
+    gauged_bench_writer_hash(10000000, "10M", 0);
+
     puts("");
 
     return 0;
@@ -17,7 +17,7 @@ int main() {
 
     GAUGED_SUITE("Writer");
 
-    gauged_writer_t *writer = gauged_writer_new(4);
+    gauged_writer_t *writer = gauged_writer_new(4, 16, 0);
     assert(writer);
 
     gauged_writer_emit(writer, 0, "foo", 10);
@@ -37,13 +37,60 @@ int main() {
     data_points = 0;
     gauged_writer_emit_pairs(writer, 1, "baz=60&ignore=me", &data_points);
     GAUGED_EXPECT("Writer emit pairs tracks data points B", data_points == 1);
+    gauged_writer_errors_t pair_errors;
+    data_points = 0;
+    gauged_writer_emit_pairs(writer, 1, "foooo=1&baz=x&fooooo=3", &data_points);
+    gauged_writer_errors(writer, &pair_errors);
+    GAUGED_EXPECT("Emit pairs records large keys",
+                  data_points == 0 && pair_errors.overflow_count == 2 &&
+                      pair_errors.nan_count == 1 &&
+                      pair_errors.statuses[0] == GAUGED_KEY_OVERFLOW &&
+                      !strcmp(pair_errors.keys[2], "fooooo"));
     gauged_writer_flush_arrays(writer, 11);
 
+    const char *batch_keys[] = {"foo", "fooooo", "bazqux"};
+    size_t batch_lengths[] = {3, 6, 3};
+    uint32_t batch_namespaces[] = {0, 0, 1};
+    float batch_values[] = {5, 6, 7};
+    int batch_statuses[3];
+    data_points = 0;
+    GAUGED_EXPECT("Writer emit batch",
+                  gauged_writer_emit_batch(writer, batch_namespaces,
+                                           batch_keys, batch_lengths,
+                                           batch_values, 3, batch_statuses,
+                                           &data_points));
+    GAUGED_EXPECT("Writer emit batch tracks data points", data_points == 2);
+    GAUGED_EXPECT("Writer emit batch statuses",
+                  batch_statuses[0] == GAUGED_OK &&
+                      batch_statuses[1] == GAUGED_KEY_OVERFLOW &&
+                      batch_statuses[2] == GAUGED_OK);
+    float nan_values[] = {5, NAN, 7};
+    size_t batch_index = 0;
+    GAUGED_EXPECT("Writer check batch finds large keys",
+                  GAUGED_KEY_OVERFLOW ==
+                          gauged_writer_check_batch(writer, batch_keys,
+                                                    batch_lengths, nan_values,
+                                                    3, false, true,
+                                                    &batch_index) &&
+                      batch_index == 1);
+    GAUGED_EXPECT("Writer check batch finds NaN",
+                  GAUGED_GAUGE_NAN ==
+                          gauged_writer_check_batch(writer, batch_keys,
+                                                    batch_lengths, nan_values,
+                                                    3, true, false,
+                                                    &batch_index) &&
+                      batch_index == 1);
+    GAUGED_EXPECT("Writer check batch",
+                  GAUGED_OK == gauged_writer_check_batch(
+                                   writer, batch_keys, batch_lengths,
+                                   batch_values, 3, true, false, &batch_index));
+    gauged_writer_flush_arrays(writer, 12);
+
     uint32_t expected_maps = 0;
     gauged_writer_hash_node_t *node;
     for (size_t i = 0; i < writer->pending->size; i++) {
-        if (writer->pending->nodes[i]) {
-            node = writer->pending->nodes[i];
+        if (writer->pending->buckets[i].distance) {
+            node = writer->pending->buckets[i].node;
             map = node->map;
             if (node->namespace_ == 0) {
                 if (!strcmp("foo", node->key)) {
@@ -52,7 +99,7 @@ int main() {
                     GAUGED_EXPECT("Pending map stores the key A",
                                   0 == strcmp("foo", node->key));
                     GAUGED_EXPECT_FLOAT_EQUALS("Pending map stores the map A",
-                                               gauged_map_sum(map), 30);
+                                               gauged_map_sum(map), 35);
                 } else {
                     GAUGED_EXPECT("Pending map stores the namespace B",
                                   0 == node->namespace_);
@@ -67,7 +114,7 @@ int main() {
                 GAUGED_EXPECT("Pending map stores the key C",
                               0 == strcmp("baz", node->key));
                 GAUGED_EXPECT_FLOAT_EQUALS("Pending map stores the map C",
-                                           gauged_map_sum(map), 130);
+                                           gauged_map_sum(map), 137);
             }
             expected_maps++;
         }
@@ -76,12 +123,53 @@ int main() {
     GAUGED_EXPECT("Pending map count", 3 == expected_maps);
 
     GAUGED_EXPECT("Pending map size before flush", 3 == writer->pending->count);
+
+    gauged_writer_hash_node_t *unresolved[3];
+    GAUGED_EXPECT("Unresolved keys",
+                  3 == gauged_writer_unresolved(writer, unresolved, 3));
+    uint32_t key_ids[3] = {7, 8, 9};
+    gauged_writer_resolve(writer, unresolved, key_ids, 3);
+    GAUGED_EXPECT("Unresolved keys after resolving",
+                  0 == gauged_writer_unresolved(writer, unresolved, 3));
+    uint32_t export_namespaces[3], export_ids[3], *export_buffers[3];
+    size_t export_lengths[3];
+    GAUGED_EXPECT("Export maps",
+                  3 == gauged_writer_export(writer->pending, export_namespaces,
+                                            export_ids, export_buffers,
+                                            export_lengths));
+    GAUGED_EXPECT("Export key IDs", export_ids[0] == 7 && export_ids[2] == 9);
+
+    GAUGED_EXPECT("Pending bytes before flush", writer->pending->bytes > 0);
     gauged_writer_flush_maps(writer, true);
     GAUGED_EXPECT("Pending map size after soft flush",
                   3 == writer->pending->count);
+    GAUGED_EXPECT("Pending bytes after soft flush",
+                  0 == writer->pending->bytes);
     gauged_writer_flush_maps(writer, false);
     GAUGED_EXPECT("Pending map size after flush", 0 == writer->pending->count);
 
+    gauged_writer_emit(writer, 0, "foo", 1);
+    gauged_writer_emit(writer, 0, "bar", 1);
+    GAUGED_EXPECT("Pending bytes count array values",
+                  2 * sizeof(float) == writer->pending->bytes);
+    gauged_writer_flush_arrays(writer, 1);
+    GAUGED_EXPECT("Pending bytes count map headers",
+                  4 * sizeof(uint32_t) == writer->pending->bytes);
+    gauged_writer_emit(writer, 0, "foo", 1);
+    GAUGED_EXPECT("Active keys", 2 == writer->pending->active);
+    gauged_writer_flush_maps(writer, true);
+    GAUGED_EXPECT("Active keys after soft flush",
+                  1 == writer->pending->active &&
+                      2 == writer->pending->count);
+    gauged_writer_emit(writer, 0, "bar", 1);
+    gauged_writer_emit(writer, 0, "bar", 1);
+    GAUGED_EXPECT("Active keys count each key once",
+                  2 == writer->pending->active);
+    GAUGED_EXPECT("Key IDs persist across flushes",
+                  1 == gauged_writer_unresolved(writer, unresolved, 3) &&
+                      !strcmp(unresolved[0]->key, "bar"));
+    gauged_writer_flush_maps(writer, false);
+
     gauged_writer_parse_query(writer,
                               "foo=bar&baz&bah=&%3Ckey%3E=%3D%3Dvalue%3D%3D%3");
 
@@ -108,7 +196,7 @@ int main() {
 
     gauged_writer_free(writer);
 
-    writer = gauged_writer_new(4);
+    writer = gauged_writer_new(4, 16, 0);
 
     char key[2] = {'A', '\0'};
     for (char c = 'A'; c <= 'Z'; c++) {
@@ -120,8 +208,8 @@ int main() {
     expected_maps = 0;
     float writer_sum = 0;
     for (size_t i = 0; i < writer->pending->size; i++) {
-        if (writer->pending->nodes[i]) {
-            node = writer->pending->nodes[i];
+        if (writer->pending->buckets[i].distance) {
+            node = writer->pending->buckets[i].node;
             writer_sum += gauged_map_sum(node->map);
             expected_maps++;
         }
@@ -130,6 +218,235 @@ int main() {
     GAUGED_EXPECT("Count of all maps", expected_maps == 26);
     GAUGED_EXPECT_FLOAT_EQUALS("Sum of all maps", writer_sum, 260);
 
+    gauged_writer_emit(writer, 0, "A", 5);
+    gauged_writer_hash_t *detached = gauged_writer_detach(writer);
+    assert(detached);
+    GAUGED_EXPECT("Detached hash keeps its maps", detached->count == 26);
+    GAUGED_EXPECT("Pending array moved to the new hash",
+                  writer->pending->count == 1 &&
+                      writer->pending->head->array->length == 1 &&
+                      writer->pending->head->array->buffer[0] == 5);
+    GAUGED_EXPECT("Pending array removed from the detached hash",
+                  detached->array_head->array->length == 0);
+    gauged_writer_detached_free(detached);
+
+    gauged_writer_free(writer);
+
+    writer = gauged_writer_new(4, 0, 0);
+    assert(writer);
+    uint32_t handle_foo, handle_bar, handle_long, handle_same;
+    uint32_t emit_handles[4];
+    float handle_values[] = {1, 2, 3, NAN};
+    int handle_statuses[4];
+    GAUGED_EXPECT("Register keys",
+                  gauged_writer_register(writer, 0, "foo", 3, &handle_foo) ==
+                          GAUGED_OK &&
+                      gauged_writer_register(writer, 1, "foo", 3,
+                                             &handle_bar) == GAUGED_OK &&
+                      handle_foo != handle_bar);
+    GAUGED_EXPECT("Registering a key twice returns the same handle",
+                  gauged_writer_register(writer, 0, "foo", 3, &handle_same) ==
+                          GAUGED_OK &&
+                      handle_same == handle_foo);
+    GAUGED_EXPECT("Register checks the key length",
+                  gauged_writer_register(writer, 0, "foooo", 5,
+                                         &handle_long) ==
+                      GAUGED_KEY_OVERFLOW);
+    emit_handles[0] = handle_foo;
+    emit_handles[1] = handle_bar;
+    emit_handles[2] = handle_long;
+    emit_handles[3] = handle_foo;
+    data_points = 0;
+    gauged_writer_emit_handles(writer, emit_handles, handle_values, 4,
+                               handle_statuses, &data_points);
+    GAUGED_EXPECT("Emit handles",
+                  data_points == 2 && writer->pending->count == 2 &&
+                      handle_statuses[2] == GAUGED_KEY_OVERFLOW &&
+                      handle_statuses[3] == GAUGED_GAUGE_NAN &&
+                      writer->errors.nan_count == 1);
+    gauged_writer_hash_node_t *handle_node = writer->handles[handle_foo].node;
+    gauged_writer_flush_arrays(writer, 1);
+    gauged_writer_flush_maps(writer, true);
+    gauged_writer_emit_handles(writer, emit_handles, handle_values, 1, NULL,
+                               &data_points);
+    GAUGED_EXPECT("Handles stay valid across soft flushes",
+                  writer->handles[handle_foo].node == handle_node &&
+                      handle_node->array->length == 1 &&
+                      writer->pending->array_head == handle_node);
+    gauged_writer_flush_maps(writer, false);
+    gauged_writer_emit_handles(writer, emit_handles, handle_values, 2, NULL,
+                               &data_points);
+    GAUGED_EXPECT("Handles are resolved again after hard flushes",
+                  writer->pending->count == 2 &&
+                      writer->handles[handle_foo].generation ==
+                          writer->generation &&
+                      !strcmp(writer->handles[handle_foo].node->key, "foo"));
+    gauged_writer_free(writer);
+
+    writer = gauged_writer_new(0, 0, 1000);
+    assert(writer);
+    GAUGED_EXPECT("Writer hash is sized for the expected keys",
+                  writer->pending->size == 2048);
+    gauged_writer_free(writer);
+
+    writer = gauged_writer_new(0, 0, 0);
+    assert(writer);
+    char hash_key[16];
+    bool migrating = false, hash_found = true;
+    for (size_t i = 0; i < 5000; i++) {
+        sprintf(hash_key, "k%zu", i);
+        gauged_writer_emit(writer, 0, hash_key, 1);
+        migrating |= writer->pending->old_buckets != NULL;
+    }
+    for (size_t i = 0; i < 5000; i++) {
+        sprintf(hash_key, "k%zu", 4999 - i);
+        gauged_writer_emit(writer, 0, hash_key, 2);
+    }
+    for (node = writer->pending->head; node; node = node->next) {
+        hash_found &= node->array->length == 2;
+    }
+    GAUGED_EXPECT("Writer hash grows incrementally", migrating);
+    GAUGED_EXPECT("Writer hash finds keys while growing",
+                  writer->pending->count == 5000 && hash_found);
+    gauged_writer_flush_maps(writer, false);
+    GAUGED_EXPECT("Hard flush empties the writer hash",
+                  !writer->pending->count && !writer->pending->old_buckets);
+    gauged_writer_emit(writer, 0, "k1", 1);
+    GAUGED_EXPECT("Writer hash is reused after a hard flush",
+                  writer->pending->count == 1);
+    gauged_writer_free(writer);
+
+    writer = gauged_writer_new(0, 16, 0);
+    assert(writer);
+
+    const char *whitelist[] = {"foo", "bar", "foo"};
+    const char *allow[] = {"app."};
+    const char *deny[] = {"app.debug.", "ba"};
+    assert(gauged_writer_whitelist(writer, whitelist, 3));
+    GAUGED_EXPECT("Whitelist accepts keys", gauged_writer_accept(writer,
+                                                                 "foo", 3));
+    GAUGED_EXPECT("Whitelist compares the whole key",
+                  !gauged_writer_accept(writer, "foobar", 3 + 3) &&
+                      !gauged_writer_accept(writer, "fo", 2));
+    GAUGED_EXPECT("Whitelist rejects keys",
+                  GAUGED_KEY_FILTERED ==
+                      gauged_writer_emit(writer, 0, "baz", 1));
+    assert(gauged_writer_prefixes(writer, allow, 1, true));
+    assert(gauged_writer_prefixes(writer, deny, 2, false));
+    GAUGED_EXPECT("Allowed prefixes extend the whitelist",
+                  gauged_writer_accept(writer, "app.requests", 12));
+    GAUGED_EXPECT("Denied prefixes override the whitelist",
+                  !gauged_writer_accept(writer, "bar", 3) &&
+                      !gauged_writer_accept(writer, "app.debug.x", 11));
+    data_points = 0;
+    gauged_writer_emit_pairs(writer, 0, "foo=1&bar=2&app.x=3&qux=4",
+                             &data_points);
+    GAUGED_EXPECT("Emit pairs skips filtered keys",
+                  data_points == 2 && writer->pending->count == 2);
+
+    gauged_writer_errors_t errors;
+    data_points = 0;
+    gauged_writer_emit_pairs(writer, 0, "foo=x&qux=nan&app.y=nan&foo=1",
+                             &data_points);
+    gauged_writer_errors(writer, &errors);
+    GAUGED_EXPECT("Emit pairs records NaN keys which aren't filtered",
+                  data_points == 1 && errors.nan_count == 2 &&
+                      errors.overflow_count == 0 && errors.count == 2 &&
+                      errors.statuses[1] == GAUGED_GAUGE_NAN &&
+                      !strcmp(errors.keys[1], "app.y"));
+
+    gauged_writer_free(writer);
+
+    const char *route_pairs = "a=1&b%20c=2&b+c=3&=4&d=5\n";
+    char routed[32];
+    size_t route_offsets[5];
+    uint32_t routes[2];
+    const char *route_keys[] = {"b c", "d"};
+    size_t route_lengths[] = {3, 1};
+    assert(gauged_writer_route(route_pairs, strlen(route_pairs), 4, routed,
+                               route_offsets));
+    gauged_writer_route_keys(route_keys, route_lengths, 2, 4, routes);
+    GAUGED_EXPECT("Route copies every pair with a key",
+                  route_offsets[0] == 0 &&
+                      route_offsets[4] == strlen("a=1&b%20c=2&b+c=3&d=5&"));
+    char shard_b[32], shard_d[32];
+    size_t shard_length =
+        route_offsets[routes[0] + 1] - route_offsets[routes[0]];
+    memcpy(shard_b, routed + route_offsets[routes[0]], shard_length);
+    shard_b[shard_length] = '\0';
+    shard_length = route_offsets[routes[1] + 1] - route_offsets[routes[1]];
+    memcpy(shard_d, routed + route_offsets[routes[1]], shard_length);
+    shard_d[shard_length] = '\0';
+    GAUGED_EXPECT("Route hashes decoded keys",
+                  strstr(shard_b, "b%20c=2&") && strstr(shard_b, "b+c=3&"));
+    GAUGED_EXPECT("Route keys matches route", strstr(shard_d, "d=5&"));
+
+    writer = gauged_writer_new(0, 16, 0);
+    assert(writer);
+
+    const char *chunks[] = {"a=1&b=2", "5&c%2", "0d=", "-1.5e1&", "d=3\n"};
+    data_points = 0;
+    for (size_t i = 0; i < 5; i++) {
+        assert(gauged_writer_emit_pairs_chunk(writer, 0, chunks[i],
+                                              strlen(chunks[i]), i == 4,
+                                              &data_points));
+    }
+    GAUGED_EXPECT("Emit pairs chunk joins pairs split across chunks",
+                  data_points == 4 && !writer->streaming &&
+                      !writer->partial_length);
+    float chunk_sum = 0;
+    for (node = writer->pending->array_head; node; node = node->array_next) {
+        chunk_sum += node->array->buffer[0];
+        if (!strcmp(node->key, "c d")) {
+            GAUGED_EXPECT_FLOAT_EQUALS("Emit pairs chunk decodes keys",
+                                       node->array->buffer[0], -15);
+        }
+    }
+    GAUGED_EXPECT_FLOAT_EQUALS("Emit pairs chunk values", chunk_sum, 14);
+
+    const char *floats[] = {"0.1",    "-2.5e-3", "1e10",     "+.5",
+                            "7.",     "1.5E2",   "123456789012345678",
+                            "3.4e38", "1e-40",   "0.000001"};
+    gauged_writer_errors_t float_errors;
+    char float_query[32];
+    float parsed;
+    bool floats_match = true;
+    for (size_t i = 0; i < sizeof(floats) / sizeof(floats[0]); i++) {
+        gauged_writer_flush_maps(writer, false);
+        sprintf(float_query, "f=%s", floats[i]);
+        gauged_writer_emit_pairs(writer, 0, float_query, &data_points);
+        parsed = writer->pending->array_head->array->buffer[0];
+        floats_match &= parsed == strtof(floats[i], NULL);
+    }
+    GAUGED_EXPECT("Emit pairs parses floats like strtof", floats_match);
+    gauged_writer_flush_maps(writer, false);
+    data_points = 0;
+    gauged_writer_emit_pairs(writer, 0, "a=1x&b=&c=.&d=e5&e=1e&f=inf",
+                             &data_points);
+    gauged_writer_errors(writer, &float_errors);
+    GAUGED_EXPECT("Emit pairs rejects malformed numbers",
+                  data_points == 1 && float_errors.nan_count == 5);
+
+    size_t large_count = 20000;
+    char *large_query = malloc(large_count * 12);
+    assert(large_query);
+    size_t large_length = 0;
+    for (size_t i = 0; i < large_count; i++) {
+        large_length += sprintf(large_query + large_length, "%sk%zu=1",
+                                i ? "&" : "", i % 5000);
+    }
+    gauged_writer_flush_maps(writer, false);
+    data_points = 0;
+    gauged_writer_emit_pairs(writer, 0, large_query, &data_points);
+    GAUGED_EXPECT("Emit pairs doesn't truncate large queries",
+                  data_points == large_count &&
+                      writer->pending->count == 5000);
+    gauged_writer_parse_query(writer, large_query);
+    GAUGED_EXPECT("Parse query doesn't truncate large queries",
+                  writer->buffer_size == large_count * 2 &&
+                      !strcmp(writer->buffer[large_count * 2 - 2], "k4999"));
+    free(large_query);
+
     gauged_writer_free(writer);
 
     GAUGED_SUITE("Arrays");
@@ -201,6 +518,123 @@ int main() {
     GAUGED_EXPECT_FLOAT_EQUALS("Map concat B", gauged_map_sum(map_copy), 200);
     gauged_map_free(map_copy);
 
+    GAUGED_EXPECT("Map seek A", gauged_map_seek(map, 0) == 0);
+    GAUGED_EXPECT("Map seek B", gauged_map_seek(map, 13) == 5);
+    GAUGED_EXPECT("Map seek C", gauged_map_seek(map, 21) == map->length);
+    GAUGED_EXPECT("Map last before A", isnan(gauged_map_last_before(map, 10)));
+    GAUGED_EXPECT_FLOAT_EQUALS("Map last before B",
+                               gauged_map_last_before(map, 20), 100);
+
+    gauged_map_clear(map);
+    for (uint32_t position = 0; position < 1000; position += 2) {
+        gauged_array_clear(array);
+        gauged_array_append(array, (float)position);
+        if (position % 3) {
+            gauged_array_append(array, (float)position + 0.5f);
+        }
+        gauged_map_append(map, position * (position < 600 ? 1 : 10000),
+                          array);
+    }
+    GAUGED_EXPECT_FLOAT_EQUALS("Map index A",
+                               gauged_map_last_before(map, 401), 400.5);
+    GAUGED_EXPECT_FLOAT_EQUALS("Map index B",
+                               gauged_map_last_before(map, 100), 98.5);
+    GAUGED_EXPECT("Map index C", map->index && map->index->words < map->length);
+    GAUGED_EXPECT_FLOAT_EQUALS("Map index D",
+                               gauged_map_last_before(map, 6000000), 598.5);
+    GAUGED_EXPECT_FLOAT_EQUALS("Map index E",
+                               gauged_map_last_before(map, 0xFFFFFFFF), 998.5);
+    map_copy = gauged_map_new();
+    assert(map_copy);
+    gauged_map_concat(map_copy, map, 301, 305, 0);
+    GAUGED_EXPECT_FLOAT_EQUALS("Map index F", gauged_map_sum(map_copy),
+                               1213);
+    gauged_map_clear(map_copy);
+    gauged_map_concat(map_copy, map, 6000000, 0, 0);
+    GAUGED_EXPECT_FLOAT_EQUALS("Map index G", gauged_map_count(map_copy),
+                               333);
+    gauged_map_free(map_copy);
+    gauged_array_clear(array);
+    gauged_array_append(array, 5);
+    gauged_map_append(map, 0xFFFFFFFF, array);
+    GAUGED_EXPECT_FLOAT_EQUALS("Map index after append",
+                               gauged_map_last_before(map, 0xFFFFFFFF), 998.5);
+    GAUGED_EXPECT("Map index seek after append",
+                  gauged_map_seek(map, 0xFFFFFFFF) == map->length - 3);
+    gauged_map_clear(map);
+    gauged_map_append(map, 1, array);
+    GAUGED_EXPECT_FLOAT_EQUALS("Map index after clear",
+                               gauged_map_last_before(map, 2), 5);
+
+    GAUGED_SUITE("Codec");
+
+    gauged_map_t *encoded = gauged_map_new(), *decoded;
+    assert(encoded);
+    gauged_map_clear(map);
+    for (uint32_t position = 0; position < 1000; position++) {
+        gauged_array_clear(array);
+        gauged_array_append(array, 10.5f + (float)(position % 3));
+        if (position % 100 == 0) {
+            gauged_array_append(array, -1e30f);
+            gauged_array_append(array, NAN);
+        }
+        gauged_map_append(map, position * 2 + (position > 500) * 5000000,
+                          array);
+    }
+    gauged_codec_encode(encoded, gauged_map_export(map),
+                        gauged_map_length(map));
+    GAUGED_EXPECT("Codec compresses", encoded->buffer[0] == 0 &&
+                                          gauged_map_length(encoded) * 4 <
+                                              gauged_map_length(map));
+    decoded = gauged_codec_decode(gauged_map_export(encoded),
+                                  gauged_map_length(encoded));
+    GAUGED_EXPECT("Codec roundtrip",
+                  decoded && decoded->length == map->length &&
+                      !memcmp(decoded->buffer, map->buffer,
+                              gauged_map_length(map)));
+    if (decoded) gauged_map_free(decoded);
+
+    gauged_map_t *block = gauged_map_new();
+    assert(block);
+    gauged_map_clear(map);
+    gauged_array_clear(array);
+    gauged_array_append(array, 1);
+    gauged_map_append(map, 1, array);
+    gauged_map_append(map, 2, array);
+    gauged_codec_encode(encoded, gauged_map_export(map),
+                        gauged_map_length(map));
+    GAUGED_EXPECT("Codec copies when compression doesn't help",
+                  encoded->length == map->length);
+    gauged_map_concat(block, map, 0, 0, 0);
+    gauged_map_clear(map);
+    for (uint32_t position = 3; position < 100; position++) {
+        gauged_map_append(map, position, array);
+    }
+    gauged_codec_encode(encoded, gauged_map_export(map),
+                        gauged_map_length(map));
+    gauged_map_reserve(block, encoded->length);
+    memcpy(block->buffer + block->length, encoded->buffer,
+           gauged_map_length(encoded));
+    block->length += encoded->length;
+    gauged_map_append(map, 100, array);
+    gauged_map_append(block, 100, array);
+    decoded = gauged_codec_decode(gauged_map_export(block),
+                                  gauged_map_length(block));
+    GAUGED_EXPECT("Codec decodes appended segments",
+                  decoded && gauged_map_count(decoded) == 100 &&
+                      gauged_map_sum(decoded) == 100);
+    if (decoded) gauged_map_free(decoded);
+    block->buffer[5] = 1000;
+    GAUGED_EXPECT("Codec rejects truncated blocks",
+                  !gauged_codec_decode(gauged_map_export(block),
+                                       gauged_map_length(block)));
+    block->buffer[4] = 1000;
+    GAUGED_EXPECT("Codec rejects truncated arrays",
+                  !gauged_codec_decode(gauged_map_export(block),
+                                       gauged_map_length(block)));
+    gauged_map_free(block);
+    gauged_map_free(encoded);
+
     GAUGED_SUITE("Aggregates");
 
     gauged_map_clear(map);
@@ -213,6 +647,11 @@ int main() {
     GAUGED_EXPECT("Empty map mean", isnan(gauged_map_mean(map)));
     GAUGED_EXPECT("Empty map stddev", isnan(gauged_map_stddev(map)));
     GAUGED_EXPECT_FLOAT_EQUALS("Empty map count", gauged_map_count(map), 0);
+    gauged_map_summary_t summary;
+    gauged_map_summary(map, &summary);
+    GAUGED_EXPECT("Empty map summary", !summary.count && !summary.sum &&
+                                           isnan(summary.min) &&
+                                           isnan(summary.last));
 
     gauged_array_clear(array);
     gauged_array_append(array, 0.0);
@@ -235,6 +674,25 @@ int main() {
     GAUGED_EXPECT_FLOAT_EQUALS("Map stddev", gauged_map_stddev(map),
                                9.224062735);
     GAUGED_EXPECT_FLOAT_EQUALS("Map count", gauged_map_count(map), 6);
+    gauged_map_summary(map, &summary);
+    GAUGED_EXPECT("Map summary",
+                  summary.count == 6 && summary.sum == 42 &&
+                      summary.min == -8 && summary.max == 20 &&
+                      summary.first == 0 && summary.last == 14.5f);
+    GAUGED_EXPECT_FLOAT_EQUALS("Map summary sum of squares",
+                               summary.sum_of_squares, 510.5);
+    gauged_map_rollup_t rollups[2];
+    GAUGED_EXPECT("Map rollup A",
+                  gauged_map_rollup(map, 3, rollups, 2) == 2 &&
+                      rollups[0].position == 9 && rollups[1].position == 12 &&
+                      rollups[0].summary.sum == 30 &&
+                      rollups[1].summary.min == -8);
+    GAUGED_EXPECT("Map rollup B",
+                  gauged_map_rollup(map, 5, rollups, 2) == 1 &&
+                      rollups[0].position == 10 &&
+                      rollups[0].summary.count == 6);
+    GAUGED_EXPECT("Map rollup size",
+                  gauged_map_rollup(map, 1, rollups, 1) == 1);
 
     copy = GAUGED_MAP_COPY(map);
     gauged_map_percentile(map, 0, &percentile);
@@ -285,5 +743,29 @@ int main() {
     gauged_map_free(map);
     gauged_array_free(array);
 
+    GAUGED_SUITE("Arena");
+
+    gauged_arena_t *arena = gauged_arena_new();
+    assert(arena);
+    char *small = gauged_arena_alloc(arena, 3);
+    char *next = gauged_arena_alloc(arena, 8);
+    GAUGED_EXPECT("Arena allocations are aligned", next - small == 8);
+    GAUGED_EXPECT("Arena reserves a single chunk", arena->chunks == 1);
+    char *huge = gauged_arena_alloc(arena, GAUGED_ARENA_MAX_CHUNK * 2);
+    GAUGED_EXPECT("Arena large allocation", huge && arena->chunks == 2);
+    GAUGED_EXPECT("Arena keeps the current chunk",
+                  gauged_arena_alloc(arena, 8) == next + 8);
+    void *buffer = gauged_arena_alloc_buffer(arena, 64);
+    gauged_arena_release_buffer(arena, buffer, 64);
+    GAUGED_EXPECT("Arena recycles buffers",
+                  arena->bytes_recycled == 64 &&
+                      gauged_arena_alloc_buffer(arena, 64) == buffer &&
+                      arena->bytes_recycled == 0);
+    gauged_arena_reset(arena);
+    GAUGED_EXPECT("Arena reset frees oversized chunks", arena->chunks == 1);
+    GAUGED_EXPECT("Arena reset reuses chunks",
+                  gauged_arena_alloc(arena, 3) == small && arena->chunks == 1);
+    gauged_arena_free(arena);
+
     GAUGED_END;
 }
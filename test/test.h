@@ -6,6 +6,7 @@
 #ifndef GAUGED_TEST_H_
 #define GAUGED_TEST_H_
 
+#include "codec.h"
 #include "ctest.h"
 #include "writer.h"
 
@@ -136,6 +136,71 @@ class TestDriver(TestCase):
         self.assertEqual(max_block, 1)
         self.assertItemsEqual(self.driver.get_namespaces(), [0, 1])
 
+    def test_namespace_statistics_many(self):
+        self.driver.add_namespace_statistics(0, 0, 1, 2)
+        self.driver.add_namespace_statistics_many([])
+        self.driver.add_namespace_statistics_many(
+            [(0, 0, 6, 7), (0, 1, 101, 102), (1, 0, 3, 4), (0, 1, 1, 1)])
+        self.assertEqual(self.driver.get_namespace_statistics(0, 0, 0),
+                         [7, 9])
+        self.assertEqual(self.driver.get_namespace_statistics(0, 1, 1),
+                         [102, 103])
+        self.assertEqual(self.driver.get_namespace_statistics(1, 0, 0),
+                         [3, 4])
+
+    def test_block_summaries(self):
+        self.driver.add_block_summaries([
+            (0, 1, 1, 2, 3, 1, 2, 0.5, 1, 2),
+            (0, 2, 1, 1, 5, 5, 5, 0, 5, 5)])
+        self.driver.add_block_summaries([(0, 1, 1, 2, 9, 3, 6, 4.5, 3, 6)])
+        self.assertEqual(self.driver.get_block_summaries(0, 1, 0, 1),
+                         [(4, 12, 1, 6, 14)])
+        self.assertEqual(len(self.driver.get_block_summaries(0, 1, 0, 2)), 2)
+        self.driver.replace_block_summaries([(0, 1, 1, 1, 7, 7, 7, 0, 7, 7)])
+        self.assertEqual(self.driver.get_block_summaries(0, 1, 1, 1),
+                         [(1, 7, 7, 7, 0)])
+        self.driver.clear_from(2, 20000)
+        self.assertEqual(self.driver.get_block_summaries(0, 1, 2, 2), [])
+
+    def test_rollups(self):
+        self.driver.add_rollups([
+            (0, 1, 1, 10, 100, 2, 3, 1, 2, 0.5),
+            (0, 1, 1, 10, 110, 1, 5, 5, 5, 0),
+            (0, 2, 1, 10, 200, 1, 7, 7, 7, 0),
+            (0, 1, 1, 20, 100, 3, 8, 1, 5, 8)])
+        self.driver.add_rollups([(0, 1, 1, 10, 100, 2, 9, 3, 6, 4.5)])
+        self.assertEqual(self.driver.get_rollups(0, 1, 10, 100, 200),
+                         [(100, 4, 12, 1, 6, 14), (110, 1, 5, 5, 5, 0)])
+        self.assertEqual(len(self.driver.get_rollups(0, 1, 10, 0, 201)), 3)
+        self.driver.replace_rollups([(0, 1, 1, 10, 110, 1, 2, 2, 2, 0)])
+        self.assertEqual(self.driver.get_rollups(0, 1, 10, 100, 200),
+                         [(110, 1, 2, 2, 2, 0)])
+        self.assertEqual(self.driver.get_rollups(0, 1, 20, 100, 200), [])
+        self.driver.clear_from(2, 20000)
+        self.assertEqual(self.driver.get_rollups(0, 1, 10, 200, 300), [])
+
+    def test_segments(self):
+        self.driver.replace_blocks([(0, 1, 2, 'foo', 0)])
+        self.driver.insert_segments([(0, 1, 2, 'bar', 0),
+                                     (0, 2, 2, 'qux', 0)])
+        self.driver.insert_segments([(0, 1, 2, 'baz', 0x10),
+                                     (1, 1, 2, 'quux', 0)])
+        segments = self.driver.get_segments(0, 1, 2)
+        self.assertEqual([(str(data), flags) for data, flags in segments],
+                         [('foo', 0), ('bar', 0), ('baz', 0x10)])
+        self.assertEqual(self.driver.get_segments(0, 1, 3), [])
+        self.assertEqual(self.driver.compact_segments(0, 1), 0)
+        self.assertEqual(self.driver.compact_segments(2, 2), 0)
+        self.assertEqual(self.driver.compact_segments(0, 2), 1)
+        self.assertEqual(len(self.driver.get_segments(1, 1, 2)), 1)
+        buf, flags = self.driver.get_block(0, 1, 2)
+        self.assertEqual(str(buf), 'foobarbaz')
+        self.assertEqual(flags, 0x10)
+        self.assertEqual(len(self.driver.get_segments(0, 1, 2)), 1)
+        self.assertEqual(len(self.driver.get_segments(0, 2, 2)), 1)
+        self.driver.clear_from(2, 20000)
+        self.assertEqual(self.driver.get_segments(0, 2, 2), [])
+
     def test_clear_from(self):
         self.driver.add_namespace_statistics(0, 0, 1, 2)
         self.driver.add_namespace_statistics(1, 1, 4, 5)
@@ -160,6 +225,21 @@ class TestDriver(TestCase):
         self.assertEqual(self.driver.get_namespace_statistics(1, 0, 3),
                          [4, 5])
 
+    def test_expire_blocks(self):
+        self.driver.replace_blocks([(0, 1, 2, 'foo', 0), (0, 2, 2, 'bar', 0),
+                                    (1, 1, 2, 'baz', 0)])
+        self.driver.add_namespace_statistics_many([(0, 1, 1, 3), (0, 2, 1, 3),
+                                                   (1, 1, 1, 3)])
+        id_ = sha1('foobar').digest()
+        self.driver.add_cache(0, 2, id_, 5, [(10, 4), (20, 4), (30, 4)])
+        self.driver.expire_blocks(0, 1, 20)
+        self.assertIsNone(self.driver.get_block(0, 1, 2)[0])
+        self.assertEqual(str(self.driver.get_block(0, 2, 2)[0]), 'bar')
+        self.assertEqual(str(self.driver.get_block(1, 1, 2)[0]), 'baz')
+        self.assertEqual(self.driver.block_offset_bounds(0), (2, 2))
+        self.assertSequenceEqual(self.driver.get_cache(0, id_, 5, 0, 100),
+                                 [(20, 4), (30, 4)])
+
     def test_metadata(self):
         self.assertIsNone(self.driver.get_metadata('foobaz'))
         self.driver.set_metadata({'foo': 'bar', 'bar': 'baz'})
@@ -3,7 +3,7 @@ Gauged - https://github.com/chriso/gauged
 Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
 """
 
-from gauged.drivers import parse_dsn, SQLiteDriver
+from gauged.drivers import parse_dsn, SQLiteDriver, FileDriver
 from .test_case import TestCase
 
 
@@ -76,3 +76,14 @@ class TestDSN(TestCase):
         self.assertEqual(kwargs['foo'], 'bar')
         kwargs = parse_dsn('postgresql://localhost?foo=bar')[2]
         self.assertEqual(kwargs['foo'], 'bar')
+
+    def test_file(self):
+        driver, args, kwargs = parse_dsn('file:///tmp/gauged')
+        self.assertIs(driver, FileDriver)
+        self.assertEqual(args, ['/tmp/gauged'])
+        self.assertEqual(kwargs, {})
+        args, kwargs = parse_dsn('file:///tmp/gauged?fsync=false')[1:]
+        self.assertEqual(args, ['/tmp/gauged'])
+        self.assertEqual(kwargs, {'fsync': False})
+        kwargs = parse_dsn('file:///tmp/gauged?readonly=true')[2]
+        self.assertEqual(kwargs, {'readonly': True})
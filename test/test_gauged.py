@@ -4,7 +4,12 @@ Copyright 2014 (c) Chris O'Hara <cohara87@gmail.com>
 """
 
 import datetime
+import imp
+import os
 import random
+import shutil
+import tempfile
+from argparse import Namespace
 from math import ceil, floor, sqrt
 from time import time, sleep
 from warnings import filterwarnings
@@ -13,7 +18,8 @@ from gauged.errors import (GaugedKeyOverflowError, GaugedDateRangeError,
                            GaugedAppendOnlyError, GaugedIntervalSizeError,
                            GaugedNaNError, GaugedUseAfterFreeError,
                            GaugedVersionMismatchError, GaugedBlockSizeMismatch,
-                           GaugedSchemaError)
+                           GaugedSchemaError, GaugedWorkerError)
+from gauged.sharded_writer import route, route_pairs
 from gauged.structures import SparseMap, FloatArray
 from .test_case import TestCase
 
@@ -63,6 +69,363 @@ class TestGauged(TestCase):
         self.assertEqual(gauged.value('a', timestamp=2000), 123)
         self.assertIsNone(gauged.value('b', timestamp=2000))
 
+    def test_add_large_query(self):
+        gauged = Gauged(self.driver, block_size=50000)
+        query = '&'.join('key%d=%d' % (i % 5000, i) for i in xrange(10000))
+        self.assertGreater(len(query), 32768)
+        with gauged.writer as writer:
+            writer.add(query, timestamp=1000)
+            writer.add(buffer(query), timestamp=2000)
+        self.assertEqual(gauged.statistics().data_points, 20000)
+        self.assertEqual(gauged.aggregate('key4999', Gauged.SUM),
+                         (4999 + 9999) * 2)
+
+    def test_add_with_key_prefixes(self):
+        gauged = Gauged(self.driver, key_whitelist=['a'],
+                        key_prefix_whitelist=['app.'],
+                        key_prefix_blacklist=['app.debug.'],
+                        key_overflow=Gauged.IGNORE, gauge_nan=Gauged.IGNORE)
+        with gauged.writer as writer:
+            writer.add('a=1&b=2&app.x=3&app.debug.y=4', timestamp=2000)
+            writer.add({'b': 5, 'app.z': 6}, timestamp=3000)
+            self.assertTrue(writer.accept(u'app.x'))
+            self.assertFalse(writer.accept('app.debug.y'))
+        self.assertEqual(gauged.keys(), ['a', 'app.x', 'app.z'])
+        gauged = Gauged(self.driver, key_whitelist=[])
+        with gauged.writer as writer:
+            # NaN values for filtered keys are ignored rather than raising
+            writer.add({'c': 1, 'd': 'nan'}, timestamp=4000)
+        self.assertIsNone(gauged.value('c', timestamp=4000))
+
+    def test_add_many(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000)
+        with gauged.writer as writer:
+            writer.add_many([1000, 1500, 2000, 12000, 12500],
+                            ['foo', 'bar', 'foo', 'foo', 'bar'],
+                            [1, 2, 3, 4, 5])
+            writer.add_many([13000], ['foo'], [6], namespace=1)
+            with self.assertRaises(ValueError):
+                writer.add_many([14000], ['foo'], [])
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 8)
+        self.assertEqual(gauged.aggregate('bar', Gauged.SUM), 7)
+        self.assertEqual(gauged.value('foo', timestamp=1999), 1)
+        self.assertEqual(gauged.value('foo', timestamp=2000), 3)
+        self.assertEqual(gauged.value('foo', timestamp=13000, namespace=1), 6)
+        stats = gauged.statistics()
+        self.assertEqual(stats.data_points, 5)
+        with gauged.writer as writer:
+            with self.assertRaises(GaugedAppendOnlyError):
+                writer.add_many([3000, 2000], ['foo', 'foo'], [1, 2])
+
+    def test_add_many_statistics(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000)
+        with gauged.writer as writer:
+            with self.assertRaises(GaugedNaNError):
+                writer.add_many([1000, 2000, 12000, 13000],
+                                ['foo', 'foo', 'foo', 'foo'], [1, 2, 3, 'x'])
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 6)
+        self.assertEqual(gauged.statistics(end=10000).data_points, 2)
+        self.assertEqual(gauged.statistics().data_points, 3)
+
+    def test_add_many_append_only_violation(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                        append_only_violation=Gauged.IGNORE)
+        with gauged.writer as writer:
+            writer.add_many([2000, 1000, 3000], ['foo', 'foo', 'foo'],
+                            [1, 2, 3])
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 4)
+
+    def test_reorder_window(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                        reorder_window=2000)
+        with gauged.writer as writer:
+            writer.add('foo', 1, timestamp=1000)
+            writer.add('foo', 3, timestamp=3000)
+            writer.add('foo', 2, timestamp=2000)
+            writer.add_many([9000, 5000], ['foo', 'bar'], [5, 4])
+            writer.add('foo', 6, timestamp=12000)
+            with self.assertRaises(GaugedAppendOnlyError):
+                writer.add('foo', 7, timestamp=1000)
+            self.assertEqual(len(writer.reorder_buffer), 1)
+        self.assertEqual(gauged.value('foo', timestamp=2500), 2)
+        self.assertEqual(gauged.value('foo', timestamp=3500), 3)
+        self.assertEqual(gauged.value('bar', timestamp=5000), 4)
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM, start=9000,
+                                          end=13000), 11)
+        self.assertEqual(gauged.aggregate('foo', Gauged.COUNT), 5)
+
+    def test_reorder_window_buffer_size(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                        reorder_window=Gauged.DAY, reorder_buffer_size=2,
+                        append_only_violation=Gauged.IGNORE)
+        with gauged.writer as writer:
+            writer.add('foo', 3, timestamp=3000)
+            writer.add('foo', 2, timestamp=2000)
+            writer.add('foo', 4, timestamp=4000)
+            self.assertEqual(len(writer.reorder_buffer), 2)
+            writer.add('foo', 1, timestamp=1000)
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 9)
+
+    def test_reorder_window_copies_data(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                        reorder_window=5000)
+        with gauged.writer as writer:
+            pairs = [('foo', 0)]
+            values = [0]
+            handle = writer.register('bar')
+            for i in xrange(1, 6):
+                pairs[0] = ('foo', i)
+                writer.add(pairs, timestamp=i * 1000)
+                values[0] = i
+                writer.add_handles([handle], values, timestamp=i * 1000)
+            pairs[0] = ('foo', 100)
+            values[0] = 100
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 15)
+        self.assertEqual(gauged.aggregate('bar', Gauged.SUM), 15)
+
+    def test_sharded_writer_routing(self):
+        keys = ['k%d' % i for i in xrange(50)] + ['a b']
+        query = '&'.join('%s=%d' % (key.replace(' ', '+'), i)
+                         for i, key in enumerate(keys)) + '&=1&\n'
+        split = route(query, 4)
+        split_pairs = route_pairs([(key, i) for i, key in enumerate(keys)], 4)
+        self.assertEqual([[pair.split('=')[0].replace('+', ' ')
+                           for pair in data.split('&') if data]
+                          for data in split],
+                         [[key for key, _ in pairs] for pairs in split_pairs])
+        self.assertEqual(sorted(key for pairs in split_pairs
+                                for key, _ in pairs), sorted(keys))
+        self.assertGreater(sum(1 for pairs in split_pairs if pairs), 1)
+        shard = [shard for shard, pairs in enumerate(split_pairs)
+                 if ('a b', 50) in pairs][0]
+        self.assertEqual(route_pairs({'a b': 1}, 4)[shard], [('a b', 1)])
+
+    def test_sharded_writer(self):
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        try:
+            gauged = Gauged('sqlite:///' + path, resolution=1000,
+                            block_size=10000)
+            gauged.sync()
+            with gauged.sharded_writer(shards=3, batch_size=2) as writer:
+                self.assertEqual(writer.resume_from(), 0)
+                for timestamp in xrange(1000, 25000, 1000):
+                    writer.add({'foo': 1, 'bar': 2, 'baz': timestamp},
+                               timestamp=timestamp)
+                data = {'qux': 4}
+                writer.add(data, timestamp=25000)
+                data['qux'] = 100
+                writer.add(buffer('quux=5'), timestamp=25000)
+                writer.flush()
+                self.assertEqual(gauged.aggregate('foo', Gauged.SUM,
+                                                  end=20000), 19)
+            self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 24)
+            self.assertEqual(gauged.aggregate('bar', Gauged.SUM), 48)
+            self.assertEqual(gauged.value('baz', timestamp=24000), 24000)
+            self.assertEqual(gauged.value('quux', timestamp=25000), 5)
+            self.assertEqual(gauged.value('qux', timestamp=25000), 4)
+            self.assertEqual(gauged.statistics().data_points, 24 * 3 + 2)
+            with gauged.sharded_writer(shards=3) as writer:
+                self.assertEqual(writer.resume_from(), 26000)
+                writer.add('foo', 1, timestamp=1000)
+                writer.add('foo', 1, timestamp=26000)
+            self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 25)
+            with self.assertRaises(ValueError):
+                Gauged().sharded_writer()
+        finally:
+            os.remove(path)
+
+    def test_sharded_writer_error(self):
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        try:
+            gauged = Gauged('sqlite:///' + path, resolution=1000,
+                            block_size=10000)
+            gauged.sync()
+            writer = gauged.sharded_writer(shards=2)
+            writer.add('foo', 1, timestamp=2000)
+            writer.add('foo', 1, timestamp=1000)
+            with self.assertRaises(GaugedWorkerError):
+                writer.flush()
+            with self.assertRaises(GaugedUseAfterFreeError):
+                writer.cleanup()
+                writer.add('foo', 1)
+        finally:
+            os.remove(path)
+
+    def test_file_driver_recovery(self):
+        path = tempfile.mkdtemp()
+        dsn = 'file://%s/gauged?fsync=false' % path
+        try:
+            gauged = Gauged(dsn, resolution=1000, block_size=10000)
+            gauged.sync()
+            with gauged.writer as writer:
+                for timestamp in xrange(0, 30000, 1000):
+                    writer.add({'foo': 1, 'bar': timestamp},
+                               timestamp=timestamp)
+                    if timestamp == 15000:
+                        writer.flush()
+            with gauged.writer as writer:
+                writer.clear_key_before('bar', timestamp=10000)
+            # Checkpoint on the next commit
+            gauged.driver.MIN_CHECKPOINT_BYTES = 0
+            with gauged.writer as writer:
+                writer.add('foo', 1, timestamp=30000)
+            gauged.driver.set_writer_position('default', 0)
+            gauged.driver.close()
+            with open('%s/gauged/journal' % path, 'ab') as journal:
+                journal.write('\x01\x02')
+            for _ in xrange(2):
+                gauged = Gauged(dsn, resolution=1000, block_size=10000)
+                self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 31)
+                self.assertEqual(gauged.aggregate('bar', Gauged.COUNT), 20)
+                self.assertEqual(gauged.value('bar', timestamp=29000),
+                                 29000)
+                self.assertEqual(gauged.keys(), ['bar', 'foo'])
+                self.assertEqual(gauged.statistics().data_points, 61)
+                with gauged.writer as writer:
+                    self.assertEqual(writer.resume_from(), 31000)
+                gauged.driver.close()
+            gauged = Gauged(dsn, resolution=1000, block_size=10000)
+            with gauged.writer as writer:
+                writer.add('foo', 1, timestamp=31000)
+            gauged.driver.close()
+            gauged = Gauged(dsn, resolution=1000, block_size=10000)
+            self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 32)
+            self.assertEqual(gauged.aggregate('bar', Gauged.MAX), 29000)
+            with self.assertRaises(IOError):
+                Gauged(dsn)
+            gauged.driver.close()
+        finally:
+            shutil.rmtree(path)
+
+    def test_file_driver_journals_keys(self):
+        path = tempfile.mkdtemp()
+        dsn = 'file://%s/gauged?fsync=false' % path
+        try:
+            gauged = Gauged(dsn, resolution=1000, block_size=10000)
+            gauged.sync()
+            with gauged.writer as writer:
+                writer.add({'foo': 1, 'bar': 2}, timestamp=1000)
+            # Neither change is committed, so both are discarded
+            gauged.driver.insert_keys([(0, 'baz')])
+            gauged.driver.clear_key_before('bar', 0)
+            self.assertEqual(gauged.keys(), ['baz', 'foo'])
+            gauged.driver.close()
+            gauged = Gauged(dsn, resolution=1000, block_size=10000)
+            self.assertEqual(gauged.keys(), ['bar', 'foo'])
+            self.assertEqual(gauged.aggregate('bar', Gauged.SUM), 2)
+            gauged.driver.insert_keys([(0, 'baz')])
+            gauged.driver.commit()
+            gauged.driver.MIN_CHECKPOINT_BYTES = 0
+            with gauged.writer as writer:
+                writer.clear_key_before('bar')
+            gauged.driver.close()
+            gauged = Gauged(dsn, resolution=1000, block_size=10000)
+            self.assertEqual(gauged.keys(), ['baz', 'foo'])
+            ids = gauged.driver.lookup_ids([(0, 'foo'), (0, 'baz')])
+            gauged.driver.insert_keys([(0, 'qux')])
+            qux = gauged.driver.lookup_ids([(0, 'qux')])[(0, 'qux')]
+            self.assertEqual(qux, max(ids.values()) + 1)
+            gauged.driver.close()
+        finally:
+            shutil.rmtree(path)
+
+    def test_file_driver_readers(self):
+        path = tempfile.mkdtemp()
+        dsn = 'file://%s/gauged?fsync=false' % path
+        try:
+            reader = Gauged(dsn + '&readonly=true', resolution=1000,
+                            block_size=10000)
+            with self.assertRaises(GaugedSchemaError):
+                reader.keys()
+            gauged = Gauged(dsn, resolution=1000, block_size=10000)
+            gauged.sync()
+            other = Gauged(dsn + '&readonly=true', resolution=1000,
+                           block_size=10000)
+            with gauged.writer as writer:
+                writer.add('foo', 1, timestamp=1000)
+            self.assertEqual(reader.aggregate('foo', Gauged.SUM), 1)
+            self.assertEqual(other.aggregate('foo', Gauged.SUM), 1)
+            with gauged.writer as writer:
+                writer.add({'foo': 1, 'bar': 2}, timestamp=2000)
+            self.assertEqual(reader.aggregate('foo', Gauged.SUM), 2)
+            gauged.driver.MIN_CHECKPOINT_BYTES = 0
+            for timestamp in xrange(3000, 25000, 1000):
+                with gauged.writer as writer:
+                    writer.add({'foo': 1, 'bar': 2}, timestamp=timestamp)
+                if timestamp % 5000 == 0:
+                    self.assertEqual(reader.aggregate('foo', Gauged.SUM),
+                                     timestamp // 1000)
+            self.assertEqual(reader.keys(), ['bar', 'foo'])
+            self.assertEqual(reader.aggregate('bar', Gauged.SUM), 46)
+            self.assertEqual(other.aggregate('foo', Gauged.SUM), 24)
+            with gauged.writer as writer:
+                writer.clear_key_before('foo', timestamp=10000)
+            self.assertEqual(reader.aggregate('foo', Gauged.SUM), 15)
+            with self.assertRaises(IOError):
+                reader.sync()
+            with self.assertRaises(IOError):
+                reader.driver.insert_keys([(0, 'baz')])
+            with self.assertRaises(IOError):
+                Gauged(dsn)
+            for instance in (gauged, reader, other):
+                instance.driver.close()
+        finally:
+            shutil.rmtree(path)
+
+    def test_key_ids_are_remembered(self):
+        for key_cache_size in (64, 1, 0):
+            gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                            key_cache_size=key_cache_size,
+                            namespace=key_cache_size)
+            lookups = []
+            lookup_ids = self.driver.lookup_ids
+
+            def counting_lookup_ids(keys):
+                lookups.extend(keys)
+                return lookup_ids(keys)
+
+            self.driver.lookup_ids = counting_lookup_ids
+            try:
+                with gauged.writer as writer:
+                    for timestamp in xrange(1000, 40000, 10000):
+                        writer.add({'foo': 1, 'bar': 2}, timestamp=timestamp)
+                    writer.add({'foo': 1, 'baz': 3}, timestamp=41000)
+            finally:
+                del self.driver.lookup_ids
+            if key_cache_size == 64:
+                self.assertEqual(len(lookups), 3)
+            elif key_cache_size == 1:
+                self.assertEqual(len(lookups), 6)
+            else:
+                self.assertEqual(len(lookups), 10)
+            self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 5)
+            self.assertEqual(gauged.aggregate('bar', Gauged.SUM), 8)
+            self.assertEqual(gauged.aggregate('baz', Gauged.SUM), 3)
+
+    def test_flush_passes_map_memory_to_driver(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000)
+        blocks = []
+        insert_or_append_blocks = self.driver.insert_or_append_blocks
+
+        def capture_blocks(to_insert):
+            blocks.extend((type(data), str(data))
+                          for _, _, _, data, _ in to_insert)
+            insert_or_append_blocks(to_insert)
+
+        self.driver.insert_or_append_blocks = capture_blocks
+        try:
+            with gauged.writer as writer:
+                writer.add('foo', 1, timestamp=1000)
+        finally:
+            del self.driver.insert_or_append_blocks
+        self.assertEqual(len(blocks), 1)
+        data_type, data = blocks[0]
+        self.assertIs(data_type, buffer)
+        self.assertEqual(len(data), 8)
+        self.assertEqual(gauged.value('foo', timestamp=1000), 1)
+
     def test_invalid_resolution(self):
         with self.assertRaises(ValueError):
             Gauged(self.driver, resolution=1000, block_size=1500)
@@ -161,6 +524,54 @@ class TestGauged(TestCase):
         with gauged.writer as writer:
             writer.add(long_key, 10)
 
+    def test_gauge_errors_in_query(self):
+        gauged = Gauged(self.driver, block_size=50000)
+        long_key = 'a' * (self.driver.MAX_KEY + 1)
+        with gauged.writer as writer:
+            with self.assertRaises(GaugedKeyOverflowError) as context:
+                writer.add('foo=1&%s=2' % long_key, timestamp=1000)
+            self.assertIn(long_key, str(context.exception))
+            with self.assertRaises(GaugedNaNError):
+                writer.add(buffer('bar=nan&baz=3'), timestamp=2000)
+            writer.add('qux=4', timestamp=3000)
+        # Valid gauges in the same query are still written
+        self.assertEqual(gauged.value('foo', timestamp=1000), 1)
+        self.assertEqual(gauged.value('baz', timestamp=2000), 3)
+        self.assertIsNone(gauged.value('bar', timestamp=2000))
+        self.assertEqual(gauged.statistics().data_points, 3)
+
+    def test_gauge_long_key_in_batch(self):
+        gauged = Gauged(self.driver, key_overflow=Gauged.IGNORE)
+        long_key = 'a' * (self.driver.MAX_KEY + 1)
+        with gauged.writer as writer:
+            writer.add({long_key: 10, 'foo': 20, 'bar': 30}, timestamp=1000)
+        self.assertEqual(gauged.value('foo', timestamp=1000), 20)
+        self.assertEqual(gauged.value('bar', timestamp=1000), 30)
+        self.assertEqual(gauged.statistics().data_points, 2)
+
+    def test_gauge_errors_in_batch(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                        key_prefix_blacklist=['skip'])
+        long_key = 'a' * (self.driver.MAX_KEY + 1)
+        with gauged.writer as writer:
+            with self.assertRaises(GaugedKeyOverflowError) as context:
+                writer.add([('foo', 1), (long_key, 2), ('bar', 3)],
+                           timestamp=1000)
+            self.assertIn(long_key, str(context.exception))
+            with self.assertRaises(GaugedNaNError):
+                writer.add([('foo', 1), ('bar', 'nan')], timestamp=2000)
+            with self.assertRaises(GaugedNaNError):
+                writer.add_many([3000, 3000, 4000], ['foo', 'bar', 'baz'],
+                                [1, float('nan'), 2])
+            # Filtered keys are never rejected
+            writer.add([(u'foo', '4'), (5, 6L), ('skip', 'nan'),
+                        ('skip' + long_key, 1)], timestamp=5000)
+        # A batch which is rejected isn't written at all
+        self.assertEqual(gauged.keys(), ['5', 'foo'])
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 4)
+        self.assertEqual(gauged.aggregate('5', Gauged.SUM), 6)
+        self.assertEqual(gauged.statistics().data_points, 2)
+
     def test_aggregate(self):
         gauged = Gauged(self.driver, block_size=10000)
         self.assertIsNone(gauged.aggregate('foobar', Gauged.SUM))
@@ -201,6 +612,160 @@ class TestGauged(TestCase):
         with self.assertRaises(ValueError):
             gauged.aggregate('foobar', 'unknown')
 
+    def test_aggregate_with_block_summaries(self):
+        gauged = Gauged(self.driver, block_size=10000, block_summaries=True)
+        values = {}
+        with gauged.writer as writer:
+            for timestamp in xrange(0, 100000, 1000):
+                values[timestamp] = (timestamp % 7000) / 100.0 - 20
+                writer.add('foo', values[timestamp], timestamp=timestamp)
+                if timestamp == 54000:
+                    writer.flush()
+        fetched = []
+        get_block = self.driver.get_block
+
+        def counting_get_block(namespace, offset, key):
+            fetched.append(offset)
+            return get_block(namespace, offset, key)
+
+        self.driver.get_block = counting_get_block
+        try:
+            for start, end in ((0, 100000), (5000, 95000), (15000, 40000)):
+                expected = [value for timestamp, value in values.iteritems()
+                            if start <= timestamp < end]
+                mean = sum(expected) / len(expected)
+                stddev = sqrt(sum((value - mean) ** 2 for value in expected) /
+                              len(expected))
+                for aggregate, result in ((Gauged.SUM, sum(expected)),
+                                          (Gauged.COUNT, len(expected)),
+                                          (Gauged.MIN, min(expected)),
+                                          (Gauged.MAX, max(expected)),
+                                          (Gauged.MEAN, mean),
+                                          (Gauged.STDDEV, stddev)):
+                    self.assertAlmostEqual(gauged.aggregate(
+                        'foo', aggregate, start=start, end=end), result, 4)
+        finally:
+            del self.driver.get_block
+        self.assertEqual(set(fetched), set([0, 1, 9]))
+        self.assertIsNone(gauged.aggregate('foo', Gauged.MEAN, start=100000,
+                                           end=200000))
+        self.assertEqual(gauged.aggregate('foo', Gauged.COUNT, start=100000,
+                                          end=200000), 0)
+        with gauged.writer as writer:
+            writer.clear_from(50000)
+        self.assertEqual(gauged.aggregate('foo', Gauged.COUNT, end=100000),
+                         50)
+
+    def test_aggregate_with_rollups(self):
+        self.assertEqual(Gauged(self.driver).config.rollups, [])
+        gauged = Gauged(self.driver, block_size=Gauged.HOUR,
+                        rollups=[Gauged.MINUTE])
+        values = {}
+        with gauged.writer as writer:
+            for timestamp in xrange(0, 3 * Gauged.HOUR, 10000):
+                values[timestamp] = (timestamp % 70000) / 1000.0 - 20
+                writer.add('foo', values[timestamp], timestamp=timestamp)
+                if timestamp == 1850000:
+                    writer.flush()
+        fetched = []
+        get_block = self.driver.get_block
+
+        def counting_get_block(namespace, offset, key):
+            fetched.append(offset)
+            return get_block(namespace, offset, key)
+
+        def expected(aggregate, start, end):
+            points = [value for timestamp, value in values.iteritems()
+                      if start <= timestamp < end]
+            if aggregate == Gauged.SUM:
+                return sum(points)
+            elif aggregate == Gauged.COUNT:
+                return len(points)
+            elif aggregate == Gauged.MIN:
+                return min(points)
+            mean = sum(points) / len(points)
+            if aggregate == Gauged.MEAN:
+                return mean
+            return sqrt(sum((point - mean) ** 2 for point in points) /
+                        len(points))
+
+        aggregates = (Gauged.SUM, Gauged.COUNT, Gauged.MIN, Gauged.MEAN,
+                      Gauged.STDDEV)
+        self.driver.get_block = counting_get_block
+        try:
+            for aggregate in aggregates:
+                for start, end in ((60000, 1800000), (0, 3 * Gauged.HOUR),
+                                   (1800000, 2 * Gauged.HOUR + 120000)):
+                    self.assertAlmostEqual(gauged.aggregate(
+                        'foo', aggregate, start=start, end=end),
+                        expected(aggregate, start, end), 3)
+                series = gauged.aggregate_series(
+                    'foo', aggregate, start=0, end=3 * Gauged.HOUR,
+                    interval=5 * Gauged.MINUTE, cache=False)
+                self.assertEqual(len(series.values), 36)
+                for timestamp, value in series:
+                    self.assertAlmostEqual(value, expected(
+                        aggregate, timestamp, timestamp + 5 * Gauged.MINUTE),
+                        3)
+            self.assertEqual(fetched, [])
+            gauged.aggregate('foo', Gauged.SUM, start=65000, end=1805000)
+            self.assertEqual(set(fetched), set([0]))
+        finally:
+            del self.driver.get_block
+        gauged = Gauged(self.driver, block_size=Gauged.HOUR,
+                        rollups=[Gauged.MINUTE], overwrite_blocks=True)
+        with gauged.writer as writer:
+            writer.add('foo', 5, timestamp=3 * Gauged.HOUR + 90000)
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM,
+                                          start=3 * Gauged.HOUR,
+                                          end=4 * Gauged.HOUR), 5)
+        with self.assertRaises(ValueError):
+            Gauged(self.driver, block_size=Gauged.HOUR, rollups=[7 * 60000])
+
+    def test_segmented_blocks(self):
+        self.driver.set_metadata({'segmented_blocks': 0})
+        reader = Gauged(self.driver, block_size=10000, resolution=1000)
+        with reader.writer as writer:
+            writer.add('baz', 1, timestamp=1000)
+
+        def failing_get_segments(*_):
+            raise AssertionError('Segments were looked up')
+
+        self.driver.get_segments = failing_get_segments
+        try:
+            self.assertEqual(reader.value('baz', timestamp=1000), 1)
+        finally:
+            del self.driver.get_segments
+        gauged = Gauged(self.driver, block_size=10000, resolution=1000,
+                        segmented_blocks=True)
+        with gauged.writer as writer:
+            writer.add('foo', 1, timestamp=1000)
+            writer.flush()
+            writer.add('foo', 2, timestamp=5000)
+            writer.flush()
+            writer.add('foo', 3, timestamp=8000)
+        key = self.driver.lookup_ids([(0, 'foo')])[(0, 'foo')]
+        self.assertGreater(len(self.driver.get_segments(0, 0, key)), 1)
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 6)
+        self.assertEqual(gauged.value('foo', timestamp=6000), 2)
+        self.assertEqual(reader.aggregate('foo', Gauged.SUM), 6)
+        self.assertEqual(reader.aggregate('foo', Gauged.MEDIAN), 2)
+        self.assertEqual(reader.value('foo', timestamp=9000), 3)
+        self.assertEqual(gauged.compact(), {0: 0})
+        with gauged.writer as writer:
+            writer.add('foo', 4, timestamp=12000)
+            writer.add('bar', 5, timestamp=12000, namespace=1)
+        self.assertGreater(len(self.driver.get_segments(0, 0, key)), 1)
+        self.assertEqual(gauged.compact(namespace=1), {1: 0})
+        self.assertEqual(gauged.compact(), {0: 1, 1: 0})
+        self.assertEqual(len(self.driver.get_segments(0, 0, key)), 1)
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 10)
+        self.assertEqual(gauged.value('foo', timestamp=15000), 4)
+        self.assertEqual(sorted(gauged.compact(timestamp=20000)), [0, 1])
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 10)
+        self.assertEqual(gauged.value('bar', timestamp=15000, namespace=1),
+                         5)
+
     def test_series(self):
         gauged = Gauged(self.driver, block_size=10000)
         self.assertEqual(len(gauged.value_series('foobar', start=0,
@@ -383,11 +948,68 @@ class TestGauged(TestCase):
     def test_version_mismatch(self):
         self.driver.set_metadata({'current_version': 'foo'})
         gauged = Gauged(self.driver)
-        with self.assertRaises(GaugedVersionMismatchError):
-            with gauged.writer:
-                pass
+        try:
+            with self.assertRaises(GaugedVersionMismatchError):
+                with gauged.writer:
+                    pass
+        finally:
+            # Metadata is kept between tests
+            self.driver.set_metadata({'current_version': Gauged.VERSION})
         # gauged.migrate()
 
+    def test_block_summaries_are_optional(self):
+        for block_summaries, rollups in ((False, []), (False, [5000]),
+                                         (True, [])):
+            self.driver.clear_schema()
+            gauged = Gauged(self.driver, block_size=10000,
+                            block_summaries=block_summaries, rollups=rollups)
+            with gauged.writer as writer:
+                for timestamp in xrange(0, 30000, 1000):
+                    writer.add('foo', timestamp, timestamp=timestamp)
+            key = self.driver.lookup_ids([(0, 'foo')])[(0, 'foo')]
+            summaries = self.driver.get_block_summaries(0, key, 0, 2)
+            expected = 3 if block_summaries or rollups else 0
+            self.assertEqual(len(summaries), expected)
+            self.assertEqual(gauged.aggregate('foo', Gauged.SUM),
+                             sum(xrange(0, 30000, 1000)))
+
+    def test_migrate_script(self):
+        path = os.path.join(os.path.dirname(__file__), os.pardir, 'scripts',
+                            'gauged_migrate.py')
+        migrate = imp.load_source('gauged_migrate', path).migrate
+        handle, path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        dsn = 'sqlite:///' + path
+        try:
+            gauged = Gauged(dsn, resolution=1000, block_size=10000)
+            gauged.sync()
+            with gauged.writer as writer:
+                for timestamp in xrange(1000, 16000, 1000):
+                    writer.add('foo', 1, timestamp=timestamp)
+            # Go back to a 1.0.1 schema
+            gauged.driver.cursor.executescript("""
+                DROP TABLE gauged_block_summary;
+                DROP TABLE gauged_rollups;
+                DROP TABLE gauged_segments;
+                DELETE FROM gauged_metadata WHERE `key` = 'summary_offset'
+                    OR `key` LIKE 'rollup_offset_%'""")
+            gauged.driver.set_metadata({'current_version': '1.0.1'})
+            gauged = Gauged(dsn, resolution=1000, block_size=10000)
+            with self.assertRaises(GaugedVersionMismatchError):
+                gauged.aggregate('foo', Gauged.SUM)
+            self.assertEqual(migrate(Namespace(uri=dsn)), 0)
+            gauged = Gauged(dsn, resolution=1000, block_size=10000,
+                            block_summaries=True)
+            self.assertNotIn('summary_offset', gauged.metadata())
+            with gauged.writer as writer:
+                writer.add('foo', 1, timestamp=25000)
+            self.assertEqual(gauged.metadata()['summary_offset'], '2')
+            self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 16)
+            self.assertEqual(gauged.aggregate('foo', Gauged.SUM,
+                                              start=20000), 1)
+        finally:
+            os.unlink(path)
+
     def test_accepting_data_as_string(self):
         gauged = Gauged(self.driver, resolution=1000, block_size=10000,
                         key_overflow=Gauged.IGNORE, gauge_nan=Gauged.IGNORE)
@@ -412,6 +1034,24 @@ class TestGauged(TestCase):
                 writer.add(u'foo=123.456&bar=-15.98&qux=0&invalid=foobar\n',
                            timestamp=20000)
 
+    def test_accepting_data_as_buffer(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                        key_overflow=Gauged.IGNORE, gauge_nan=Gauged.IGNORE)
+        payload = 'ignored\tfoo=123&bar=-15.5&invalid=foobar\nignored'
+        with gauged.writer as writer:
+            writer.add(buffer(payload, 8, 33), timestamp=20000)
+        self.assertEqual(gauged.value('foo', timestamp=20000), 123)
+        self.assertEqual(gauged.value('bar', timestamp=20000), -15.5)
+        self.assertIsNone(gauged.value('invalid', timestamp=20000))
+        self.assertEqual(gauged.keys(), ['bar', 'foo'])
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                        key_whitelist=['foo'])
+        with gauged.writer as writer:
+            writer.add(buffer('foo=1&bar=2&foobar'), timestamp=30000)
+        self.assertEqual(gauged.value('foo', timestamp=30000), 1)
+        # 'bar' isn't whitelisted, so the value from 20000 is still used
+        self.assertEqual(gauged.value('bar', timestamp=30000), -15.5)
+
     def test_context_defaults(self):
         gauged = Gauged(self.driver, resolution=1000, block_size=10000)
         with gauged.writer as writer:
@@ -446,6 +1086,42 @@ class TestGauged(TestCase):
         self.assertEqual(gauged.aggregate('foo', Gauged.STDDEV, start=11000,
                                           end=23000), 0)
 
+    def test_compression(self):
+        gauged = Gauged(self.driver)
+        with gauged.writer as writer:
+            writer.add('foo', 10, timestamp=1000)
+        gauged = Gauged(self.driver, compression=Gauged.XOR)
+        timestamps = range(2000, 1002000, 1000)
+        with gauged.writer as writer:
+            for timestamp in timestamps[:500]:
+                writer.add({'foo': timestamp % 3, 'bar': 0.5},
+                           timestamp=timestamp)
+            writer.flush()
+            for timestamp in timestamps[500:]:
+                writer.add({'foo': timestamp % 3, 'bar': 0.5},
+                           timestamp=timestamp)
+        _, flags = self.driver.get_block(0, 0, self.driver.lookup_ids(
+            [(0, 'foo')])[(0, 'foo')])
+        self.assertEqual(flags, Gauged.XOR)
+        self.assertEqual(gauged.aggregate('foo', Gauged.COUNT), 1001)
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM),
+                         10 + sum(timestamp % 3 for timestamp in timestamps))
+        self.assertEqual(gauged.aggregate('bar', Gauged.MEAN), 0.5)
+        self.assertEqual(gauged.value('foo', timestamp=1000), 10)
+        self.assertEqual(gauged.value('foo', timestamp=5000), 2)
+        statistics = gauged.statistics()
+        self.assertEqual(statistics.data_points, 2001)
+        self.assertLess(statistics.byte_count, 2001 * 8 / 4)
+        with self.assertRaises(ValueError):
+            Gauged(self.driver, compression='zlib')
+        self.assertEqual(gauged.metadata()['block_flags'], str(Gauged.XOR))
+        self.driver.set_metadata({'block_flags': Gauged.XOR | 2})
+        try:
+            with self.assertRaises(GaugedVersionMismatchError):
+                Gauged(self.driver).aggregate('foo', Gauged.SUM)
+        finally:
+            self.driver.set_metadata({'block_flags': Gauged.XOR})
+
     def test_coercing_non_string_keys(self):
         gauged = Gauged(self.driver, resolution=1000, block_size=10000)
         with gauged.writer as writer:
@@ -467,6 +1143,173 @@ class TestGauged(TestCase):
             self.assertEqual(gauged.value('foo', timestamp=3000), 2)
         self.assertEqual(gauged.value('foo', timestamp=3000), 3)
 
+    def test_flush_async(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                        flush_async=True)
+        with gauged.writer as writer:
+            writer.add('foo', 1, timestamp=1000)
+            writer.add('foo', 2, timestamp=2000)
+            writer.add('foo', 3, timestamp=3000)
+            writer.flush()
+            writer.add('bar', 4, timestamp=3000)
+            writer.add('foo', 5, timestamp=12000)
+            writer.wait_for_flush()
+            self.assertEqual(gauged.value('foo', timestamp=3000), 3)
+            self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 6)
+            self.assertEqual(writer.resume_from(), 4000)
+        self.assertEqual(gauged.value('foo', timestamp=12000), 5)
+        self.assertEqual(gauged.value('bar', timestamp=3000), 4)
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 11)
+        self.assertEqual(gauged.statistics().data_points, 5)
+
+    def test_flush_async_holds_driver_lock(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                        flush_async=True)
+        with gauged.writer as writer:
+            writer.add('foo', 1, timestamp=1000)
+            writer.add('foo', 2, timestamp=2000)
+            with self.driver.lock:
+                writer.flush()
+                writer.flush_thread.join(0.05)
+                self.assertTrue(writer.flush_thread.is_alive())
+                self.assertEqual(gauged.value('foo', timestamp=2000), None)
+            writer.wait_for_flush()
+            self.assertEqual(gauged.value('foo', timestamp=2000), 1)
+
+    def test_flush_async_error(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                        flush_async=True)
+
+        def failing_flush(*_):
+            raise ValueError
+
+        writer = gauged.writer
+        writer.flush_pending = failing_flush
+        writer.add('foo', 1, timestamp=1000)
+        writer.flush()
+        with self.assertRaises(ValueError):
+            writer.wait_for_flush()
+        writer.wait_for_flush()
+        del writer.flush_pending
+        writer.cleanup()
+
+    def test_arena_usage(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000)
+        with gauged.writer as writer:
+            usage = writer.arena_usage()
+            self.assertEqual(usage['chunks'], 0)
+            self.assertEqual(usage['bytes_used'], 0)
+            for timestamp in xrange(1000, 30000, 1000):
+                writer.add({'foo': 1, 'bar': 2}, timestamp=timestamp)
+            usage = writer.arena_usage()
+            self.assertEqual(usage['chunks'], 1)
+            self.assertEqual(usage['resets'], 2)
+            self.assertGreater(usage['bytes_used'], 0)
+            self.assertLessEqual(usage['bytes_used'], usage['bytes_reserved'])
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 29)
+        self.assertEqual(gauged.aggregate('bar', Gauged.COUNT), 29)
+
+    def test_max_pending_bytes(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=100000,
+                        max_pending_bytes=64)
+        with gauged.writer as writer:
+            for timestamp in xrange(1000, 10000, 1000):
+                writer.add({'foo': 1, 'bar': 2}, timestamp=timestamp)
+                pending = writer.writer.contents.pending.contents
+                self.assertLessEqual(pending.bytes, 64 + 16)
+            self.assertGreater(gauged.aggregate('foo', Gauged.COUNT), 4)
+            self.assertEqual(writer.writer.contents.pending.contents.count, 2)
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 9)
+        self.assertEqual(gauged.aggregate('bar', Gauged.SUM), 18)
+
+    def test_max_pending_keys(self):
+        for flush_async in (False, True):
+            self.driver.clear_schema()
+            gauged = Gauged(self.driver, resolution=1000, block_size=100000,
+                            max_pending_keys=10, flush_async=flush_async)
+            with gauged.writer as writer:
+                for timestamp in xrange(1000, 50000, 1000):
+                    writer.add('key%s' % timestamp, 1, timestamp=timestamp)
+                    pending = writer.writer.contents.pending.contents
+                    self.assertLessEqual(pending.active, 11)
+            self.assertEqual(gauged.aggregate('key1000', Gauged.SUM), 1)
+            self.assertEqual(gauged.aggregate('key49000', Gauged.SUM), 1)
+            self.assertEqual(gauged.statistics().data_points, 49)
+
+    def test_pending_limits_within_array(self):
+        for limit in ({'max_pending_keys': 10}, {'max_pending_bytes': 64}):
+            self.driver.clear_schema()
+            gauged = Gauged(self.driver, resolution=1000, block_size=100000,
+                            **limit)
+            keys = ['key%d' % i for i in xrange(20)]
+            with gauged.writer as writer:
+                writer.add(dict.fromkeys(keys[:5], 1), timestamp=1000)
+                self.assertEqual(gauged.aggregate('key0', Gauged.SUM), None)
+                # The array at 2000 takes the writer past the limit, so the
+                # maps are flushed without waiting for the next array
+                writer.add(dict.fromkeys(keys, 1), timestamp=2000)
+                self.assertEqual(gauged.aggregate('key0', Gauged.SUM), 1)
+                pending = writer.writer.contents.pending.contents
+                self.assertEqual(pending.count, 20)
+                self.assertEqual(pending.active, 20)
+                writer.add(dict.fromkeys(keys, 1), timestamp=2000)
+                writer.add('key0', 1, timestamp=3000)
+                self.assertEqual(gauged.aggregate('key1', Gauged.SUM), 3)
+            self.assertEqual(gauged.aggregate('key0', Gauged.SUM), 4)
+            self.assertEqual(gauged.statistics().data_points, 46)
+
+    def test_register_handles(self):
+        long_key = 'a' * (self.driver.MAX_KEY + 1)
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                        key_whitelist=['foo', 'bar', 'baz', long_key])
+        with gauged.writer as writer:
+            foo = writer.register('foo')
+            bar = writer.register('bar')
+            self.assertEqual(writer.register(u'foo'), foo)
+            filtered = writer.register('qux')
+            baz = writer.register('baz', namespace=1)
+            writer.add_handles([foo, bar, filtered], [1, 2, 3], timestamp=1000)
+            writer.add_handles([foo, baz], [4, 5], timestamp=2000)
+            writer.flush()
+            writer.add_handles([foo], [6], timestamp=3000)
+            writer.add_handles((foo, bar), (7, 8), timestamp=12000)
+            with self.assertRaises(GaugedNaNError):
+                writer.add_handles([bar], [float('nan')], timestamp=13000)
+            with self.assertRaises(ValueError):
+                writer.add_handles([foo], [])
+            with self.assertRaises(GaugedKeyOverflowError):
+                writer.register(long_key)
+        self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 18)
+        self.assertEqual(gauged.aggregate('bar', Gauged.SUM), 10)
+        self.assertEqual(gauged.aggregate('baz', Gauged.SUM, namespace=1), 5)
+        self.assertEqual(gauged.statistics().data_points, 6)
+        self.assertEqual(gauged.statistics(namespace=1).data_points, 1)
+
+    def test_pending_stats(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000)
+        with gauged.writer as writer:
+            stats = writer.pending_stats()
+            self.assertEqual(stats['keys'], 0)
+            self.assertEqual(stats['load_factor'], 0)
+            self.assertEqual(stats['probes_per_lookup'], 0)
+            writer.add({'foo': 1, 'bar': 2, 'baz': 3}, timestamp=1000)
+            writer.add({'foo': 1, 'bar': 2}, timestamp=1000)
+            writer.add({'foo': 1}, timestamp=2000)
+            stats = writer.pending_stats()
+            self.assertEqual(stats['keys'], 3)
+            self.assertEqual(stats['array_bytes'], 4)
+            self.assertEqual(stats['map_bytes'], 3 * 4 + 5 * 4)
+            self.assertGreaterEqual(stats['map_capacity'], stats['map_bytes'])
+            self.assertGreaterEqual(stats['array_capacity'],
+                                    stats['array_bytes'])
+            self.assertEqual(stats['load_factor'],
+                             3.0 / stats['hash_size'])
+            self.assertEqual(stats['lookups'], 6)
+            self.assertGreaterEqual(stats['probes_per_lookup'], 1)
+        gauged = Gauged(self.driver, expected_keys=1000)
+        with gauged.writer as writer:
+            self.assertEqual(writer.pending_stats()['hash_size'], 2048)
+
     def test_auto_flush(self):
         gauged = Gauged(self.driver, resolution=1000, block_size=10000,
                         flush_seconds=0.001)
@@ -569,6 +1412,36 @@ class TestGauged(TestCase):
         with gauged.writer as writer:
             self.assertEqual(writer.resume_from(), 36000)
 
+    def test_ingest_script(self):
+        path = os.path.join(os.path.dirname(__file__), os.pardir, 'scripts',
+                            'gauged_ingest.py')
+        ingest = imp.load_source('gauged_ingest', path).ingest
+        handle, path = tempfile.mkstemp()
+        os.write(handle, '10000\tfoo=1&bar=2\n15000\tfoo=3\n20000\tbar=4\n')
+        os.close(handle)
+        try:
+            gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                            writer_name='ingest')
+            for _ in xrange(2):
+                with gauged.writer as writer:
+                    resume_from = writer.resume_from()
+                    with open(path, 'rb') as lines:
+                        result = ingest(writer, lines, resume_from=resume_from)
+            self.assertEqual(resume_from, 21000)
+            self.assertEqual(result, (0, 3))
+            self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 4)
+            self.assertEqual(gauged.aggregate('bar', Gauged.SUM), 6)
+            with open(path, 'ab') as lines:
+                lines.write('25000\tfoo=5\n')
+            with gauged.writer as writer:
+                with open(path, 'rb') as lines:
+                    result = ingest(writer, lines,
+                                    resume_from=writer.resume_from())
+            self.assertEqual(result, (1, 3))
+            self.assertEqual(gauged.aggregate('foo', Gauged.SUM), 9)
+        finally:
+            os.unlink(path)
+
     def test_clear_from(self):
         gauged = Gauged(self.driver, resolution=1000, block_size=10000)
         with gauged.writer as writer:
@@ -595,6 +1468,104 @@ class TestGauged(TestCase):
         self.assertEqual(gauged.value('foo', timestamp=40000), 5)
         self.assertEqual(gauged.value('foo', timestamp=40000, namespace=1), 6)
 
+    def test_expire(self):
+        gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                        retention={1: 20000, None: 30000})
+        with gauged.writer as writer:
+            for timestamp in xrange(0, 60000, 5000):
+                writer.add('foo', timestamp, timestamp=timestamp)
+                writer.add('foo', timestamp, timestamp=timestamp, namespace=1)
+                writer.add('foo', timestamp, timestamp=timestamp, namespace=2)
+        self.assertEqual(gauged.aggregate_series(
+            'foo', Gauged.COUNT, start=0, end=60000, interval=10000).values,
+            [2] * 6)
+        gauged.config.retention[2] = None
+        self.assertEqual(gauged.expire(timestamp=65000), {0: 3, 1: 4})
+        self.assertEqual(gauged.expire(timestamp=65000), {0: 0, 1: 0})
+        self.assertEqual(gauged.aggregate('foo', Gauged.COUNT), 6)
+        self.assertEqual(gauged.aggregate('foo', Gauged.COUNT, namespace=1),
+                         4)
+        self.assertEqual(gauged.aggregate('foo', Gauged.COUNT, namespace=2),
+                         12)
+        self.assertEqual(gauged.aggregate_series(
+            'foo', Gauged.COUNT, start=0, end=60000, interval=10000).values,
+            [2] * 3)
+        self.assertEqual(gauged.value('foo', timestamp=29000), None)
+        with self.assertRaises(ValueError):
+            Gauged(self.driver, retention=0)
+
+    def test_archive(self):
+        path = tempfile.mkdtemp()
+        try:
+            gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                            archive_path=path, archive_after=20000,
+                            retention=40000)
+            with gauged.writer as writer:
+                for timestamp in xrange(0, 60000, 5000):
+                    writer.add({'foo': timestamp, 'bar': 1},
+                               timestamp=timestamp)
+            self.assertEqual(gauged.archive(timestamp=65000), {0: 8})
+            self.assertEqual(gauged.archive(timestamp=65000), {0: 0})
+            self.assertIsNone(self.driver.get_block(0, 0, 1)[0])
+            self.assertIsNotNone(self.driver.get_block(0, 4, 1)[0])
+            self.assertEqual(gauged.aggregate('foo', Gauged.SUM),
+                             sum(xrange(0, 60000, 5000)))
+            self.assertEqual(gauged.value('foo', timestamp=36000), 35000)
+            reader = Gauged(self.driver, resolution=1000, block_size=10000,
+                            archive_path=path)
+            self.assertEqual(reader.aggregate('bar', Gauged.COUNT), 12)
+            self.assertEqual(gauged.expire(timestamp=65000), {0: 2})
+            self.assertEqual(reader.aggregate('bar', Gauged.COUNT, start=0,
+                                              end=20000), 0)
+            self.assertEqual(reader.aggregate('bar', Gauged.COUNT), 8)
+            with self.assertRaises(ValueError):
+                reader.archive()
+        finally:
+            shutil.rmtree(path)
+
+    def test_archive_clear(self):
+        path = tempfile.mkdtemp()
+        try:
+            gauged = Gauged(self.driver, resolution=1000, block_size=10000,
+                            archive_path=path, archive_after=20000)
+            with gauged.writer as writer:
+                for timestamp in xrange(0, 60000, 5000):
+                    writer.add({'foo': timestamp, 'bar': 1},
+                               timestamp=timestamp)
+            self.assertEqual(gauged.archive(timestamp=65000), {0: 8})
+            reader = Gauged(self.driver, resolution=1000, block_size=10000,
+                            archive_path=path)
+            self.assertEqual(reader.aggregate('foo', Gauged.COUNT), 12)
+            with gauged.writer as writer:
+                writer.clear_key_before('foo', timestamp=20000)
+            self.assertIsNone(gauged.value('foo', timestamp=15000))
+            self.assertEqual(gauged.value('foo', timestamp=25000), 25000)
+            self.assertEqual(gauged.aggregate('foo', Gauged.MEDIAN), 37500)
+            self.assertEqual(reader.aggregate('foo', Gauged.COUNT), 8)
+            self.assertEqual(reader.aggregate('bar', Gauged.COUNT), 12)
+            with gauged.writer as writer:
+                writer.clear_key_after('bar', timestamp=30000)
+            self.assertEqual(reader.aggregate('bar', Gauged.COUNT), 6)
+            self.assertEqual(reader.aggregate('foo', Gauged.COUNT), 8)
+            with gauged.writer as writer:
+                writer.clear_from(20000)
+            self.assertIsNone(gauged.value('foo', timestamp=25000))
+            self.assertEqual(reader.aggregate('bar', Gauged.COUNT), 4)
+            # Cleared offsets are archived again once they're rewritten
+            with gauged.writer as writer:
+                writer.add('foo', 7, timestamp=20000)
+                writer.add('foo', 8, timestamp=30000)
+            self.assertEqual(gauged.archive(timestamp=65000), {0: 2})
+            self.assertIsNone(self.driver.get_block(0, 3, 1)[0])
+            self.assertEqual(reader.value('foo', timestamp=35000), 8)
+            with gauged.writer as writer:
+                writer.clear_key_before('bar')
+                writer.clear_key_after('foo')
+            self.assertIsNone(reader.value('bar', timestamp=15000))
+            self.assertIsNone(reader.value('foo', timestamp=35000))
+        finally:
+            shutil.rmtree(path)
+
     def test_clear_key_before(self):
         gauged = Gauged(self.driver, resolution=1000, block_size=10000)
         with gauged.writer as writer:
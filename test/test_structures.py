@@ -141,6 +141,19 @@ class TestStructures(TestCase):
         self.assertEqual(v.byte_length(), 0)
         v.free()
 
+    def test_map_slice_and_last_before(self):
+        a = FloatArray([1, 2])
+        v = SparseMap(dict((position, a) for position in range(0, 200, 2)))
+        a.free()
+        self.assertEqual(v.last_before(0), None)
+        self.assertEqual(v.last_before(51), 2)
+        s = v.slice(start=101, end=105)
+        self.assertEqual(dict(s.items()), {102: [1, 2], 104: [1, 2]})
+        s.free()
+        v.clear()
+        self.assertEqual(v.last_before(51), None)
+        v.free()
+
     def test_map_buffer_offset(self):
         a = FloatArray([1])
         b = FloatArray([1, 2, 3])